@@ -1,47 +1,64 @@
 from sys import argv
+import argparse
 import time
+from xml.etree.ElementTree import ParseError
 import requests
-from urllib.parse import urlparse
 from protego import Protego
-from bs4 import BeautifulSoup
+from fetcher import get_fetcher
+from robots_registry import get_robots_registry
+from sitemap_stream import iter_sitemap
+from url_frontier import UrlFrontier, is_sitemap_url
 
-HEADERS = {}
 def get_robot_parser(base_url:str)-> Protego:
-    global HEADERS
-    user_agent = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/139.0.0.0 Safari/537.36'
-    HEADERS = {'User-Agent': user_agent}
-    response = requests.get(base_url, headers=HEADERS)
-    robot_parser = Protego.parse(response.text)
-    #print(response.text)
+    robot_parser = get_robots_registry().get(base_url)
     return robot_parser
 
-def parse_sitemaps(sitemaps, crawl_delay):
+def parse_sitemaps(sitemaps, crawl_delay, max_depth=5, max_urls=100000, bloom_capacity=None):
+    """
+    Walks the sitemaps breadth-first and returns every page URL they list.
+    Only sitemap URLs are downloaded; page URLs are collected without fetching them.
+    """
+    frontier = UrlFrontier(max_depth, max_urls, bloom_capacity)
+    for sitemap in sitemaps:
+        frontier.add(sitemap)
     url_list = []
-    sitemap = list(sitemaps)[0]
-    response = requests.get(sitemap, headers=HEADERS)
-    soup = BeautifulSoup(response.text, 'xml')
-    url_list += [tag.text for tag in soup.find_all('loc')]
-    for url in url_list:
+    while frontier:
+        url, depth = frontier.pop()
+        if not is_sitemap_url(url):
+            url_list.append(url)
+            frontier.counters["pages"] += 1
+            continue
         #print(url)
-        response = requests.get(url, headers=HEADERS)
-        robot_parser = Protego.parse(response.text)
-        soup = BeautifulSoup(response.text, 'xml')
-        url_list += [tag.text for tag in soup.find_all('loc')]
-        #print(response.text)
-        #robot_parser = get_robot_parser(url)
-        new_url_list = parse_sitemaps(robot_parser.sitemaps, crawl_delay)
+        time.sleep(crawl_delay)
+        try:
+            response = get_fetcher().get(url, stream=True)
+            response.raise_for_status()
+            for loc, lastmod in iter_sitemap(response):
+                frontier.add(loc, depth + 1)
+            frontier.counters["fetched"] += 1
+        except (requests.RequestException, ParseError) as e:
+            print(f"Error reading sitemap {url}: {e}")
+            frontier.counters["errors"] += 1
+    print(frontier.summary())
     return url_list
 
-
-    #print(url_list)
-    return url_list
-
-def main(domain_name):
+def main(domain_name, max_depth=5, max_urls=100000, bloom_capacity=None):
     robot_parser = get_robot_parser(domain_name)
+    if robot_parser is None:
+        print("Could not download robots.txt")
+        return
     crawl_delay = robot_parser.crawl_delay('*') or 0
-    urls = parse_sitemaps(robot_parser.sitemaps, crawl_delay)
+    urls = parse_sitemaps(robot_parser.sitemaps, crawl_delay, max_depth, max_urls, bloom_capacity)
     print(urls)
     print(len(urls), 'urls')
+    print(get_fetcher().summary())
 
 if __name__ == '__main__':
-    main(argv[1])
+    arg_parser = argparse.ArgumentParser(description="List every page URL found in a site's sitemaps.")
+    arg_parser.add_argument('robots_url')
+    arg_parser.add_argument('--max-depth', type=int, default=5)
+    arg_parser.add_argument('--max-urls', type=int, default=100000)
+    arg_parser.add_argument('--bloom-capacity', type=int, default=None,
+                            help='use a Bloom filter sized for this many URLs as the seen-set')
+    args = arg_parser.parse_args(argv[1:])
+    main(args.robots_url, args.max_depth, args.max_urls, args.bloom_capacity)
@@ -8,9 +8,18 @@
 
 import requests
 from protego import Protego
-from bs4 import BeautifulSoup
+from fetcher import get_fetcher
+from robots_registry import get_robots_registry
 import urllib.robotparser
+import argparse
 import json
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from xml.etree.ElementTree import ParseError
+from sitemap_stream import iter_sitemap
+from recipe_extract import EXTRACTORS, get_extractor
+from jsonl_sink import FSYNC_POLICIES, JsonlSink
+from crawl_state import (CrawlState, DEFAULT_STATE_FILE, content_hash,
+                         load_jsonl_records, write_jsonl_records)
 
 # This function orchestrates the process:
 # 1. Downloads robots.txt from the target URL.
@@ -19,14 +28,15 @@ import json
 # 4. Downloads the sitemap index and gets the first sitemap URL.
 # 5. Parses the first sitemap to get all <loc> URLs.
 def get_sitemap_url_from_robots(target_url):
-    robots_txt = download_robots_txt(target_url)
+    registry = get_robots_registry()
+    robots_txt = registry.robots_text(target_url)
     if not robots_txt:
         print("Could not download robots.txt")
         return None
-    robot_parser = Protego.parse(robots_txt)
-    sitemaps = list(robot_parser.sitemaps)
+    print(robots_txt)
+    sitemaps = registry.sitemaps(target_url)
     if sitemaps:
-        var_sitemap_url = extract_sitemap_index_url(robots_txt)        
+        var_sitemap_url = find_sitemap_index_url(sitemaps)
         print("Sitemap URL found:", var_sitemap_url)
 
         var_the_first_sitemap = download_sitemap_index(var_sitemap_url)
@@ -49,7 +59,11 @@ def extract_sitemap_index_url(robots_txt):
     Returns the URL as a string if found, otherwise None.
     """
     robot_parser = Protego.parse(robots_txt)
-    sitemaps = list(robot_parser.sitemaps)
+    return find_sitemap_index_url(robot_parser.sitemaps)
+
+
+# This function picks the sitemap_index.xml URL out of a list of sitemap URLs.
+def find_sitemap_index_url(sitemaps):
     for sitemap_url in sitemaps:
         if "sitemap_index.xml" in sitemap_url:
             print("sitemap_index.xml URL found:", sitemap_url)
@@ -60,11 +74,8 @@ def extract_sitemap_index_url(robots_txt):
 
 # This function downloads the robots.txt file from the specified URL and prints its contents.
 def download_robots_txt(url="https://ohsnapmacros.com/robots.txt"):
-    headers = {
-        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/139.0.0.0 Safari/537.36"
-    }
     try:
-        response = requests.get(url, headers=headers)
+        response = get_fetcher().get(url)
         response.raise_for_status()
         print(response.content.decode('utf-8'))
         return response.text
@@ -79,18 +90,18 @@ def download_sitemap_index(sitemap_url):
     """
     Downloads the sitemap.xml (or sitemap index) from the given URL and returns a list of sitemap URLs.
     """
-    headers = {
-        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/139.0.0.0 Safari/537.36"
-    }
     try:
-        response = requests.get(sitemap_url, headers=headers)
+        response = get_fetcher().get(sitemap_url, stream=True)
         response.raise_for_status()
-        soup = BeautifulSoup(response.content, "xml")
-        sitemap_tags = soup.find_all("loc")
-        sitemap_list = [tag.text for tag in sitemap_tags]
-        print(f"Found {len(sitemap_list)} sitemap URLs in the download_sitemap_index.")
-        return sitemap_list[0] if sitemap_list else None
-    except requests.RequestException as e:
+        first_sitemap = None
+        count = 0
+        for loc, lastmod in iter_sitemap(response):
+            if first_sitemap is None:
+                first_sitemap = loc
+            count += 1
+        print(f"Found {count} sitemap URLs in the download_sitemap_index.")
+        return first_sitemap
+    except (requests.RequestException, ParseError) as e:
         print(f"Error downloading sitemap index: {e}")
         return []
 
@@ -99,96 +110,61 @@ def download_sitemap_index(sitemap_url):
 
 
 # This function downloads a sitemap XML from the given URL,
-# parses it, and returns a list of all <loc> tag elements found.
-def parse_sitemap_locs(sitemap_url):
+# parses it, and returns a list of (loc, lastmod) pairs for every <url> entry.
+def parse_sitemap_entries(sitemap_url):
     """
-    Downloads the sitemap at the given URL and returns a list of all <loc> URL strings found.
+    Downloads the sitemap at the given URL and returns a list of (loc, lastmod) tuples.
+    lastmod is None when the entry has no <lastmod>.
     """
-    headers = {
-        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/139.0.0.0 Safari/537.36"
-    }
     try:
-        response = requests.get(sitemap_url, headers=headers)
+        response = get_fetcher().get(sitemap_url, stream=True)
         response.raise_for_status()
-        soup = BeautifulSoup(response.content, "xml")        
-        loc_tags = []
-        for url_tag in soup.find_all("url"):
-            loc = url_tag.find("loc")
-            if loc:
-                loc_tags.append(loc.text)
-        print(f"Found {len(loc_tags)} <loc> URLs in the sitemap with parse_sitemap_locs.")
-        return loc_tags
-    except requests.RequestException as e:
+        reader = iter_sitemap(response)
+        entries = []
+        for loc, lastmod in reader:
+            # Only <url> entries hold page locations; a sitemap index has none
+            if reader.kind == "urlset":
+                entries.append((loc, lastmod))
+        print(f"Found {len(entries)} <loc> URLs in the sitemap with parse_sitemap_entries.")
+        return entries
+    except (requests.RequestException, ParseError) as e:
         print(f"Error downloading or parsing sitemap: {e}")
         return []
-    
 
-def extract_recipe_data(page_url):
+
+# This function downloads a sitemap XML from the given URL,
+# parses it, and returns a list of all <loc> tag elements found.
+def parse_sitemap_locs(sitemap_url):
+    """
+    Downloads the sitemap at the given URL and returns a list of all <loc> URL strings found.
+    """
+    return [loc for loc, lastmod in parse_sitemap_entries(sitemap_url)]
+
+
+def extract_recipe_data(page_url, extractor=None):
     """
     Downloads the page and extracts recipe information such as servings, prep time, cook time, ingredients, instructions, notes, and nutrition.
     Returns a dictionary with the extracted data.
     """
-    headers = {
-        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/139.0.0.0 Safari/537.36"
-    }
     try:
-        response = requests.get(page_url, headers=headers)
+        response = get_fetcher().get(page_url)
         response.raise_for_status()
-        soup = BeautifulSoup(response.content, "html.parser")
-        recipe = {}
-
-        # Title (usually in <h1>)
-        recipe['title'] = soup.find('h1').get_text(strip=True) if soup.find('h1') else None
-
-        # Servings
-        servings = soup.find(class_="wprm-recipe-servings")
-        recipe['servings'] = servings.get_text(strip=True) if servings else None
-
-        # Prep time
-        prep_time = soup.find(class_="wprm-recipe-prep-time")
-        recipe['prep_time'] = prep_time.get_text(strip=True) if prep_time else None
-
-        # Cook time
-        cook_time = soup.find(class_="wprm-recipe-cook-time")
-        recipe['cook_time'] = cook_time.get_text(strip=True) if cook_time else None
-
-        # Ingredients
-        ingredients_list = []
-        ingredients_ul = soup.find("ul", class_="wprm-recipe-ingredients")
-        if ingredients_ul:
-            for li in ingredients_ul.find_all("li"):
-                ingredients_list.append(li.get_text(strip=True))
-        recipe['ingredients'] = ingredients_list
-
-        # Instructions
-        instructions_list = []
-        instructions_ul = soup.find("ul", class_="wprm-recipe-instructions")
-        if instructions_ul:
-            for li in instructions_ul.find_all("li"):
-                instructions_list.append(li.get_text(strip=True))
-        recipe['instructions'] = instructions_list
-
-        # Notes
-        notes_div = soup.find("div", class_="wprm-recipe-notes")
-        notes = []
-        if notes_div:
-            for li in notes_div.find_all("li"):
-                notes.append(li.get_text(strip=True))
-            # If notes are not in <li>, get the text directly
-            if not notes and notes_div.get_text(strip=True):
-                notes.append(notes_div.get_text(strip=True))
-        recipe['notes'] = notes
-
-        # Nutrition
-        nutrition_div = soup.find("div", class_="wprm-recipe-nutrition")
-        recipe['nutrition'] = nutrition_div.get_text(strip=True) if nutrition_div else None
-
-        return recipe
+        return parse_recipe_html(response.content, extractor)
     except Exception as e:
         print(f"Error extracting recipe from {page_url}: {e}")
         return {}
 
 
+# This function does the CPU side of extract_recipe_data: it parses the page HTML
+# and pulls out the recipe fields. It does no network I/O, so it can run in a worker process.
+def parse_recipe_html(html, extractor=None):
+    """
+    Extracts the recipe fields from the page HTML (bytes or str) and returns them as a dictionary.
+    `extractor` picks the engine from recipe_extract ("lxml" or "bs4"); the default is the fastest installed one.
+    """
+    return get_extractor(extractor).extract(html)
+
+
 def print_recipe(recipe):
     print("\n--- Recipe ---")
     print(f"Title: {recipe.get('title', 'N/A')}")
@@ -208,20 +184,132 @@ def print_recipe(recipe):
     print("--- End Recipe ---\n")
 
 
+# This function only re-extracts pages that are new or whose sitemap lastmod changed,
+# and rewrites the JSON lines file with changed records replaced in place.
+def incremental_crawl(entries, json_lines_file, state_file=DEFAULT_STATE_FILE, extractor=None):
+    state = CrawlState(state_file)
+    records = load_jsonl_records(json_lines_file)
+    fetched = changed = 0
+    for url, lastmod in entries:
+        if url in records and not state.needs_fetch(url, lastmod):
+            continue
+        print(f"\nExtracting recipe from: {url}")
+        recipe_data = extract_recipe_data(url, extractor)
+        fetched += 1
+        if not recipe_data:
+            # Extraction failed; leave the old record and try again next run
+            continue
+        recipe_data["url"] = url
+        if state.update(url, lastmod, content_hash(recipe_data)) or url not in records:
+            records[url] = recipe_data
+            changed += 1
+            print_recipe(recipe_data)
+    write_jsonl_records(json_lines_file, records.values())
+    state.save()
+    print(f"Incremental crawl: {len(entries)} URLs in sitemap, {fetched} fetched, {changed} new or changed.")
+
+
+# These two functions are the stages of parallel_crawl. fetch_page runs on the
+# I/O thread pool and parse_page on the CPU process pool; both return
+# (kind, url, payload) so the main loop can tell their results apart.
+# Any error is returned as ("error", url, message), so one bad URL is logged
+# and skipped instead of stopping the crawl.
+def fetch_page(url):
+    try:
+        response = get_fetcher().get(url)
+        response.raise_for_status()
+        return "page", url, response.content
+    except Exception as e:
+        return "error", url, str(e)
+
+
+def parse_page(url, html, extractor=None):
+    try:
+        recipe_data = parse_recipe_html(html, extractor)
+    except Exception as e:
+        return "error", url, str(e)
+    recipe_data["url"] = url
+    return "recipe", url, recipe_data
+
+
+# This function downloads pages on a thread pool and parses them on a process pool,
+# so network waits and HTML parsing overlap. Records are written to the
+# JsonlSink in the order they finish, each with its source URL.
+def parallel_crawl(urls, sink, io_workers=8, cpu_workers=None, extractor=None):
+    crawl_delay = get_robots_registry().crawl_delay(urls[0]) if urls else None
+    if crawl_delay:
+        get_fetcher().set_crawl_delay(urls[0], crawl_delay)
+    written = errors = 0
+    with ThreadPoolExecutor(max_workers=io_workers) as io_pool, \
+            ProcessPoolExecutor(max_workers=cpu_workers) as cpu_pool:
+        # future -> url, to report failures the stage itself could not catch
+        # (e.g. a parser process that died)
+        pending = {io_pool.submit(fetch_page, url): url for url in urls}
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                try:
+                    kind, url, payload = future.result()
+                except Exception as e:
+                    kind, url, payload = "error", pending[future], f"{type(e).__name__}: {e}"
+                del pending[future]
+                if kind == "page":
+                    pending[cpu_pool.submit(parse_page, url, payload, extractor)] = url
+                elif kind == "recipe":
+                    sink.write(payload)
+                    written += 1
+                    print(f"[{written}/{len(urls)}] {url}")
+                else:
+                    errors += 1
+                    print(f"Error extracting recipe from {url}: {payload}")
+    print(f"Parallel crawl: {written} recipes written, {errors} errors.")
+
+
 if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Scrape recipes from ohsnapmacros.com into a JSON lines file.")
+    mode = arg_parser.add_mutually_exclusive_group()
+    mode.add_argument("--incremental", action="store_true",
+                      help="only fetch URLs that are new or changed since the last run")
+    mode.add_argument("--parallel", action="store_true",
+                      help="fetch pages on a thread pool and parse them on a process pool")
+    arg_parser.add_argument("--io-workers", type=int, default=8)
+    arg_parser.add_argument("--cpu-workers", type=int, default=None,
+                            help="parser processes (default: one per core)")
+    arg_parser.add_argument("--extractor", choices=sorted(EXTRACTORS), default=None,
+                            help="HTML extraction engine (default: lxml if installed)")
+    arg_parser.add_argument("--state-file", default=DEFAULT_STATE_FILE)
+    arg_parser.add_argument("--limit", type=int, default=100)
+    arg_parser.add_argument("--flush-every", type=int, default=50,
+                            help="records to buffer before writing them to the output file")
+    arg_parser.add_argument("--fsync", choices=FSYNC_POLICIES, default="close",
+                            help="when to fsync the output file")
+    args = arg_parser.parse_args()
+
     json_lines_file = "recipes.jsonl"
     sitemap_index_url = get_sitemap_url_from_robots(target_url="https://ohsnapmacros.com/robots.txt")
     if sitemap_index_url:
         post_sitemap_url = download_sitemap_index(sitemap_index_url)
-        if post_sitemap_url:
+        if post_sitemap_url and args.incremental:
+            entries = parse_sitemap_entries(post_sitemap_url)
+            incremental_crawl(entries[:args.limit], json_lines_file, args.state_file, args.extractor)
+        elif post_sitemap_url:
             loc_list = parse_sitemap_locs(post_sitemap_url)
-            for url in loc_list[:100]:
-                print(f"\nExtracting recipe from: {url}")
-                recipe_data = extract_recipe_data(url)
-                # Add the URL to the recipe data
-                recipe_data["url"] = url
-                # Add more keys if needed for at least 10 attributes
-                json_line = json.dumps(recipe_data)
-                with open(json_lines_file, 'a', encoding='utf-8') as fp:
-                    fp.write(json_line + '\n')
-                print_recipe(recipe_data)
\ No newline at end of file
+            with JsonlSink(json_lines_file, flush_every=args.flush_every, fsync=args.fsync) as sink:
+                # Resume: URLs already in the output file are not fetched again
+                todo = [url for url in loc_list[:args.limit] if url not in sink]
+                print(f"{len(loc_list[:args.limit]) - len(todo)} URLs already in {json_lines_file}, {len(todo)} to go.")
+                if args.parallel:
+                    parallel_crawl(todo, sink, args.io_workers, args.cpu_workers, args.extractor)
+                else:
+                    for url in todo:
+                        print(f"\nExtracting recipe from: {url}")
+                        recipe_data = extract_recipe_data(url, args.extractor)
+                        if not recipe_data:
+                            # Not written, so the next run retries it
+                            continue
+                        # Add the URL to the recipe data
+                        recipe_data["url"] = url
+                        # Add more keys if needed for at least 10 attributes
+                        sink.write(recipe_data)
+                        print_recipe(recipe_data)
+    print(get_fetcher().summary())
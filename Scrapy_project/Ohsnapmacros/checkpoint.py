@@ -0,0 +1,233 @@
+"""Periodic checkpoints of a JOBDIR crawl, so it can resume after a hard kill.
+
+With JOBDIR set, Scrapy keeps pending requests in disk queues and the seen
+request fingerprints in ``requests.seen``, but only writes a consistent
+snapshot of them when the crawl shuts down cleanly: the queue positions are
+saved on close and the fingerprint file is buffered. `CrawlCheckpoint`
+writes that snapshot every CHECKPOINT_INTERVAL seconds:
+
+- flushes ``requests.seen`` and notes its length,
+- saves each disk queue's positions (``info.json``) and head chunk size,
+  plus the scheduler's ``active.json``,
+- records the requests taken from the queue but not finished yet, so they
+  are scheduled again after a resume,
+- flushes the item pipelines that have a ``checkpoint()`` method and keeps
+  what they return (output part, byte offset, items written),
+
+all into ``JOBDIR/checkpoint.json``, written atomically. After a kill,
+`restore_checkpoint` (run by ``run_spider.py --resume`` before the crawler
+starts) cuts ``requests.seen`` and the queue chunks back to the checkpoint,
+so every request is either still queued, in flight at the checkpoint (and
+re-sent when the spider opens), or was fetched before it. Output
+written after the checkpoint is kept; the pipelines skip the URLs already in
+it, so the requests fetched again do not add lines.
+
+Only FIFO disk queues can be rolled back this way (a LIFO queue truncates
+its file on every pop), so run_spider.py sets SCHEDULER_DISK_QUEUE to
+PickleFifoDiskQueue for resumable jobs.
+"""
+import json
+import logging
+import os
+import pickle
+import time
+from typing import Dict, List, Optional, Tuple
+
+from scrapy import signals
+from scrapy.exceptions import NotConfigured
+from scrapy.utils.request import request_from_dict
+from twisted.internet import task
+
+
+logger = logging.getLogger(__name__)
+
+CHECKPOINT_FILE = 'checkpoint.json'
+IN_PROGRESS_FILE = 'in_progress.pickle'
+DEFAULT_INTERVAL = 60.0
+
+
+def read_checkpoint(jobdir: str) -> Optional[Dict]:
+    path = os.path.join(jobdir, CHECKPOINT_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding='utf-8') as fp:
+        return json.load(fp)
+
+
+def write_checkpoint(jobdir: str, state: Dict) -> None:
+    path = os.path.join(jobdir, CHECKPOINT_FILE)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as fp:
+        json.dump(state, fp, indent=2)
+        fp.flush()
+        os.fsync(fp.fileno())
+    os.replace(tmp_path, path)
+
+
+def _write_pickle(path: str, obj) -> None:
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as fp:
+        pickle.dump(obj, fp, protocol=4)
+    os.replace(tmp_path, path)
+
+
+def _truncate(path: str, size: int) -> bool:
+    if os.path.exists(path) and os.path.getsize(path) > size:
+        with open(path, 'r+b') as fp:
+            fp.truncate(size)
+        return True
+    return False
+
+
+def restore_checkpoint(jobdir: str) -> Optional[Dict]:
+    """Roll JOBDIR back to its last checkpoint if the crawl did not shut down cleanly.
+
+    Returns the checkpoint, or None if there is nothing to restore.
+    """
+    state = read_checkpoint(jobdir)
+    if state is None or state.get('clean'):
+        return state
+    seen_path = os.path.join(jobdir, 'requests.seen')
+    if _truncate(seen_path, state['requests_seen_bytes']):
+        logger.info('Dropped request fingerprints added after the last checkpoint')
+    for queue in state['queues']:
+        info = queue['info']
+        if not os.path.isdir(queue['path']):
+            logger.warning('Queue %s was removed after the last checkpoint; its requests are lost', queue['path'])
+            continue
+        _truncate(os.path.join(queue['path'], f"q{info['head'][0]:05d}"), queue['head_bytes'])
+        if not os.path.exists(os.path.join(queue['path'], f"q{info['tail'][0]:05d}")):
+            # The tail chunk was fully consumed (and deleted) after the checkpoint
+            logger.warning('Queue %s moved past its checkpointed chunk; resuming from the next one',
+                           queue['path'])
+            info = dict(info, tail=[info['tail'][0] + 1, 0, 0])
+            info['size'] = max(0, (info['head'][0] - info['tail'][0]) * info['chunksize'] + info['head'][1])
+        with open(os.path.join(queue['path'], 'info.json'), 'w', encoding='utf-8') as fp:
+            json.dump(info, fp)
+    if state['active'] is not None:
+        with open(os.path.join(jobdir, 'requests.queue', 'active.json'), 'w', encoding='utf-8') as fp:
+            json.dump(state['active'], fp)
+    for name, offsets in state['pipelines'].items():
+        path, offset = offsets.get('path'), offsets.get('offset')
+        if path and offset is not None and os.path.exists(path) and os.path.getsize(path) < offset:
+            logger.warning('%s is shorter than at the last checkpoint (%d < %d bytes)',
+                           path, os.path.getsize(path), offset)
+    return state
+
+
+class CrawlCheckpoint:
+    """Extension that checkpoints the JOBDIR state every CHECKPOINT_INTERVAL seconds."""
+
+    def __init__(self, crawler, jobdir: str, interval: float):
+        self.crawler = crawler
+        self.jobdir = jobdir
+        self.interval = interval
+        self.checkpoints = 0
+        self.task: Optional[task.LoopingCall] = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        jobdir = crawler.settings.get('JOBDIR')
+        if not jobdir:
+            raise NotConfigured('CrawlCheckpoint needs JOBDIR')
+        ext = cls(crawler, jobdir, crawler.settings.getfloat('CHECKPOINT_INTERVAL', DEFAULT_INTERVAL))
+        crawler.signals.connect(ext.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(ext.spider_closed, signal=signals.spider_closed)
+        return ext
+
+    def spider_opened(self, spider):
+        state = read_checkpoint(self.jobdir)
+        path = os.path.join(self.jobdir, IN_PROGRESS_FILE)
+        if state and not state.get('clean') and os.path.exists(path):
+            with open(path, 'rb') as fp:
+                in_progress = pickle.load(fp)
+            for data in in_progress:
+                request = request_from_dict(data, spider=spider)
+                self.crawler.engine.crawl(request.replace(dont_filter=True))
+            if in_progress:
+                logger.info('Rescheduled %d requests that were in flight at the last checkpoint',
+                            len(in_progress))
+        self.task = task.LoopingCall(self.checkpoint)
+        self.task.start(self.interval, now=False)
+
+    def spider_closed(self, spider, reason):
+        if self.task is not None and self.task.running:
+            self.task.stop()
+        # The scheduler has already saved its queues; only mark the job as cleanly stopped
+        state = read_checkpoint(self.jobdir) or {}
+        state.update(clean=True, reason=reason, time=time.time())
+        write_checkpoint(self.jobdir, state)
+
+    def _engine_slot(self):
+        engine = self.crawler.engine
+        return getattr(engine, '_slot', None) or getattr(engine, 'slot', None)
+
+    @staticmethod
+    def _priorities(pq) -> List[int]:
+        return sorted(set(getattr(pq, 'queues', {})) | set(getattr(pq, '_start_queues', {})))
+
+    def _disk_queues(self, dqs) -> Tuple[List, object]:
+        """The FIFO disk queues behind the scheduler's priority queue, and its active.json state."""
+        if hasattr(dqs, 'pqueues'):
+            # DownloaderAwarePriorityQueue: one ScrapyPriorityQueue per download slot
+            pqs = list(dqs.pqueues.values())
+            active = {slot: self._priorities(pq) for slot, pq in dqs.pqueues.items()}
+        else:
+            pqs = [dqs]
+            active = self._priorities(dqs)
+        queues = []
+        for pq in pqs:
+            for attr in ('queues', '_start_queues'):
+                queues.extend(getattr(pq, attr, {}).values())
+        return [q for q in queues if hasattr(q, 'info') and hasattr(q, '_saveinfo')], active
+
+    def checkpoint(self) -> None:
+        slot = self._engine_slot()
+        if slot is None:
+            return
+        scheduler = slot.scheduler
+        state = {'clean': False, 'time': time.time(), 'pipelines': {}, 'queues': [], 'active': None,
+                 'in_progress': 0}
+
+        # Pipelines first: an item on disk is never newer than the requests that led to it.
+        # Last pipeline first, so the writer has flushed before DedupPipeline commits
+        # the fingerprints of what it wrote
+        for pipe in reversed(self.crawler.engine.scraper.itemproc.middlewares):
+            if hasattr(pipe, 'checkpoint'):
+                state['pipelines'][type(pipe).__name__] = pipe.checkpoint()
+
+        df = scheduler.df
+        if hasattr(df, 'checkpoint'):
+            df.checkpoint()
+        if getattr(df, 'file', None) is not None:
+            df.file.flush()
+            os.fsync(df.file.fileno())
+            state['requests_seen_bytes'] = df.file.tell()
+        else:
+            state['requests_seen_bytes'] = 0
+
+        dqs = getattr(scheduler, 'dqs', None)
+        if dqs is not None:
+            queues, state['active'] = self._disk_queues(dqs)
+            for q in queues:
+                q._saveinfo(q.info)
+                state['queues'].append({'path': q.path, 'info': dict(q.info),
+                                        'head_bytes': os.path.getsize(q.headf.name)})
+            if not queues and len(dqs):
+                logger.warning('CrawlCheckpoint cannot save the positions of %s queues', type(dqs).__name__)
+
+        in_progress = []
+        for request in getattr(slot, 'inprogress', ()):
+            try:
+                in_progress.append(request.to_dict(spider=self.crawler.spider))
+            except ValueError:
+                # Callbacks that are not spider methods cannot be serialized
+                self.crawler.stats.inc_value('checkpoint/unserializable_requests')
+        # Request dicts hold bytes, so they are pickled next to the JSON checkpoint
+        _write_pickle(os.path.join(self.jobdir, IN_PROGRESS_FILE), in_progress)
+        state['in_progress'] = len(in_progress)
+
+        write_checkpoint(self.jobdir, state)
+        self.checkpoints += 1
+        self.crawler.stats.set_value('checkpoint/count', self.checkpoints)
+        self.crawler.stats.set_value('checkpoint/pending_requests', len(scheduler))
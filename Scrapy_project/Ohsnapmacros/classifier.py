@@ -0,0 +1,126 @@
+"""Pre-fetch recipe/non-recipe URL classifier.
+
+Scores a URL between 0 and 1 for how likely it is to be a recipe page, before
+any request is made, from three signals:
+
+- the URL itself: structural paths (/category/, /shop, ...) and slug words
+  ("haul", "guide" vs. "chicken", "muffins"),
+- whether the URL was listed in a post sitemap,
+- history: earlier output files (recipes.jl, recipes_valid.jl) tell us which
+  URLs turned out to be recipes, and a naive Bayes model over slug tokens
+  generalizes that to URLs we have not seen.
+
+The spider skips URLs below RECIPE_CLASSIFIER_MIN_SCORE and uses the score as
+the request priority, so likely recipes are fetched first.
+"""
+import json
+import math
+import os
+import re
+from collections import defaultdict
+from typing import Dict, Iterable, Set
+from urllib.parse import urlsplit
+
+from .urlstore import canonicalize_url
+
+
+# Whole path segments, so /shopska-salad/ and /production-notes/ are not caught
+NON_RECIPE_PATHS = re.compile(
+    r'/(?:category|tag|page|author|shop|product|product-category|cart|checkout|my-account|feed|'
+    r'about|about-me|contact|privacy|privacy-policy|terms|terms-of-service|terms-and-conditions)(?:/|$)'
+    r'|/wp-'
+)
+NEGATIVE_WORDS = {'haul', 'guide', 'tracking', 'basics', 'tips', 'review', 'gift', 'gifts', 'shop',
+                  'podcast', 'calculator', 'challenge', 'faq', 'vs', 'how', 'what', 'why', 'best'}
+POSITIVE_WORDS = {'recipe', 'recipes', 'chicken', 'beef', 'turkey', 'salmon', 'shrimp', 'egg', 'eggs',
+                  'protein', 'muffins', 'cookies', 'cookie', 'pancakes', 'waffles', 'bake', 'baked',
+                  'bowl', 'bowls', 'salad', 'soup', 'dip', 'pizza', 'tacos', 'pasta', 'casserole',
+                  'bars', 'bites', 'brownies', 'cake', 'cheesecake', 'oats', 'smoothie', 'sliders'}
+KEYWORD_WEIGHT = 1.0
+SITEMAP_WEIGHT = 1.0
+TOKEN_RE = re.compile(r'[a-z0-9]+')
+
+
+def url_tokens(url: str) -> Set[str]:
+    """Words of the URL path, e.g. /high-protein-dill-dip/ -> {'high', 'protein', 'dill', 'dip'}."""
+    return set(TOKEN_RE.findall(urlsplit(url).path.lower()))
+
+
+def is_recipe_record(record: Dict) -> bool:
+    return bool(record.get('ingredients') or record.get('instructions'))
+
+
+class RecipeUrlClassifier:
+    """Scores URLs for how likely they are to be recipe pages."""
+
+    def __init__(self):
+        self.known: Dict[str, bool] = {}
+        self.sitemap_urls: Set[str] = set()
+        # token -> [recipe pages containing it, non-recipe pages containing it]
+        self.token_counts = defaultdict(lambda: [0, 0])
+        self.page_counts = [0, 0]
+
+    @classmethod
+    def from_settings(cls, settings) -> 'RecipeUrlClassifier':
+        classifier = cls()
+        for path in settings.getlist('RECIPE_CLASSIFIER_HISTORY', ['recipes.jl', 'recipes_valid.jl']):
+            if os.path.exists(path):
+                classifier.learn_from_file(path)
+        return classifier
+
+    def learn_from_file(self, path: str) -> int:
+        """Learn from a JSON lines output file; returns the number of records read."""
+        count = 0
+        with open(path, encoding='utf-8') as fp:
+            for line in fp:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                if record.get('url'):
+                    self.learn(record['url'], is_recipe_record(record))
+                    count += 1
+        return count
+
+    def learn(self, url: str, is_recipe: bool) -> None:
+        url = canonicalize_url(url)
+        previous = self.known.get(url)
+        if previous is not None:
+            if previous == is_recipe:
+                return
+            self._count(url, previous, -1)
+        self.known[url] = is_recipe
+        self._count(url, is_recipe, 1)
+
+    def _count(self, url: str, is_recipe: bool, delta: int) -> None:
+        column = 0 if is_recipe else 1
+        self.page_counts[column] += delta
+        for token in url_tokens(url):
+            self.token_counts[token][column] += delta
+
+    def add_sitemap_urls(self, urls: Iterable[str]) -> None:
+        self.sitemap_urls.update(canonicalize_url(url) for url in urls)
+
+    def score(self, url: str) -> float:
+        url = canonicalize_url(url)
+        if url in self.known:
+            return 0.95 if self.known[url] else 0.05
+        path = urlsplit(url).path.lower()
+        if path == '/' or NON_RECIPE_PATHS.search(path):
+            return 0.0
+
+        recipes, others = self.page_counts
+        log_odds = math.log((recipes + 1) / (others + 1))
+        tokens = url_tokens(url)
+        for token in tokens:
+            counts = self.token_counts.get(token)
+            if counts:
+                # Laplace-smoothed naive Bayes likelihood ratio
+                log_odds += math.log(((counts[0] + 1) / (recipes + 2)) / ((counts[1] + 1) / (others + 2)))
+        log_odds += KEYWORD_WEIGHT * (len(tokens & POSITIVE_WORDS) - len(tokens & NEGATIVE_WORDS))
+        if url in self.sitemap_urls:
+            log_odds += SITEMAP_WEIGHT
+        return 1 / (1 + math.exp(-max(-30.0, min(30.0, log_odds))))
@@ -0,0 +1,196 @@
+"""Exact and near-duplicate detection for recipe items across crawl runs.
+
+Every stored item gets two fingerprints in an SQLite file:
+
+- a content hash over the normalized recipe fields (not the URL or crawl
+  metadata), so the same recipe under another URL, or an unchanged page
+  fetched again, is recognized exactly;
+- a 64-bit simhash over word shingles of the ingredients and instructions,
+  so lightly edited copies are recognized too.
+
+Near-duplicate lookups use locality-sensitive hashing: the simhash is cut
+into `DEFAULT_BANDS` bands and only items sharing bands exactly are compared.
+Two hashes within d bits differ in at most d bands, so with 8 bands and the
+default distance of 4 a candidate must share at least 4 of them; an unrelated
+recipe almost never does. The band match, the Hamming distance and the
+ordering all run in one SQLite query, and at most `DEFAULT_MAX_CANDIDATES`
+band matches are compared, so a lookup stays cheap as the store grows.
+
+On recipe-sized texts, adding, dropping or rewording one ingredient moves the
+simhash by 1-4 bits. Unrelated recipes, even ones with the same
+instructions, are 10 or more bits apart.
+"""
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+
+CONTENT_FIELDS = ('title', 'servings', 'prep_time', 'cook_time', 'total_time',
+                  'ingredients', 'instructions', 'nutrition')
+SIMHASH_FIELDS = ('ingredients', 'instructions')
+DEFAULT_STORE_PATH = 'dedup.sqlite3'
+DEFAULT_BANDS = 8
+DEFAULT_MAX_DISTANCE = 4
+DEFAULT_MAX_CANDIDATES = 256
+SHINGLE_SIZE = 2
+WORD_RE = re.compile(r'[a-z0-9]+')
+
+
+def normalize_text(value) -> str:
+    """Lower-cased words separated by single spaces; lists are joined line by line."""
+    if value is None:
+        return ''
+    if isinstance(value, (list, tuple)):
+        return '\n'.join(normalize_text(v) for v in value)
+    return ' '.join(WORD_RE.findall(str(value).lower()))
+
+
+def content_hash(item: Dict) -> str:
+    normalized = {field: normalize_text(item.get(field)) for field in CONTENT_FIELDS}
+    return hashlib.sha1(json.dumps(normalized, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def shingles(words: List[str], size: int = SHINGLE_SIZE) -> Iterable[str]:
+    if len(words) <= size:
+        if words:
+            yield ' '.join(words)
+        return
+    for i in range(len(words) - size + 1):
+        yield ' '.join(words[i:i + size])
+
+
+def simhash(item: Dict) -> Optional[int]:
+    """64-bit simhash of the ingredient and instruction shingles, or None if both are empty."""
+    words = []
+    for field in SIMHASH_FIELDS:
+        words.extend(normalize_text(item.get(field)).split())
+    if not words:
+        return None
+    weights = [0] * 64
+    for shingle in shingles(words):
+        h = int.from_bytes(hashlib.blake2b(shingle.encode('utf-8'), digest_size=8).digest(), 'little')
+        for bit in range(64):
+            weights[bit] += 1 if h >> bit & 1 else -1
+    return sum(1 << bit for bit in range(64) if weights[bit] > 0)
+
+
+def hamming(a: int, b: int) -> int:
+    return bin(a ^ b).count('1')
+
+
+def _sql_hamming(a: Optional[int], b: int) -> Optional[int]:
+    # Works on the signed values SQLite stores
+    return None if a is None else bin((a ^ b) & 0xFFFFFFFFFFFFFFFF).count('1')
+
+
+def _signed(value: int) -> int:
+    # SQLite integers are signed 64-bit
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+
+def _unsigned(value: int) -> int:
+    return value + (1 << 64) if value < 0 else value
+
+
+class DedupStore:
+    """SQLite index of content hashes and simhash bands, keyed by URL.
+
+    put() commits every commit_every items; 0 leaves committing to the caller.
+    find_near() compares at most max_candidates band matches.
+    """
+
+    def __init__(self, path: str = DEFAULT_STORE_PATH, bands: int = DEFAULT_BANDS, commit_every: int = 100,
+                 max_candidates: int = DEFAULT_MAX_CANDIDATES):
+        if 64 % bands:
+            raise ValueError(f'bands must divide 64, not {bands}')
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.bands = bands
+        self.band_bits = 64 // bands
+        self.max_candidates = max_candidates
+        self.conn = sqlite3.connect(path)
+        self.conn.create_function('hamming', 2, _sql_hamming, deterministic=True)
+        self.conn.executescript(
+            'CREATE TABLE IF NOT EXISTS items ('
+            ' url TEXT PRIMARY KEY, content_hash TEXT NOT NULL, simhash INTEGER, seen_at REAL NOT NULL);'
+            'CREATE INDEX IF NOT EXISTS items_content_hash ON items (content_hash);'
+            'CREATE TABLE IF NOT EXISTS bands ('
+            ' band INTEGER NOT NULL, value INTEGER NOT NULL, url TEXT NOT NULL);'
+            'CREATE INDEX IF NOT EXISTS bands_lookup ON bands (band, value);'
+            'CREATE INDEX IF NOT EXISTS bands_url ON bands (url);'
+        )
+        self.commit_every = commit_every
+        self._uncommitted = 0
+
+    def _band_values(self, h: int) -> List[Tuple[int, int]]:
+        mask = (1 << self.band_bits) - 1
+        return [(band, h >> (band * self.band_bits) & mask) for band in range(self.bands)]
+
+    def get(self, url: str) -> Optional[str]:
+        """The stored content hash for url, or None."""
+        row = self.conn.execute('SELECT content_hash FROM items WHERE url = ?', (url,)).fetchone()
+        return row[0] if row else None
+
+    def find_exact(self, digest: str, exclude_url: str) -> Optional[str]:
+        row = self.conn.execute('SELECT url FROM items WHERE content_hash = ? AND url != ? LIMIT 1',
+                                (digest, exclude_url)).fetchone()
+        return row[0] if row else None
+
+    def find_near(self, h: int, exclude_url: str, max_distance: int) -> Optional[Tuple[str, int]]:
+        """The closest stored URL within max_distance bits of h, as (url, distance)."""
+        band_values = self._band_values(h)
+        where = ' OR '.join('(band = ? AND value = ?)' for _ in band_values)
+        params = [x for pair in band_values for x in pair]
+        # Hashes within max_distance bits differ in at most max_distance bands
+        min_bands = max(1, self.bands - max_distance)
+        row = self.conn.execute(
+            f'SELECT i.url, hamming(i.simhash, ?) AS distance FROM items i JOIN ('
+            f' SELECT url FROM bands WHERE ({where}) AND url != ?'
+            f' GROUP BY url HAVING COUNT(*) >= ? LIMIT ?'
+            f') c ON c.url = i.url WHERE distance <= ? ORDER BY distance, i.url LIMIT 1',
+            [_signed(h)] + params + [exclude_url, min_bands, self.max_candidates, max_distance]).fetchone()
+        return (row[0], row[1]) if row else None
+
+    def put(self, url: str, digest: str, h: Optional[int]) -> None:
+        self.conn.execute('INSERT OR REPLACE INTO items (url, content_hash, simhash, seen_at) VALUES (?, ?, ?, ?)',
+                          (url, digest, None if h is None else _signed(h), time.time()))
+        self.conn.execute('DELETE FROM bands WHERE url = ?', (url,))
+        if h is not None:
+            self.conn.executemany('INSERT INTO bands (band, value, url) VALUES (?, ?, ?)',
+                                  [(band, value, url) for band, value in self._band_values(h)])
+        self._uncommitted += 1
+        if self.commit_every and self._uncommitted >= self.commit_every:
+            self.commit()
+
+    def count(self) -> int:
+        return self.conn.execute('SELECT COUNT(*) FROM items').fetchone()[0]
+
+    def clear(self) -> None:
+        """Forget every stored item."""
+        self.conn.execute('DELETE FROM items')
+        self.conn.execute('DELETE FROM bands')
+        self.commit()
+
+    def retain(self, urls: Iterable[str]) -> int:
+        """Forget every item whose URL is not in urls; returns how many were forgotten."""
+        self.conn.execute('CREATE TEMP TABLE IF NOT EXISTS retain_urls (url TEXT PRIMARY KEY)')
+        self.conn.execute('DELETE FROM retain_urls')
+        self.conn.executemany('INSERT OR IGNORE INTO retain_urls (url) VALUES (?)', ((url,) for url in urls))
+        removed = self.conn.execute('DELETE FROM items WHERE url NOT IN (SELECT url FROM retain_urls)').rowcount
+        self.conn.execute('DELETE FROM bands WHERE url NOT IN (SELECT url FROM retain_urls)')
+        self.conn.execute('DELETE FROM retain_urls')
+        self.commit()
+        return removed
+
+    def commit(self) -> None:
+        self.conn.commit()
+        self._uncommitted = 0
+
+    def close(self) -> None:
+        self.commit()
+        self.conn.close()
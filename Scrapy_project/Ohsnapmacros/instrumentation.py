@@ -0,0 +1,401 @@
+"""Crawl instrumentation: where does the time go?
+
+With METRICS_ENABLED on, `CrawlMetrics` (an extension) and
+`CallbackTimingMiddleware` (a spider middleware) record into one
+`MetricsRegistry` per crawler:
+
+- download latency histogram (request.meta['download_latency']),
+- one histogram per spider callback (parse, parse_recipe, ...), counting
+  only the time spent inside the callback's own code,
+- how long items take to get through the item pipelines, from the callback
+  yielding them to the item_scraped / item_dropped / item_error signal,
+- one histogram per item pipeline class, from its own process_item
+  (pipelines opt in with the `timed_process_item` decorator),
+- bytes received, responses by status, items scraped and items per second,
+- dropped items by reason and by pipeline, pipeline errors, callback errors.
+
+The registry is written to METRICS_SNAPSHOT_PATH every
+METRICS_SNAPSHOT_INTERVAL seconds and served in Prometheus text format at
+http://127.0.0.1:METRICS_PORT/metrics (METRICS_PORT = 0 turns that off).
+With METRICS_ENABLED off both components raise NotConfigured, so nothing is
+connected and the crawl pays nothing.
+"""
+import bisect
+import functools
+import json
+import logging
+import os
+import re
+import time
+import weakref
+from collections import Counter, defaultdict
+from typing import Dict, Optional, Sequence
+
+from itemadapter import is_item
+from scrapy import signals
+from scrapy.exceptions import DropItem, NotConfigured
+from twisted.internet import task
+from twisted.web.resource import Resource
+from twisted.web.server import Site
+
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds in seconds, from a cached response to a very slow server
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+DEFAULT_SNAPSHOT_PATH = 'crawl_metrics.json'
+DEFAULT_SNAPSHOT_INTERVAL = 30.0
+DEFAULT_PORT = 9410
+
+
+class Histogram:
+    """Cumulative-bucket latency histogram, as in Prometheus."""
+
+    def __init__(self, buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Upper bound of the bucket holding the q-quantile (None above the last bucket)."""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for bound, n in zip(self.buckets, self.counts):
+            seen += n
+            if seen >= rank:
+                return bound
+        return None
+
+    def to_dict(self) -> Dict:
+        return {
+            'count': self.count,
+            'sum': round(self.sum, 6),
+            'mean': round(self.sum / self.count, 6) if self.count else None,
+            'p50': self.quantile(0.5),
+            'p90': self.quantile(0.9),
+            'p99': self.quantile(0.99),
+        }
+
+
+def drop_reason(exception: BaseException) -> str:
+    """Group DropItem messages: the text before the first ':' with numbers replaced."""
+    message = str(exception).split(':', 1)[0].strip() or type(exception).__name__
+    return re.sub(r'\d+', 'N', message)
+
+
+class MetricsRegistry:
+    """All metrics of one crawl."""
+
+    _instances: 'weakref.WeakKeyDictionary' = weakref.WeakKeyDictionary()
+
+    def __init__(self):
+        self.started = time.time()
+        self.download = Histogram()
+        self.callbacks: Dict[str, Histogram] = defaultdict(Histogram)
+        self.item_pipelines = Histogram()
+        self.pipelines: Dict[str, Histogram] = defaultdict(Histogram)
+        self.pipeline_drops: Counter = Counter()
+        self.bytes_in = 0
+        self.responses: Counter = Counter()
+        self.items = 0
+        self.drops: Counter = Counter()
+        self.item_errors = 0
+        self.callback_errors: Counter = Counter()
+        # id(item) -> perf_counter() when its callback yielded it
+        self._item_starts: Dict[int, float] = {}
+        self._last_items = 0
+        self._last_time = self.started
+
+    @classmethod
+    def for_crawler(cls, crawler) -> 'MetricsRegistry':
+        if crawler not in cls._instances:
+            cls._instances[crawler] = cls()
+        return cls._instances[crawler]
+
+    @classmethod
+    def enabled_for(cls, crawler) -> Optional['MetricsRegistry']:
+        """The crawler's registry with METRICS_ENABLED on, else None."""
+        if not crawler.settings.getbool('METRICS_ENABLED'):
+            return None
+        return cls.for_crawler(crawler)
+
+    def item_started(self, item) -> None:
+        self._item_starts[id(item)] = time.perf_counter()
+
+    def item_finished(self, item) -> None:
+        """Record the item's time in the pipelines; items a pipeline replaced are not timed."""
+        start = self._item_starts.pop(id(item), None)
+        if start is not None:
+            self.item_pipelines.observe(time.perf_counter() - start)
+
+    def items_per_second(self) -> float:
+        elapsed = time.time() - self.started
+        return self.items / elapsed if elapsed > 0 else 0.0
+
+    def snapshot(self) -> Dict:
+        now = time.time()
+        recent = (self.items - self._last_items) / (now - self._last_time) if now > self._last_time else 0.0
+        self._last_items, self._last_time = self.items, now
+        return {
+            'time': now,
+            'elapsed': round(now - self.started, 3),
+            'download_latency': self.download.to_dict(),
+            'callbacks': {name: h.to_dict() for name, h in sorted(self.callbacks.items())},
+            'item_pipelines': self.item_pipelines.to_dict(),
+            'pipelines': {name: h.to_dict() for name, h in sorted(self.pipelines.items())},
+            'bytes_in': self.bytes_in,
+            'responses': {str(status): n for status, n in sorted(self.responses.items())},
+            'items': self.items,
+            'items_per_second': round(self.items_per_second(), 3),
+            'items_per_second_recent': round(recent, 3),
+            'dropped': dict(self.drops),
+            'dropped_by_pipeline': dict(self.pipeline_drops),
+            'item_errors': self.item_errors,
+            'callback_errors': dict(self.callback_errors),
+        }
+
+    def prometheus(self) -> str:
+        lines = []
+
+        def histogram(name, help_text, series):
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} histogram')
+            for labels, h in series:
+                cumulative = 0
+                for bound, n in zip(h.buckets, h.counts):
+                    cumulative += n
+                    lines.append(f'{name}_bucket{{{labels}le="{bound}"}} {cumulative}')
+                lines.append(f'{name}_bucket{{{labels}le="+Inf"}} {h.count}')
+                plain = '{' + labels.rstrip(',') + '}' if labels else ''
+                lines.append(f'{name}_sum{plain} {h.sum}')
+                lines.append(f'{name}_count{plain} {h.count}')
+
+        def simple(name, kind, help_text, series):
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {kind}')
+            for labels, value in series:
+                lines.append(f'{name}{{{labels}}} {value}' if labels else f'{name} {value}')
+
+        histogram('scrapy_download_latency_seconds', 'Time from sending a request to receiving its response.',
+                  [('', self.download)])
+        histogram('scrapy_callback_seconds', 'Time spent inside spider callbacks.',
+                  [(f'callback="{_escape(name)}",', h) for name, h in sorted(self.callbacks.items())])
+        histogram('scrapy_item_pipeline_seconds',
+                  'Time from a callback yielding an item to the item pipelines finishing it.',
+                  [('', self.item_pipelines)])
+        histogram('scrapy_pipeline_seconds', 'Time spent in each item pipeline\'s process_item.',
+                  [(f'pipeline="{_escape(name)}",', h) for name, h in sorted(self.pipelines.items())])
+        simple('scrapy_response_bytes_total', 'counter', 'Response body bytes received.', [('', self.bytes_in)])
+        simple('scrapy_responses_total', 'counter', 'Responses by HTTP status.',
+               [(f'status="{status}"', n) for status, n in sorted(self.responses.items())])
+        simple('scrapy_items_total', 'counter', 'Items scraped.', [('', self.items)])
+        simple('scrapy_items_per_second', 'gauge', 'Items scraped per second since the start.',
+               [('', round(self.items_per_second(), 3))])
+        simple('scrapy_items_dropped_total', 'counter', 'Dropped items by reason.',
+               [(f'reason="{_escape(reason)}"', n) for reason, n in sorted(self.drops.items())])
+        simple('scrapy_pipeline_dropped_total', 'counter', 'Dropped items by the pipeline that dropped them.',
+               [(f'pipeline="{_escape(name)}"', n) for name, n in sorted(self.pipeline_drops.items())])
+        simple('scrapy_item_errors_total', 'counter', 'Exceptions raised by item pipelines.',
+               [('', self.item_errors)])
+        simple('scrapy_callback_errors_total', 'counter', 'Exceptions raised by spider callbacks.',
+               [(f'callback="{_escape(name)}"', n) for name, n in sorted(self.callback_errors.items())])
+        return '\n'.join(lines) + '\n'
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def timed_process_item(process_item):
+    """Decorator timing an item pipeline's process_item into its own histogram.
+
+    The pipeline sets ``self.metrics = MetricsRegistry.enabled_for(crawler)``
+    in from_crawler; with metrics off that is None and the call is passed
+    straight through. Items the pipeline drops are counted against it.
+    """
+    @functools.wraps(process_item)
+    def wrapper(self, item, spider):
+        registry = getattr(self, 'metrics', None)
+        if registry is None:
+            return process_item(self, item, spider)
+        name = type(self).__name__
+        start = time.perf_counter()
+        try:
+            return process_item(self, item, spider)
+        except DropItem:
+            registry.pipeline_drops[name] += 1
+            raise
+        finally:
+            registry.pipelines[name].observe(time.perf_counter() - start)
+    return wrapper
+
+
+def _callback_name(response, spider) -> str:
+    callback = getattr(response.request, 'callback', None) if response.request is not None else None
+    return getattr(callback or getattr(spider, 'parse', None), '__name__', 'parse')
+
+
+class CallbackTimingMiddleware:
+    """Spider middleware timing each callback.
+
+    Callbacks are generators, so their code runs while the output is being
+    iterated; only the time inside next() is counted. It must sit closest to
+    the spider (highest order in SPIDER_MIDDLEWARES) so other middlewares'
+    work is not included. Items are stamped here as they are yielded, and
+    CrawlMetrics times them to the end of the item pipelines.
+    """
+
+    def __init__(self, registry: MetricsRegistry):
+        self.registry = registry
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        if not crawler.settings.getbool('METRICS_ENABLED'):
+            raise NotConfigured
+        return cls(MetricsRegistry.for_crawler(crawler))
+
+    def process_spider_output(self, response, result, spider):
+        histogram = self.registry.callbacks[_callback_name(response, spider)]
+        elapsed = 0.0
+        iterator = iter(result)
+        while True:
+            start = time.perf_counter()
+            try:
+                output = next(iterator)
+            except StopIteration:
+                elapsed += time.perf_counter() - start
+                break
+            elapsed += time.perf_counter() - start
+            if is_item(output):
+                self.registry.item_started(output)
+            yield output
+        histogram.observe(elapsed)
+
+    async def process_spider_output_async(self, response, result, spider):
+        histogram = self.registry.callbacks[_callback_name(response, spider)]
+        elapsed = 0.0
+        iterator = result.__aiter__()
+        while True:
+            start = time.perf_counter()
+            try:
+                output = await iterator.__anext__()
+            except StopAsyncIteration:
+                elapsed += time.perf_counter() - start
+                break
+            elapsed += time.perf_counter() - start
+            if is_item(output):
+                self.registry.item_started(output)
+            yield output
+        histogram.observe(elapsed)
+
+    def process_spider_exception(self, response, exception, spider):
+        self.registry.callback_errors[_callback_name(response, spider)] += 1
+        return None
+
+
+class CrawlMetrics:
+    """Extension collecting crawl metrics, writing snapshots and serving /metrics."""
+
+    def __init__(self, crawler, snapshot_path: str, interval: float, host: str, port: int):
+        self.crawler = crawler
+        self.registry = MetricsRegistry.for_crawler(crawler)
+        self.snapshot_path = snapshot_path
+        self.interval = interval
+        self.host = host
+        self.port = port
+        self.task: Optional[task.LoopingCall] = None
+        self.listener = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        if not settings.getbool('METRICS_ENABLED'):
+            raise NotConfigured
+        ext = cls(
+            crawler,
+            snapshot_path=settings.get('METRICS_SNAPSHOT_PATH', DEFAULT_SNAPSHOT_PATH),
+            interval=settings.getfloat('METRICS_SNAPSHOT_INTERVAL', DEFAULT_SNAPSHOT_INTERVAL),
+            host=settings.get('METRICS_HOST', '127.0.0.1'),
+            port=settings.getint('METRICS_PORT', DEFAULT_PORT),
+        )
+        crawler.signals.connect(ext.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(ext.spider_closed, signal=signals.spider_closed)
+        crawler.signals.connect(ext.response_received, signal=signals.response_received)
+        crawler.signals.connect(ext.item_scraped, signal=signals.item_scraped)
+        crawler.signals.connect(ext.item_dropped, signal=signals.item_dropped)
+        crawler.signals.connect(ext.item_error, signal=signals.item_error)
+        return ext
+
+    # -- collection -----------------------------------------------------------
+
+    def response_received(self, response, request, spider):
+        latency = request.meta.get('download_latency')
+        if latency is not None:
+            self.registry.download.observe(latency)
+        self.registry.bytes_in += len(response.body)
+        self.registry.responses[response.status] += 1
+
+    def item_scraped(self, item, response, spider):
+        self.registry.items += 1
+        self.registry.item_finished(item)
+
+    def item_dropped(self, item, response, exception, spider):
+        self.registry.drops[drop_reason(exception)] += 1
+        self.registry.item_finished(item)
+
+    def item_error(self, item, response, spider, failure):
+        self.registry.item_errors += 1
+        self.registry.item_finished(item)
+
+    # -- output ---------------------------------------------------------------
+
+    def spider_opened(self, spider):
+        if self.port:
+            from twisted.internet import reactor
+            self.listener = reactor.listenTCP(self.port, Site(MetricsResource(self.registry)), interface=self.host)
+            logger.info('Serving crawl metrics on http://%s:%d/metrics', self.host, self.listener.getHost().port)
+        if self.snapshot_path and self.interval > 0:
+            self.task = task.LoopingCall(self.write_snapshot)
+            self.task.start(self.interval, now=False)
+
+    def spider_closed(self, spider, reason):
+        if self.task is not None and self.task.running:
+            self.task.stop()
+        if self.snapshot_path:
+            self.write_snapshot()
+        if self.listener is not None:
+            # Not waited for: the port closes on its own and the handler stays synchronous
+            self.listener.stopListening()
+            self.listener = None
+
+    def write_snapshot(self) -> None:
+        directory = os.path.dirname(self.snapshot_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = self.snapshot_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as fp:
+            json.dump(self.registry.snapshot(), fp, indent=2)
+        os.replace(tmp_path, self.snapshot_path)
+
+
+class MetricsResource(Resource):
+    """/metrics in Prometheus text exposition format."""
+
+    isLeaf = True
+
+    def __init__(self, registry: MetricsRegistry):
+        super().__init__()
+        self.registry = registry
+
+    def render_GET(self, request):
+        request.setHeader(b'Content-Type', b'text/plain; version=0.0.4; charset=utf-8')
+        return self.registry.prometheus().encode('utf-8')
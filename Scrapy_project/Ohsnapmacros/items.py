@@ -1,72 +1,127 @@
-from dataclasses import dataclass, field
-from typing import List, Optional, Dict
+"""Recipe records.
 
+`RecipeItem` is the item the spider yields and the pipelines handle (through
+ItemAdapter). It is a slotted dataclass, so a record has no per-instance
+``__dict__``; list fields are stored as tuples, and the short strings that
+repeat across many recipes (author, categories, times, servings) are
+interned, so a few hundred thousand records loaded from ``recipes.jl`` share
+one copy of each.
 
-@dataclass
-class RecipeItem:
-    url: str
-    title: str
-    author: Optional[str] = None
-    publish_date: Optional[str] = None
-    categories: List[str] = field(default_factory=list)
-    image: Optional[str] = None
-    servings: Optional[str] = None
-    prep_time: Optional[str] = None
-    cook_time: Optional[str] = None
-    total_time: Optional[str] = None
-    ingredients: List[str] = field(default_factory=list)
-    instructions: List[str] = field(default_factory=list)
-    nutrition: Optional[str] = None
-    ratings: Optional[str] = None
-    scraped: Optional[str] = None
+`load_jsonl` and `RecipeItem.from_jsonl_line` build records straight from
+exported lines, and `to_columns` turns a list of records into one list per
+field for columnar processing. Lines are parsed with ``orjson`` when it is
+installed.
+"""
+import gzip
+import json
+import sys
+from dataclasses import dataclass, fields
+from operator import attrgetter
+from typing import Dict, Iterable, List, Optional, Tuple
 
+import scrapy
 
-def as_dict(item: 'RecipeItem') -> Dict:
-    return {k: v for k, v in item.__dict__.items()}
-# Define here the models for your scraped items
-#
-# See documentation in:
-# https://docs.scrapy.org/en/latest/topics/items.html
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
-import scrapy
 
+# Strings that repeat across recipes; list fields are interned element by element
+INTERNED_FIELDS = frozenset({'author', 'categories', 'servings', 'prep_time', 'cook_time', 'total_time',
+                             'ratings', 'extraction'})
+LIST_FIELDS = frozenset({'categories', 'ingredients', 'instructions'})
 
-class RealEstateItem(scrapy.Item):
-    # define the fields for your item here like:
-    # name = scrapy.Field()
-    pass
-from dataclasses import dataclass, field
-from typing import List, Optional, Dict
+_loads = orjson.loads if orjson is not None else json.loads
 
 
-@dataclass
+@dataclass(slots=True)
 class RecipeItem:
     url: str
     title: str
     author: Optional[str] = None
     publish_date: Optional[str] = None
-    categories: List[str] = field(default_factory=list)
+    categories: Tuple[str, ...] = ()
     image: Optional[str] = None
     servings: Optional[str] = None
     prep_time: Optional[str] = None
     cook_time: Optional[str] = None
     total_time: Optional[str] = None
-    ingredients: List[str] = field(default_factory=list)
-    instructions: List[str] = field(default_factory=list)
+    ingredients: Tuple[str, ...] = ()
+    instructions: Tuple[str, ...] = ()
     nutrition: Optional[str] = None
     ratings: Optional[str] = None
     scraped: Optional[str] = None
+    # Bookkeeping (see extraction.META_FIELDS), not recipe data
+    extraction: Optional[str] = None
+    near_duplicate_of: Optional[str] = None
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> 'RecipeItem':
+        """Build a record from an item dict; unknown keys are ignored."""
+        return cls(*[_convert(name, data.get(name)) for name in FIELD_NAMES])
+
+    @classmethod
+    def from_jsonl_line(cls, line) -> 'RecipeItem':
+        """Raises ValueError if line is not a JSON object."""
+        data = _loads(line)
+        if not isinstance(data, dict):
+            raise ValueError(f'expected a JSON object, got {type(data).__name__}')
+        return cls.from_dict(data)
+
+
+FIELD_NAMES: Tuple[str, ...] = tuple(f.name for f in fields(RecipeItem))
+_get_values = attrgetter(*FIELD_NAMES)
+
+
+def _convert(name: str, value):
+    if value is None:
+        return () if name in LIST_FIELDS else None
+    if name in LIST_FIELDS:
+        if isinstance(value, str):
+            value = (value,)
+        if name in INTERNED_FIELDS:
+            return tuple(sys.intern(v) if type(v) is str else v for v in value)
+        return tuple(value)
+    if name in INTERNED_FIELDS and type(value) is str:
+        return sys.intern(value)
+    return value
 
 
 def as_dict(item: 'RecipeItem') -> Dict:
-    return {k: v for k, v in item.__dict__.items()}
+    """Shallow dict of the record's fields (list fields stay tuples; json writes them as lists)."""
+    return dict(zip(FIELD_NAMES, _get_values(item)))
+
+
+def load_jsonl(path: str) -> List[RecipeItem]:
+    """Every record in a JSON lines file (gzip if the name ends in .gz).
+
+    Malformed lines and lines that are not JSON objects are skipped.
+    """
+    opener = gzip.open if path.endswith('.gz') else open
+    items = []
+    with opener(path, 'rb') as fp:
+        for line in fp:
+            try:
+                items.append(RecipeItem.from_jsonl_line(line))
+            except ValueError:
+                continue
+    return items
+
+
+def to_columns(items: Iterable[RecipeItem]) -> Dict[str, list]:
+    """One list per field, in FIELD_NAMES order: {'url': [...], 'title': [...], ...}."""
+    rows = [_get_values(item) for item in items]
+    if not rows:
+        return {name: [] for name in FIELD_NAMES}
+    return {name: list(column) for name, column in zip(FIELD_NAMES, zip(*rows))}
+
+
 # Define here the models for your scraped items
 #
 # See documentation in:
 # https://docs.scrapy.org/en/latest/topics/items.html
 
-import scrapy
-
 
 class RealEstateItem(scrapy.Item):
     # define the fields for your item here like:
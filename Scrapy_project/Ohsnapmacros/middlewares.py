@@ -3,7 +3,14 @@
 # See documentation in:
 # https://docs.scrapy.org/en/latest/topics/spider-middleware.html
 
+import time
+from typing import Dict, Optional
+from urllib.parse import urlparse
+
 from scrapy import signals
+from scrapy.exceptions import NotConfigured
+
+from .robots import RobotsStore
 
 # useful for handling different item types with a single interface
 from itemadapter import ItemAdapter
@@ -98,3 +105,161 @@ class RealEstateDownloaderMiddleware:
 
     def spider_opened(self, spider):
         spider.logger.info("Spider opened: %s" % spider.name)
+
+
+class HostState:
+    """Smoothed health signals and the current limits for one download slot."""
+
+    def __init__(self, concurrency: float, delay: float, min_delay: float):
+        self.concurrency = concurrency
+        self.delay = delay
+        self.min_delay = min_delay
+        self.latency: Optional[float] = None
+        self.error_rate = 0.0
+        self.throttle_rate = 0.0
+        self.successes = 0
+        self.backoff_until = 0.0
+
+    def observe(self, alpha: float, latency: Optional[float], error: bool, throttled: bool) -> None:
+        if latency is not None:
+            self.latency = latency if self.latency is None else alpha * latency + (1 - alpha) * self.latency
+        self.error_rate = alpha * error + (1 - alpha) * self.error_rate
+        self.throttle_rate = alpha * throttled + (1 - alpha) * self.throttle_rate
+
+
+class AdaptiveConcurrencyMiddleware:
+    """Per-host AIMD controller for the downloader's concurrency and delay.
+
+    Every response updates exponentially weighted averages of the host's
+    latency, error rate (5xx and download errors) and 429/503 rate. Healthy
+    responses add a little capacity: the delay shrinks by a fixed step towards
+    the floor, then concurrency grows by one per window of `concurrency`
+    successes. A throttled or failed response halves concurrency and
+    multiplies the delay at once (honouring Retry-After), and a host that is
+    slower than the target latency loses one slot at a time.
+
+    The delay never goes below the host's robots.txt Crawl-delay (or
+    ADAPTIVE_MIN_DELAY without one). In a sharded crawl, SHARD_COUNT workers
+    share the host, so the Crawl-delay is multiplied by the number of workers;
+    run_spider.py scales ADAPTIVE_MIN_DELAY and ADAPTIVE_MAX_CONCURRENCY the
+    same way. The current state of every host is kept in the stats under
+    adaptive/<host>/*.
+
+    Settings:
+    - ADAPTIVE_CONCURRENCY_ENABLED: turn the middleware on; AutoThrottle must be off.
+    - ADAPTIVE_MIN_DELAY / ADAPTIVE_MAX_DELAY: delay limits in seconds.
+    - ADAPTIVE_MAX_CONCURRENCY: upper limit per host (default CONCURRENT_REQUESTS_PER_DOMAIN).
+    - ADAPTIVE_TARGET_LATENCY: average latency in seconds above which a host is slowed down.
+    - ADAPTIVE_DELAY_STEP: additive delay decrease per healthy response.
+    - ADAPTIVE_BACKOFF_FACTOR: delay multiplier on throttling or errors.
+    - ADAPTIVE_EWMA_ALPHA: weight of the newest sample in the averages.
+    """
+
+    def __init__(self, crawler):
+        settings = crawler.settings
+        if not settings.getbool('ADAPTIVE_CONCURRENCY_ENABLED'):
+            raise NotConfigured
+        if settings.getbool('AUTOTHROTTLE_ENABLED'):
+            raise NotConfigured('AdaptiveConcurrencyMiddleware and AutoThrottle both set download delays; '
+                                'disable AUTOTHROTTLE_ENABLED to use it')
+        self.crawler = crawler
+        self.stats = crawler.stats
+        self.robots = RobotsStore.from_settings(settings)
+        self.user_agent = settings.get('USER_AGENT')
+        self.workers = max(1, settings.getint('SHARD_COUNT', 1))
+        self.start_delay = settings.getfloat('DOWNLOAD_DELAY')
+        self.min_delay = settings.getfloat('ADAPTIVE_MIN_DELAY', 0.25)
+        self.max_delay = settings.getfloat('ADAPTIVE_MAX_DELAY', 30.0)
+        self.max_concurrency = settings.getint('ADAPTIVE_MAX_CONCURRENCY',
+                                               settings.getint('CONCURRENT_REQUESTS_PER_DOMAIN'))
+        self.target_latency = settings.getfloat('ADAPTIVE_TARGET_LATENCY', 2.0)
+        self.delay_step = settings.getfloat('ADAPTIVE_DELAY_STEP', 0.1)
+        self.backoff_factor = settings.getfloat('ADAPTIVE_BACKOFF_FACTOR', 2.0)
+        self.alpha = settings.getfloat('ADAPTIVE_EWMA_ALPHA', 0.3)
+        self.hosts: Dict[str, HostState] = {}
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        return cls(crawler)
+
+    def _crawl_delay(self, url: str) -> float:
+        rp = self.robots.get(urlparse(url).netloc)
+        delay = rp.crawl_delay(self.user_agent) if rp is not None else None
+        return float(delay) * self.workers if delay else 0.0
+
+    def _state(self, key: str, url: str) -> HostState:
+        state = self.hosts.get(key)
+        if state is None:
+            floor = max(self.min_delay, self._crawl_delay(url))
+            state = HostState(1.0, min(self.max_delay, max(floor, self.start_delay)), floor)
+            self.hosts[key] = state
+        return state
+
+    def _apply(self, key: str, state: HostState) -> None:
+        # Slots are created lazily and garbage-collected when idle, so reapply on every request
+        slot = self.crawler.engine.downloader.slots.get(key)
+        if slot is not None:
+            slot.concurrency = int(state.concurrency)
+            slot.delay = state.delay
+        prefix = f'adaptive/{key}'
+        self.stats.set_value(f'{prefix}/concurrency', int(state.concurrency))
+        self.stats.set_value(f'{prefix}/delay_ms', round(state.delay * 1000))
+        if state.latency is not None:
+            self.stats.set_value(f'{prefix}/latency_ms', round(state.latency * 1000))
+        self.stats.set_value(f'{prefix}/error_rate', round(state.error_rate, 3))
+        self.stats.set_value(f'{prefix}/throttle_rate', round(state.throttle_rate, 3))
+
+    def _back_off(self, state: HostState, retry_after: float = 0.0) -> None:
+        state.concurrency = max(1.0, state.concurrency / 2)
+        state.delay = min(self.max_delay, max(state.delay * self.backoff_factor, state.min_delay + self.delay_step,
+                                              retry_after))
+        state.successes = 0
+        # One slow burst of failures should halve once, not once per in-flight request
+        state.backoff_until = time.monotonic() + state.delay
+
+    def _update(self, request, latency: Optional[float], error: bool, throttled: bool,
+                retry_after: float = 0.0) -> None:
+        key = request.meta.get('download_slot') or self.crawler.engine.downloader.get_slot_key(request)
+        state = self._state(key, request.url)
+        state.observe(self.alpha, latency, error, throttled)
+        if throttled or error:
+            if time.monotonic() >= state.backoff_until:
+                self._back_off(state, retry_after)
+                self.stats.inc_value('adaptive/backoff_throttled' if throttled else 'adaptive/backoff_error')
+        elif state.latency is not None and state.latency > self.target_latency:
+            state.concurrency = max(1.0, state.concurrency - 1)
+            state.delay = min(self.max_delay, state.delay + self.delay_step)
+            state.successes = 0
+            self.stats.inc_value('adaptive/slow_down')
+        elif state.delay > state.min_delay:
+            state.delay = max(state.min_delay, state.delay - self.delay_step)
+            self.stats.inc_value('adaptive/speed_up')
+        else:
+            # Additive increase: one more slot per window of `concurrency` healthy responses
+            state.successes += 1
+            if state.successes >= state.concurrency and state.concurrency < self.max_concurrency:
+                state.concurrency += 1
+                state.successes = 0
+                self.stats.inc_value('adaptive/speed_up')
+        self._apply(key, state)
+
+    def process_request(self, request, spider):
+        key = self.crawler.engine.downloader.get_slot_key(request)
+        self._apply(key, self._state(key, request.url))
+        return None
+
+    def process_response(self, request, response, spider):
+        throttled = response.status in (429, 503)
+        retry_after = 0.0
+        if throttled:
+            try:
+                retry_after = float(response.headers.get('Retry-After', b'0'))
+            except ValueError:
+                pass
+        self._update(request, request.meta.get('download_latency'), response.status >= 500 and not throttled,
+                     throttled, retry_after)
+        return response
+
+    def process_exception(self, request, exception, spider):
+        self._update(request, None, True, False)
+        return None
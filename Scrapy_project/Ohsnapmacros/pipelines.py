@@ -1,71 +1,235 @@
-import json
-from typing import Dict
+from typing import Dict, List, Optional, Tuple
+from itemadapter import ItemAdapter
+from scrapy import signals
 from scrapy.exceptions import DropItem
 
+from .dedup import DEFAULT_MAX_DISTANCE, DEFAULT_STORE_PATH, DedupStore, content_hash, simhash
+from .extraction import META_FIELDS
+from .instrumentation import MetricsRegistry, timed_process_item
+from .items import RecipeItem, as_dict
+from .store import RecipeStore
+from .writer import BatchedJsonlWriter, written_keys
 
-class ValidateAndWritePipeline:
-    """Pipeline that validates items contain at least 10 non-empty attributes
-    and writes them to a JSON lines file (recipes_valid.jl) in the project root.
+
+class DedupPipeline:
+    """Drops recipes already stored under any URL and flags near-duplicates.
+
+    - The same content under another URL is dropped (dedup/exact).
+    - A page whose content has not changed since the last run is dropped
+      (dedup/unchanged), so it is not written again.
+    - A recipe whose ingredients and instructions are within
+      DEDUP_MAX_DISTANCE simhash bits of a stored one is kept, with that URL
+      in item['near_duplicate_of'] (dedup/near).
+
+    Fingerprints are kept in DEDUP_STORE_PATH between runs (see dedup.py).
+    An item's fingerprint is only stored once the item has made it through
+    every pipeline (the item_scraped signal), and only committed after
+    ValidateAndWritePipeline has flushed it (checkpoint and close), so the
+    store never claims an item the output does not have. On open, the store
+    is trimmed to the URLs actually found in the VALID_OUTPUT_PATH parts, so
+    a lost or cut-off output is written again rather than dropped as
+    unchanged. When VALID_OUTPUT_RESUME is off the output starts over, so the
+    store is kept whole for duplicate detection but unchanged pages are not
+    dropped. Only DEDUP_RESET empties the store.
     """
 
+    def __init__(self, path: str = DEFAULT_STORE_PATH, max_distance: int = DEFAULT_MAX_DISTANCE, stats=None,
+                 output_path: str = 'recipes_valid.jl', output_compression: Optional[str] = None,
+                 resume: bool = True, reset: bool = False):
+        self.path = path
+        self.max_distance = max_distance
+        self.stats = stats
+        self.metrics: Optional[MetricsRegistry] = None
+        self.output_path = output_path
+        self.output_compression = output_compression
+        self.resume = resume
+        self.reset = reset
+        self.store: Optional[DedupStore] = None
+        # url -> (content hash, simhash) of items still going through the pipelines
+        self._pending: Dict[str, Tuple[str, Optional[int]]] = {}
+        # content hash -> url, for exact duplicates among the pending items
+        self._pending_digests: Dict[str, str] = {}
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        pipeline = cls(
+            path=settings.get('DEDUP_STORE_PATH', DEFAULT_STORE_PATH),
+            max_distance=settings.getint('DEDUP_MAX_DISTANCE', DEFAULT_MAX_DISTANCE),
+            stats=crawler.stats,
+            output_path=settings.get('VALID_OUTPUT_PATH', 'recipes_valid.jl'),
+            output_compression=settings.get('VALID_OUTPUT_COMPRESSION') or None,
+            resume=settings.getbool('VALID_OUTPUT_RESUME', True),
+            reset=settings.getbool('DEDUP_RESET', False),
+        )
+        pipeline.metrics = MetricsRegistry.enabled_for(crawler)
+        crawler.signals.connect(pipeline.item_scraped, signal=signals.item_scraped)
+        crawler.signals.connect(pipeline.item_not_written, signal=signals.item_dropped)
+        crawler.signals.connect(pipeline.item_not_written, signal=signals.item_error)
+        return pipeline
+
     def open_spider(self, spider):
-        self.file = open('recipes_valid.jl', 'w', encoding='utf-8')
+        self.store = DedupStore(self.path, commit_every=0)
+        if self.reset:
+            self.store.clear()
+            spider.logger.info('DedupPipeline: DEDUP_RESET emptied %s', self.path)
+            return
+        if not self.resume:
+            return
+        forgotten = self.store.retain(written_keys(self.output_path, self.output_compression))
+        if forgotten:
+            spider.logger.info('DedupPipeline: forgot %d items missing from %s', forgotten, self.output_path)
 
     def close_spider(self, spider):
-        self.file.close()
+        self.store.close()
 
-    def process_item(self, item: Dict, spider):
-        # Count non-empty attributes
-        non_empty = 0
-        for k, v in item.items():
-            if v is None:
-                continue
-            if isinstance(v, (list, tuple)) and len(v) == 0:
-                continue
-            if isinstance(v, str) and not v.strip():
-                continue
-            non_empty += 1
+    def checkpoint(self) -> Dict:
+        self.store.commit()
+        return {}
 
-        if non_empty < 10:
-            raise DropItem(f"Dropped item with only {non_empty} non-empty fields: {item.get('url')}")
+    def _inc(self, key: str) -> None:
+        if self.stats is not None:
+            self.stats.inc_value(key)
 
-        line = json.dumps(item, ensure_ascii=False)
-        self.file.write(line + "\n")
-        return item
-# Define your item pipelines here
-#
-# Don't forget to add your pipeline to the ITEM_PIPELINES setting
-# See: https://docs.scrapy.org/en/latest/topics/item-pipeline.html
+    @timed_process_item
+    def process_item(self, item, spider):
+        adapter = ItemAdapter(item)
+        url = adapter.get('url')
+        digest = content_hash(adapter)
+        if self.resume and self.store.get(url) == digest:
+            self._inc('dedup/unchanged')
+            raise DropItem(f"Unchanged since the last crawl: {url}")
+        duplicate_of = self.store.find_exact(digest, url) or self._pending_digests.get(digest)
+        if duplicate_of is not None and duplicate_of != url:
+            self._inc('dedup/exact')
+            raise DropItem(f"Duplicate content: {url} (same as {duplicate_of})")
 
+        h = simhash(adapter)
+        if h is not None:
+            near = self.store.find_near(h, url, self.max_distance)
+            if near is not None:
+                adapter['near_duplicate_of'] = near[0]
+                self._inc('dedup/near')
+        self._pending[url] = (digest, h)
+        self._pending_digests[digest] = url
+        self._inc('dedup/new')
+        return item
 
-# useful for handling different item types with a single interface
-from itemadapter import ItemAdapter
+    def _pop_pending(self, item) -> Optional[Tuple[str, str, Optional[int]]]:
+        url = ItemAdapter(item).get('url')
+        fingerprint = self._pending.pop(url, None)
+        if fingerprint is None:
+            return None
+        if self._pending_digests.get(fingerprint[0]) == url:
+            del self._pending_digests[fingerprint[0]]
+        return (url,) + fingerprint
 
+    def item_scraped(self, item, response, spider):
+        pending = self._pop_pending(item)
+        if pending is not None and self.store is not None:
+            self.store.put(*pending)
 
-class RealEstatePipeline:
-    def process_item(self, item, spider):
-        return item
-import json
-from typing import Dict
-from scrapy.exceptions import DropItem
+    def item_not_written(self, item, response, spider, **kwargs):
+        self._pop_pending(item)
 
 
 class ValidateAndWritePipeline:
     """Pipeline that validates items contain at least 10 non-empty attributes
     and writes them to a JSON lines file (recipes_valid.jl) in the project root.
+
+    Items are handed to a `BatchedJsonlWriter`, which serializes and writes
+    them on a background thread. Settings:
+    - VALID_OUTPUT_PATH: output file (default recipes_valid.jl).
+    - VALID_OUTPUT_COMPRESSION: None, 'gzip' or 'zstd'.
+    - VALID_OUTPUT_BATCH_SIZE / VALID_OUTPUT_QUEUE_SIZE: records per write and
+      the most records waiting for the writer before process_item blocks.
+    - VALID_OUTPUT_MAX_BYTES / VALID_OUTPUT_MAX_RECORDS: rotate to a new part
+      file at this size; 0 means no limit.
+    - VALID_OUTPUT_RESUME: append to earlier output and skip URLs already in it
+      (default); False starts over.
+    - VALID_MIN_FIELDS: non-empty fields an item needs to be kept (default 10).
+    - VALID_STORE_PATH: also upsert items into this `RecipeStore` (SQLite with
+      full-text search); unset means no store. VALID_STORE_BATCH_SIZE items
+      are written per transaction.
     """
 
+    def __init__(self, path: str = 'recipes_valid.jl', compression: Optional[str] = None, batch_size: int = 100,
+                 queue_size: int = 1000, max_bytes: int = 0, max_records: int = 0, resume: bool = True,
+                 min_fields: int = 10, store_path: Optional[str] = None, store_batch_size: int = 500,
+                 stats=None):
+        self.path = path
+        self.compression = compression
+        self.batch_size = batch_size
+        self.queue_size = queue_size
+        self.max_bytes = max_bytes
+        self.max_records = max_records
+        self.resume = resume
+        self.min_fields = min_fields
+        self.store_path = store_path
+        self.store_batch_size = store_batch_size
+        self.stats = stats
+        self.metrics: Optional[MetricsRegistry] = None
+        self.writer: Optional[BatchedJsonlWriter] = None
+        self.store: Optional[RecipeStore] = None
+        self._store_batch: List[Dict] = []
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        pipeline = cls(
+            path=settings.get('VALID_OUTPUT_PATH', 'recipes_valid.jl'),
+            compression=settings.get('VALID_OUTPUT_COMPRESSION') or None,
+            batch_size=settings.getint('VALID_OUTPUT_BATCH_SIZE', 100),
+            queue_size=settings.getint('VALID_OUTPUT_QUEUE_SIZE', 1000),
+            max_bytes=settings.getint('VALID_OUTPUT_MAX_BYTES', 0),
+            max_records=settings.getint('VALID_OUTPUT_MAX_RECORDS', 0),
+            resume=settings.getbool('VALID_OUTPUT_RESUME', True),
+            min_fields=settings.getint('VALID_MIN_FIELDS', 10),
+            store_path=settings.get('VALID_STORE_PATH') or None,
+            store_batch_size=settings.getint('VALID_STORE_BATCH_SIZE', 500),
+            stats=crawler.stats,
+        )
+        pipeline.metrics = MetricsRegistry.enabled_for(crawler)
+        return pipeline
+
     def open_spider(self, spider):
-        self.file = open('recipes_valid.jl', 'w', encoding='utf-8')
+        self.writer = BatchedJsonlWriter(self.path, compression=self.compression, batch_size=self.batch_size,
+                                         queue_size=self.queue_size, max_bytes=self.max_bytes,
+                                         max_records=self.max_records, resume=self.resume)
+        if self.writer.seen:
+            spider.logger.info('Resuming %s: %d items already written', self.path, len(self.writer.seen))
+        if self.store_path:
+            self.store = RecipeStore(self.store_path, batch_size=self.store_batch_size)
 
     def close_spider(self, spider):
-        self.file.close()
+        self.writer.close()
+        spider.logger.info('ValidateAndWritePipeline: %s', self.writer.summary())
+        if self.store is not None:
+            self._flush_store()
+            spider.logger.info('ValidateAndWritePipeline: %d recipes in %s', self.store.count(), self.store_path)
+            self.store.close()
+
+    def _flush_store(self) -> None:
+        if self._store_batch:
+            changed = self.store.upsert_many(self._store_batch)
+            self._store_batch = []
+            if self.stats is not None:
+                self.stats.inc_value('valid_output/store_upserts', changed)
 
-    def process_item(self, item: Dict, spider):
+    def checkpoint(self) -> Dict:
+        """Write out everything queued so far; used by the CrawlCheckpoint extension."""
+        self.writer.flush()
+        if self.store is not None:
+            self._flush_store()
+        return self.writer.position()
+
+    @timed_process_item
+    def process_item(self, item, spider):
+        adapter = ItemAdapter(item)
         # Count non-empty attributes
         non_empty = 0
-        for k, v in item.items():
-            if v is None:
+        for k, v in adapter.items():
+            if v is None or k in META_FIELDS:
                 continue
             if isinstance(v, (list, tuple)) and len(v) == 0:
                 continue
@@ -73,11 +237,17 @@ class ValidateAndWritePipeline:
                 continue
             non_empty += 1
 
-        if non_empty < 10:
-            raise DropItem(f"Dropped item with only {non_empty} non-empty fields: {item.get('url')}")
+        if non_empty < self.min_fields:
+            raise DropItem(f"Dropped item with only {non_empty} non-empty fields: {adapter.get('url')}")
 
-        line = json.dumps(item, ensure_ascii=False)
-        self.file.write(line + "\n")
+        record = as_dict(item) if isinstance(item, RecipeItem) else dict(adapter)
+        if not self.writer.write(record) and self.stats is not None:
+            self.stats.inc_value('valid_output/already_written')
+        if self.store is not None:
+            # The store upserts, so items the file already has still refresh their row
+            self._store_batch.append(record)
+            if len(self._store_batch) >= self.store_batch_size:
+                self._flush_store()
         return item
 # Define your item pipelines here
 #
@@ -0,0 +1,109 @@
+"""robots.txt caching shared by the spider and middlewares.
+
+`RobotsStore` keeps each host's robots.txt on disk with a TTL (same JSON layout
+as the top-level `robots_registry.py`, so both can share one directory) and
+memoizes the parsed Protego object in memory. `CachedRobotsTxtMiddleware`
+replaces Scrapy's RobotsTxtMiddleware and only downloads robots.txt when the
+stored copy is missing or stale.
+"""
+import json
+import os
+import time
+from typing import Dict, Optional, Tuple
+
+from protego import Protego
+from scrapy.downloadermiddlewares.robotstxt import RobotsTxtMiddleware
+from scrapy.utils.httpobj import urlparse_cached
+
+
+DEFAULT_ROBOTS_DIR = '.robots_cache'
+DEFAULT_TTL = 24 * 60 * 60
+
+
+class RobotsStore:
+    """Disk + memory cache of robots.txt text and parsed rules, keyed by netloc."""
+
+    _instances: Dict[Tuple[str, int], 'RobotsStore'] = {}
+
+    def __init__(self, directory: str = DEFAULT_ROBOTS_DIR, ttl: int = DEFAULT_TTL):
+        self.directory = directory
+        self.ttl = ttl
+        self._parsed: Dict[str, Tuple[float, str, Protego]] = {}
+        os.makedirs(directory, exist_ok=True)
+
+    @classmethod
+    def from_settings(cls, settings) -> 'RobotsStore':
+        """One store per (directory, ttl) per process, so every component shares the memo."""
+        key = (settings.get('ROBOTSTXT_CACHE_DIR', DEFAULT_ROBOTS_DIR),
+               settings.getint('ROBOTSTXT_CACHE_TTL', DEFAULT_TTL))
+        if key not in cls._instances:
+            cls._instances[key] = cls(*key)
+        return cls._instances[key]
+
+    def _path(self, netloc: str) -> str:
+        return os.path.join(self.directory, netloc.replace(':', '_') + '.json')
+
+    def get_text(self, netloc: str) -> Optional[str]:
+        """Return the stored robots.txt for netloc, or None if missing or expired."""
+        entry = self._parsed.get(netloc)
+        if entry and time.time() - entry[0] <= self.ttl:
+            return entry[1]
+        path = self._path(netloc)
+        if not os.path.exists(path):
+            return None
+        with open(path, encoding='utf-8') as fp:
+            data = json.load(fp)
+        if time.time() - data['fetched_at'] > self.ttl:
+            return None
+        self._parsed[netloc] = (data['fetched_at'], data['text'], Protego.parse(data['text']))
+        return data['text']
+
+    def get(self, netloc: str) -> Optional[Protego]:
+        """Return the parsed rules for netloc, or None if nothing fresh is stored."""
+        if self.get_text(netloc) is None:
+            return None
+        return self._parsed[netloc][2]
+
+    def put(self, netloc: str, robots_url: str, text: str) -> Protego:
+        fetched_at = time.time()
+        path = self._path(netloc)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as fp:
+            json.dump({'url': robots_url, 'fetched_at': fetched_at, 'text': text}, fp)
+        os.replace(tmp_path, path)
+        rp = Protego.parse(text)
+        self._parsed[netloc] = (fetched_at, text, rp)
+        return rp
+
+
+class CachedRobotsTxtMiddleware(RobotsTxtMiddleware):
+    """RobotsTxtMiddleware that reuses robots.txt stored by a previous run.
+
+    ROBOTSTXT_PARSER cannot do this: the parser class is only built from an
+    already downloaded body and is never told the host. So this overrides
+    robot_parser() and _parse_robots() instead; tests/test_robots.py pins that
+    behaviour against the installed Scrapy.
+    """
+
+    def __init__(self, crawler):
+        super().__init__(crawler)
+        self.store = RobotsStore.from_settings(crawler.settings)
+
+    # *args: older Scrapy passes the spider here, newer releases do not
+    def robot_parser(self, request, *args):
+        url = urlparse_cached(request)
+        netloc = url.netloc
+        if netloc not in self._parsers:
+            text = self.store.get_text(netloc)
+            if text is not None:
+                self._parsers[netloc] = self._parserimpl.from_crawler(self.crawler, text.encode('utf-8'))
+                self.crawler.stats.inc_value('robotstxt/cache_hit_count')
+        return super().robot_parser(request, *args)
+
+    def _parse_robots(self, response, netloc, *args):
+        # A missing robots.txt (4xx) means everything is allowed; 5xx is not cached
+        if response.status < 400:
+            self.store.put(netloc, response.url, response.body.decode('utf-8', errors='ignore'))
+        elif response.status < 500:
+            self.store.put(netloc, response.url, '')
+        return super()._parse_robots(response, netloc, *args)
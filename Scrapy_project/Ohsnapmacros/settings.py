@@ -15,20 +15,90 @@ USER_AGENT = 'ohsnap-scraper-example (+https://ohsnapmacros.com)'
 # Respect robots.txt
 ROBOTSTXT_OBEY = True
 
-# Be polite to the server
+# robots.txt is cached on disk between runs (see ohsnapmacros/robots.py)
+ROBOTSTXT_CACHE_DIR = '.robots_cache'
+ROBOTSTXT_CACHE_TTL = 24 * 60 * 60
+DOWNLOADER_MIDDLEWARES = {
+    'scrapy.downloadermiddlewares.robotstxt.RobotsTxtMiddleware': None,
+    'ohsnapmacros.robots.CachedRobotsTxtMiddleware': 100,
+    # After RetryMiddleware (550) in response order, so it sees 429/503 before they are retried
+    'ohsnapmacros.middlewares.AdaptiveConcurrencyMiddleware': 560,
+}
+
+# De-duplicate requests on canonical URLs and skip recipe pages fetched in a
+# previous run within the freshness window (see ohsnapmacros/urlstore.py)
+DUPEFILTER_CLASS = 'ohsnapmacros.urlstore.CanonicalDupeFilter'
+FINGERPRINT_STORE_PATH = 'fingerprints.sqlite3'
+FINGERPRINT_FRESHNESS_DAYS = 7
+
+# Score candidate recipe URLs before requesting them (see ohsnapmacros/classifier.py);
+# earlier output files are used as training history
+RECIPE_CLASSIFIER_HISTORY = ['recipes.jl', 'recipes_valid.jl']
+RECIPE_CLASSIFIER_MIN_SCORE = 0.2
+
+# Be polite to the server; DOWNLOAD_DELAY is the starting delay for each host
 DOWNLOAD_DELAY = 1.0
 CONCURRENT_REQUESTS = 8
 
-# Enable AutoThrottle
-AUTOTHROTTLE_ENABLED = True
+# Per-host concurrency and delay follow latency, errors and 429s
+# (see ohsnapmacros/middlewares.py); the delay never drops below robots.txt Crawl-delay
+ADAPTIVE_CONCURRENCY_ENABLED = True
+ADAPTIVE_MIN_DELAY = 0.25
+ADAPTIVE_MAX_DELAY = 30.0
+ADAPTIVE_MAX_CONCURRENCY = 8
+ADAPTIVE_TARGET_LATENCY = 2.0
+
+# AutoThrottle would fight the adaptive middleware over the slot delay
+AUTOTHROTTLE_ENABLED = False
 AUTOTHROTTLE_START_DELAY = 1.0
 AUTOTHROTTLE_MAX_DELAY = 10.0
 AUTOTHROTTLE_TARGET_CONCURRENCY = 1.0
 
 # Pipelines: ensure pipeline module path matches package layout
 ITEM_PIPELINES = {
+    'ohsnapmacros.pipelines.DedupPipeline': 250,
     'ohsnapmacros.pipelines.ValidateAndWritePipeline': 300,
 }
 
+# Content hashes and simhashes of stored recipes, kept between runs (see ohsnapmacros/dedup.py);
+# recipes within DEDUP_MAX_DISTANCE bits are flagged with near_duplicate_of.
+# DEDUP_RESET empties the store when the crawl starts.
+DEDUP_STORE_PATH = 'dedup.sqlite3'
+DEDUP_MAX_DISTANCE = 4
+DEDUP_RESET = False
+
+# ValidateAndWritePipeline output, written in batches from a background thread
+# (see ohsnapmacros/writer.py). Compression: None, 'gzip' or 'zstd'. A new part
+# file is started at MAX_BYTES / MAX_RECORDS (0 = unlimited). RESUME appends to
+# the earlier output and skips URLs already in it.
+VALID_OUTPUT_PATH = 'recipes_valid.jl'
+VALID_OUTPUT_COMPRESSION = None
+VALID_OUTPUT_BATCH_SIZE = 100
+VALID_OUTPUT_QUEUE_SIZE = 1000
+VALID_OUTPUT_MAX_BYTES = 0
+VALID_OUTPUT_MAX_RECORDS = 0
+VALID_OUTPUT_RESUME = True
+# Set VALID_STORE_PATH (e.g. 'recipes.sqlite3') to also upsert valid items into an
+# SQLite store with full-text search (see ohsnapmacros/store.py)
+VALID_STORE_PATH = None
+VALID_STORE_BATCH_SIZE = 500
+
+# Crawl instrumentation (see ohsnapmacros/instrumentation.py): latency histograms
+# for downloads, callbacks and pipelines, bytes in, items/s and drop reasons.
+# Snapshots go to METRICS_SNAPSHOT_PATH and Prometheus text is served on
+# http://127.0.0.1:METRICS_PORT/metrics; off by default, and free when off.
+METRICS_ENABLED = False
+METRICS_SNAPSHOT_PATH = 'crawl_metrics.json'
+METRICS_SNAPSHOT_INTERVAL = 30
+METRICS_HOST = '127.0.0.1'
+METRICS_PORT = 9410
+EXTENSIONS = {
+    'ohsnapmacros.instrumentation.CrawlMetrics': 500,
+}
+# Highest order, so it sits right next to the spider and times only the callbacks
+SPIDER_MIDDLEWARES = {
+    'ohsnapmacros.instrumentation.CallbackTimingMiddleware': 999,
+}
+
 # Feed export encoding
 FEED_EXPORT_ENCODING = 'utf-8'
@@ -0,0 +1,308 @@
+"""Hash-partitioned crawling across several worker processes.
+
+``run_spider.py --workers N`` starts N crawler processes. Each one owns the
+recipe pages whose canonical URL hashes to its shard, so every recipe page
+is fetched, parsed and written by exactly one worker, and each worker keeps
+its own JOBDIR, fingerprint file and output.
+
+Discovery (robots.txt, sitemaps, listing pages) runs only on shard 0: the
+pages it finds can belong to any shard, and a worker that skipped the
+listing pages would never learn about its recipes. `ShardMiddleware` on
+shard 0 keeps the requests it owns and appends the others to the owning
+worker's spool, an append-only file in SHARD_SPOOL_DIR; the other workers
+drop their own start requests and schedule what appears in their spool.
+Forwarded requests go through the receiving worker's dupefilter, so a URL
+found on several listing pages is still fetched once.
+
+The spool is what makes a sharded crawl resumable: a resumed worker reads
+its spool again from the start, and its dupefilter (rolled back to the last
+checkpoint with the rest of its JOBDIR) drops the requests it had already
+scheduled, so the ones received after the checkpoint are scheduled again.
+
+A worker other than shard 0 stays open while its spool is empty until the
+launcher writes the ``discovery.done`` marker, which it does once shard 0
+has exited.
+
+Settings:
+- SHARD_INDEX / SHARD_COUNT: this worker's shard and the number of workers;
+  the middleware is off with SHARD_COUNT <= 1.
+- SHARD_SPOOL_DIR: directory of the spools, shared by all workers.
+- SHARD_CALLBACKS: names of the spider callbacks whose requests are
+  partitioned; all other requests are discovery requests.
+- SHARD_ITEM_LIMIT: shard 0 stops taking on its own recipe requests after
+  this many items, but keeps discovering for the others; 0 means no limit.
+  (The other workers use CLOSESPIDER_ITEMCOUNT; shard 0 cannot, since
+  closing it would end discovery for everyone.)
+- SHARD_POLL_INTERVAL: seconds between spool polls.
+"""
+import hashlib
+import logging
+import os
+import pickle
+import struct
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from scrapy import Request, signals
+from scrapy.exceptions import DontCloseSpider, NotConfigured
+from scrapy.utils.request import request_from_dict
+from twisted.internet import task
+
+from .urlstore import canonicalize_url
+from .writer import BatchedJsonlWriter, output_parts, read_records
+
+
+logger = logging.getLogger(__name__)
+
+DISCOVERY_SHARD = 0
+DEFAULT_CALLBACKS = ('parse_recipe',)
+DISCOVERY_DONE_FILE = 'discovery.done'
+# Each spool record is a 4-byte big-endian length and a pickled request dict
+# (request dicts hold bytes, so they are not JSON)
+_FRAME_HEADER = struct.Struct('>I')
+
+
+def shard_of(url: str, count: int) -> int:
+    """The shard that owns url; stable across processes and runs (unlike hash())."""
+    digest = hashlib.sha1(canonicalize_url(url).encode('utf-8')).digest()
+    return int.from_bytes(digest[:8], 'big') % count
+
+
+def split_limit(value: int, workers: int) -> int:
+    """A per-worker share of a global limit, never below 1."""
+    return max(1, value // workers)
+
+
+def spool_path(directory: str, shard: int) -> str:
+    return os.path.join(directory, f'shard-{shard}.spool')
+
+
+def start_discovery(directory: str) -> None:
+    """Prepare the spool directory for a (new or resumed) run."""
+    os.makedirs(directory, exist_ok=True)
+    done = os.path.join(directory, DISCOVERY_DONE_FILE)
+    if os.path.exists(done):
+        os.remove(done)
+
+
+def finish_discovery(directory: str) -> None:
+    """Tell the workers that shard 0 has stopped adding to their spools."""
+    with open(os.path.join(directory, DISCOVERY_DONE_FILE), 'w', encoding='utf-8'):
+        pass
+
+
+def discovery_finished(directory: str) -> bool:
+    return os.path.exists(os.path.join(directory, DISCOVERY_DONE_FILE))
+
+
+def _read_frames(fp, limit: Optional[int] = None) -> Tuple[List[bytes], int]:
+    """The complete frames from fp's position on, and the position after the last one."""
+    frames = []
+    position = fp.tell()
+    while limit is None or len(frames) < limit:
+        header = fp.read(_FRAME_HEADER.size)
+        if len(header) < _FRAME_HEADER.size:
+            break
+        (size,) = _FRAME_HEADER.unpack(header)
+        payload = fp.read(size)
+        if len(payload) < size:
+            break
+        frames.append(payload)
+        position = fp.tell()
+    fp.seek(position)
+    return frames, position
+
+
+class SpoolWriter:
+    """Appends request dicts to one shard's spool; only shard 0 writes spools."""
+
+    def __init__(self, path: str):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        if os.path.exists(path):
+            # Cut off a record torn by a kill, so appended records stay readable
+            with open(path, 'rb+') as fp:
+                _, complete = _read_frames(fp)
+                fp.truncate(complete)
+        self.file = open(path, 'ab')
+
+    def append(self, data: Dict) -> None:
+        payload = pickle.dumps(data, protocol=4)
+        self.file.write(_FRAME_HEADER.pack(len(payload)) + payload)
+        # Flushed per record: the owning worker reads the file while it grows
+        self.file.flush()
+
+    def close(self) -> None:
+        self.file.close()
+
+
+class SpoolReader:
+    """Reads one shard's spool from the start, a complete record at a time."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.file = None
+
+    def read(self, limit: Optional[int] = None) -> List[Dict]:
+        """The records appended since the last read (at most limit)."""
+        if self.file is None:
+            if not os.path.exists(self.path):
+                return []
+            self.file = open(self.path, 'rb')
+        frames, _ = _read_frames(self.file, limit)
+        return [pickle.loads(frame) for frame in frames]
+
+    def close(self) -> None:
+        if self.file is not None:
+            self.file.close()
+
+
+class ShardMiddleware:
+    """Spider middleware that keeps a worker to its hash partition of the recipe URLs."""
+
+    def __init__(self, crawler, index: int, count: int, spool_dir: str, callbacks: Sequence[str],
+                 item_limit: int = 0, poll_interval: float = 0.5):
+        if not 0 <= index < count:
+            raise ValueError(f'SHARD_INDEX must be in [0, {count}), not {index}')
+        self.crawler = crawler
+        self.stats = crawler.stats
+        self.index = index
+        self.count = count
+        self.spool_dir = spool_dir
+        self.callbacks = set(callbacks)
+        self.item_limit = item_limit
+        self.poll_interval = poll_interval
+        self.discovery_done = False
+        self.spools: Dict[int, SpoolWriter] = {}
+        self.reader: Optional[SpoolReader] = None
+        self.task: Optional[task.LoopingCall] = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        count = settings.getint('SHARD_COUNT', 1)
+        if count <= 1:
+            raise NotConfigured
+        spool_dir = settings.get('SHARD_SPOOL_DIR')
+        if not spool_dir:
+            raise ValueError('ShardMiddleware needs SHARD_SPOOL_DIR')
+        mw = cls(crawler, settings.getint('SHARD_INDEX', 0), count, spool_dir,
+                 settings.getlist('SHARD_CALLBACKS', list(DEFAULT_CALLBACKS)),
+                 item_limit=settings.getint('SHARD_ITEM_LIMIT', 0),
+                 poll_interval=settings.getfloat('SHARD_POLL_INTERVAL', 0.5))
+        if mw.index != DISCOVERY_SHARD:
+            crawler.signals.connect(mw.spider_opened, signal=signals.spider_opened)
+            crawler.signals.connect(mw.spider_idle, signal=signals.spider_idle)
+        crawler.signals.connect(mw.spider_closed, signal=signals.spider_closed)
+        return mw
+
+    # -- partitioning ----------------------------------------------------------
+
+    def _is_partitioned(self, request) -> bool:
+        callback = request.callback
+        return getattr(callback, '__name__', callback) in self.callbacks
+
+    def _route(self, request):
+        """The request if this worker should schedule it, else None (forwarded or dropped)."""
+        if not self._is_partitioned(request):
+            if self.index == DISCOVERY_SHARD:
+                return request
+            self.stats.inc_value('shard/dropped_discovery')
+            return None
+        owner = shard_of(request.url, self.count)
+        if owner == self.index:
+            if self.item_limit and self.stats.get_value('item_scraped_count', 0) >= self.item_limit:
+                self.stats.inc_value('shard/over_item_limit')
+                return None
+            self.stats.inc_value('shard/owned')
+            return request
+        if self.index == DISCOVERY_SHARD:
+            if owner not in self.spools:
+                self.spools[owner] = SpoolWriter(spool_path(self.spool_dir, owner))
+            self.spools[owner].append(request.to_dict(spider=self.crawler.spider))
+            self.stats.inc_value('shard/forwarded')
+            self.stats.inc_value(f'shard/forwarded/{owner}')
+        else:
+            self.stats.inc_value('shard/dropped_foreign')
+        return None
+
+    def process_spider_output(self, response, result, spider):
+        for entry in result:
+            if isinstance(entry, Request):
+                entry = self._route(entry)
+            if entry is not None:
+                yield entry
+
+    async def process_spider_output_async(self, response, result, spider):
+        async for entry in result:
+            if isinstance(entry, Request):
+                entry = self._route(entry)
+            if entry is not None:
+                yield entry
+
+    async def process_start(self, start):
+        async for entry in start:
+            if isinstance(entry, Request):
+                entry = self._route(entry)
+            if entry is not None:
+                yield entry
+
+    # -- spool (shards other than 0) ----------------------------------------------
+
+    def spider_opened(self, spider):
+        self.reader = SpoolReader(spool_path(self.spool_dir, self.index))
+        self.task = task.LoopingCall(self.poll)
+        self.task.start(self.poll_interval)
+
+    def poll(self) -> None:
+        # Check the marker before reading: once it is there, shard 0 has exited,
+        # so whatever this read does not find will never come
+        done = discovery_finished(self.spool_dir)
+        received = 0
+        while True:
+            records = self.reader.read(limit=1000)
+            for data in records:
+                self.crawler.engine.crawl(request_from_dict(data, spider=self.crawler.spider))
+            received += len(records)
+            if len(records) < 1000:
+                break
+        if received:
+            self.stats.inc_value('shard/received', received)
+        if done:
+            self.discovery_done = True
+            logger.info('Shard %d: discovery finished', self.index)
+            if self.task is not None and self.task.running:
+                self.task.stop()
+
+    def spider_idle(self, spider):
+        if not self.discovery_done:
+            raise DontCloseSpider
+
+    def spider_closed(self, spider, reason):
+        if self.task is not None and self.task.running:
+            self.task.stop()
+        if self.reader is not None:
+            self.reader.close()
+        for spool in self.spools.values():
+            spool.close()
+
+
+def merge_outputs(paths: Iterable[str], output: str, key: str = 'url',
+                  compression: Optional[str] = None) -> Dict[str, int]:
+    """Merge the output parts of each path into output, keeping the first record for each key.
+
+    Every part BatchedJsonlWriter wrote for a path is read, rotated and
+    compressed ones included; lines that are not JSON objects are skipped.
+    Returns the number of records read and written.
+    """
+    writer = BatchedJsonlWriter(output, compression=compression, resume=False, key=key)
+    read = 0
+    try:
+        for path in paths:
+            for part in output_parts(path, compression):
+                for record in read_records(part, compression):
+                    read += 1
+                    writer.write(record)
+    finally:
+        writer.close()
+    return {'read': read, 'written': writer.written}
@@ -5,9 +5,25 @@ Resources used:
 - https://docs.scrapy.org/
 - https://realpython.com/beautiful-soup-web-scraper-python/
 - Site inspected: https://ohsnapmacros.com/
+
+Modes (pass with -a mode=...):
+- sitemap (default): robots.txt -> sitemap_index.xml -> post sitemaps, and only
+  the post URLs listed there are requested. Falls back to crawl mode if no
+  sitemap yields any post URLs.
+- crawl: start at /all-recipes/ and follow listing pages, treating every other
+  on-site link as a candidate recipe.
 """
+import re
 from urllib.parse import urlparse
 import scrapy
+from scrapy.utils.gz import gunzip, gzip_magic_number
+from scrapy.utils.sitemap import Sitemap
+
+from ..classifier import RecipeUrlClassifier, is_recipe_record
+from ..extraction import SelectorPlan, extract_recipe
+from ..items import RecipeItem
+from ..robots import RobotsStore
+from ..urlstore import canonicalize_url
 
 
 class OhsnapSpider(scrapy.Spider):
@@ -18,11 +34,139 @@ class OhsnapSpider(scrapy.Spider):
     custom_settings = {
         'ROBOTSTXT_OBEY': True,
         'DOWNLOAD_DELAY': 1.0,
-        'AUTOTHROTTLE_ENABLED': True,
+        'AUTOTHROTTLE_ENABLED': False,
+        'ADAPTIVE_CONCURRENCY_ENABLED': True,
         'CONCURRENT_REQUESTS': 8,
         'USER_AGENT': 'ohsnap-scraper-example (+https://ohsnapmacros.com)'
     }
 
+    robots_url = 'https://ohsnapmacros.com/robots.txt'
+    # Only these sitemaps from the index are followed (posts are the recipes)
+    sitemap_follow = [r'/post-sitemap\d*\.xml']
+
+    def __init__(self, mode='sitemap', *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        if mode not in ('sitemap', 'crawl'):
+            raise ValueError(f"mode must be 'sitemap' or 'crawl', not {mode!r}")
+        self.mode = mode
+        self._sitemap_follow = [re.compile(pattern) for pattern in self.sitemap_follow]
+        self._pending_sitemaps = 0
+        self._sitemap_post_urls = 0
+        self._fell_back = False
+        # CSS fallback selectors, translated and compiled once for the whole crawl
+        self.selector_plan = SelectorPlan()
+
+    @classmethod
+    def from_crawler(cls, crawler, *args, **kwargs):
+        spider = super().from_crawler(crawler, *args, **kwargs)
+        spider.classifier = RecipeUrlClassifier.from_settings(crawler.settings)
+        spider.min_recipe_score = crawler.settings.getfloat('RECIPE_CLASSIFIER_MIN_SCORE', 0.2)
+        return spider
+
+    async def start(self):
+        for request in self.start_requests():
+            yield request
+
+    def start_requests(self):
+        if self.mode == 'crawl':
+            yield from self.listing_requests()
+            return
+        # robots.txt is shared with CachedRobotsTxtMiddleware, so it is usually already on disk
+        rp = RobotsStore.from_settings(self.settings).get(urlparse(self.robots_url).netloc)
+        if rp is not None:
+            yield from self.sitemap_requests(rp.sitemaps)
+        else:
+            yield scrapy.Request(self.robots_url, callback=self.parse_robots, errback=self.sitemap_failed,
+                                 dont_filter=True, meta={'dont_obey_robotstxt': True})
+
+    def listing_requests(self):
+        for url in self.start_urls:
+            yield scrapy.Request(url, callback=self.parse, dont_filter=True)
+
+    def sitemap_requests(self, sitemap_urls):
+        sitemap_urls = list(sitemap_urls)
+        if not sitemap_urls:
+            yield from self.fall_back('robots.txt lists no sitemaps')
+            return
+        for url in sitemap_urls:
+            yield self.sitemap_request(url)
+
+    def sitemap_request(self, url):
+        """Request for a sitemap, counted in _pending_sitemaps until its callback or errback runs.
+
+        dont_filter: a request dropped by the dupe filter (e.g. a sitemap listed
+        twice, or one fetched before a resumed run) would reach neither, the count
+        would never return to 0 and the listing-page fallback would never run.
+        """
+        self._pending_sitemaps += 1
+        return scrapy.Request(url, callback=self.parse_sitemap, errback=self.sitemap_failed, dont_filter=True)
+
+    def parse_robots(self, response):
+        netloc = urlparse(response.url).netloc
+        if response.status == 200:
+            text = response.body.decode('utf-8', errors='ignore')
+            rp = RobotsStore.from_settings(self.settings).put(netloc, response.url, text)
+            yield from self.sitemap_requests(rp.sitemaps)
+        else:
+            yield from self.fall_back(f'robots.txt returned {response.status}')
+
+    def parse_sitemap(self, response):
+        """Expand a sitemap index into post sitemaps, and a post sitemap into recipe requests."""
+        self._pending_sitemaps -= 1
+        body = response.body
+        if gzip_magic_number(response):
+            body = gunzip(body)
+        sitemap = Sitemap(body)
+        if sitemap.type == 'sitemapindex':
+            for entry in sitemap:
+                loc = entry['loc']
+                if any(pattern.search(loc) for pattern in self._sitemap_follow):
+                    yield self.sitemap_request(loc)
+        elif sitemap.type == 'urlset':
+            locs = [entry['loc'] for entry in sitemap]
+            self._sitemap_post_urls += len(locs)
+            self.classifier.add_sitemap_urls(locs)
+            for loc in locs:
+                request = self.recipe_request(loc)
+                if request is not None:
+                    yield request
+        yield from self.check_sitemaps_done()
+
+    def sitemap_failed(self, failure):
+        self.logger.warning('Sitemap discovery request failed: %s', failure.request.url)
+        if failure.request.callback == self.parse_sitemap:
+            self._pending_sitemaps -= 1
+            yield from self.check_sitemaps_done()
+        else:
+            yield from self.fall_back('robots.txt could not be downloaded')
+
+    def check_sitemaps_done(self):
+        if self._pending_sitemaps == 0:
+            self.logger.info('Sitemaps listed %d post URLs', self._sitemap_post_urls)
+            if self._sitemap_post_urls == 0:
+                yield from self.fall_back('sitemaps listed no post URLs')
+
+    def fall_back(self, reason):
+        """Switch to crawling listing pages when sitemap discovery finds nothing."""
+        if self._fell_back:
+            return
+        self._fell_back = True
+        self.logger.warning('Falling back to listing-page crawl: %s', reason)
+        yield from self.listing_requests()
+
+    def recipe_request(self, url):
+        """Request for a candidate recipe page, or None if the classifier says it is not one.
+
+        Likelier recipes get a higher priority; the fingerprint is kept across runs.
+        """
+        score = self.classifier.score(url)
+        if score < self.min_recipe_score:
+            self.crawler.stats.inc_value('classifier/skipped')
+            return None
+        self.crawler.stats.inc_value('classifier/scheduled')
+        return scrapy.Request(url, callback=self.parse_recipe, priority=int(score * 100),
+                              meta={'persist_fingerprint': True, 'recipe_score': score})
+
     def parse(self, response):
         raw_links = response.css('a::attr(href)').getall()
         seen = set()
@@ -30,9 +174,10 @@ class OhsnapSpider(scrapy.Spider):
             if not href:
                 continue
             url = response.urljoin(href)
-            if url in seen:
+            key = canonicalize_url(url)
+            if key in seen:
                 continue
-            seen.add(url)
+            seen.add(key)
 
             parsed = urlparse(url)
             if not parsed.netloc.endswith('ohsnapmacros.com'):
@@ -50,48 +195,24 @@ class OhsnapSpider(scrapy.Spider):
                 continue
 
             # Otherwise treat it as a candidate recipe page; parse_recipe will drop non-recipe pages
-            yield scrapy.Request(url, callback=self.parse_recipe)
+            request = self.recipe_request(url)
+            if request is not None:
+                yield request
 
     def parse_recipe(self, response):
-        """Extract recipe data from a recipe page. Yields one dictionary per recipe."""
-        def first_text(selectors):
-            for sel in selectors:
-                val = response.css(sel).get()
-                if val and val.strip():
-                    return val.strip()
-            return None
-
-        def all_text(selectors):
-            for sel in selectors:
-                vals = response.css(sel).getall()
-                cleaned = [v.strip() for v in vals if v and v.strip()]
-                if cleaned:
-                    return cleaned
-            return []
-
-        title = first_text(['h1.entry-title::text', 'h1::text'])
+        """Extract recipe data from a recipe page. Yields one RecipeItem per recipe."""
+        fields = extract_recipe(response.selector.root, self.selector_plan)
         # If there's no title, this probably isn't a recipe page
-        if not title:
+        if not fields['title']:
             return
 
-        item = {
-            'url': response.url,
-            'title': title,
-            'author': first_text(['a[rel="author"]::text', '.author a::text', '.byline a::text']),
-            'publish_date': first_text(['time.entry-date::attr(datetime)', 'time::attr(datetime)', 'meta[property="article:published_time"]::attr(content)']),
-            'categories': response.css('a[rel="category tag"]::text').getall() or response.css('.breadcrumb a::text').getall(),
-            'image': first_text(['meta[property="og:image"]::attr(content)', 'figure img::attr(src)', '.post-thumbnail img::attr(src)']),
-            'servings': first_text(['.wprm-recipe-servings::text', '.servings::text']),
-            'prep_time': first_text(['.wprm-recipe-prep_time::text', '.prep-time::text']),
-            'cook_time': first_text(['.wprm-recipe-cook_time::text', '.cook-time::text']),
-            'total_time': first_text(['.wprm-recipe-total_time::text', '.total-time::text']),
-            'ingredients': all_text(['.wprm-recipe-ingredients .wprm-recipe-ingredient-name::text', '.wprm-recipe-ingredients .wprm-recipe-ingredient::text', '.ingredients li::text', '.recipe-ingredients li::text']),
-            'instructions': all_text(['.wprm-recipe-instructions li::text', '.wprm-recipe-instruction-text::text', '.instructions li::text', '.recipe-instructions li::text']),
-            'nutrition': first_text(['.wprm-recipe-nutrition::text', '.nutrition::text', '.nutrition-facts::text']),
-            'ratings': first_text(['.wprm-recipe-rating-average::text', '.rating::text', '.post-rating::text']),
-        }
+        fields['url'] = response.url
+        self.crawler.stats.inc_value(f"extraction/{fields['extraction']}")
 
         # Ensure we have at least 10 attributes add scraped timestamp
-        item['scraped'] = response.headers.get('Date', b'').decode('utf-8') or None
+        fields['scraped'] = response.headers.get('Date', b'').decode('utf-8') or None
+
+        # Feed the result back so later links with similar slugs are scored better
+        self.classifier.learn(response.url, is_recipe_record(fields))
 
-        yield item
+        yield RecipeItem.from_dict(fields)
@@ -0,0 +1,248 @@
+"""SQLite recipe store with full-text search.
+
+One row per URL: loading a file or an item whose URL is already stored
+replaces the old row (upsert), so repeated crawls do not pile up duplicates
+the way the append-only JSON lines output does. An FTS5 index over title,
+ingredients, instructions and notes, kept in sync by triggers, answers
+"which recipes mention cottage cheese" with bm25-ranked matches instead of
+a scan over every line.
+
+Only the standard library is used, so the module also runs as a script:
+
+    python Ohsnapmacros/store.py load recipes.jsonl recipes_valid.jl
+    python Ohsnapmacros/store.py search "cottage cheese"
+    python Ohsnapmacros/store.py get https://ohsnapmacros.com/some-recipe/
+
+ValidateAndWritePipeline writes to a store when VALID_STORE_PATH is set.
+"""
+import argparse
+import gzip
+import json
+import os
+import re
+import sqlite3
+import sys
+import time
+from typing import Dict, Iterable, List, Optional
+
+DEFAULT_STORE_PATH = 'recipes.sqlite3'
+DEFAULT_BATCH_SIZE = 5000
+TEXT_FIELDS = ('title', 'ingredients', 'instructions', 'notes')
+# bm25 column weights, in TEXT_FIELDS order: a title match counts most
+BM25_WEIGHTS = (10.0, 4.0, 1.0, 1.0)
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS recipes (
+    id INTEGER PRIMARY KEY,
+    url TEXT NOT NULL UNIQUE,
+    title TEXT,
+    ingredients TEXT,
+    instructions TEXT,
+    notes TEXT,
+    data TEXT NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS recipes_fts USING fts5(
+    title, ingredients, instructions, notes,
+    content='recipes', content_rowid='id',
+    tokenize='porter unicode61 remove_diacritics 2'
+);
+CREATE TRIGGER IF NOT EXISTS recipes_ai AFTER INSERT ON recipes BEGIN
+    INSERT INTO recipes_fts (rowid, title, ingredients, instructions, notes)
+    VALUES (new.id, new.title, new.ingredients, new.instructions, new.notes);
+END;
+CREATE TRIGGER IF NOT EXISTS recipes_ad AFTER DELETE ON recipes BEGIN
+    INSERT INTO recipes_fts (recipes_fts, rowid, title, ingredients, instructions, notes)
+    VALUES ('delete', old.id, old.title, old.ingredients, old.instructions, old.notes);
+END;
+CREATE TRIGGER IF NOT EXISTS recipes_au AFTER UPDATE ON recipes BEGIN
+    INSERT INTO recipes_fts (recipes_fts, rowid, title, ingredients, instructions, notes)
+    VALUES ('delete', old.id, old.title, old.ingredients, old.instructions, old.notes);
+    INSERT INTO recipes_fts (rowid, title, ingredients, instructions, notes)
+    VALUES (new.id, new.title, new.ingredients, new.instructions, new.notes);
+END;
+'''
+
+# Unchanged records (same JSON) are left alone, so reloading a file does not
+# rewrite the FTS index
+UPSERT = '''
+INSERT INTO recipes (url, title, ingredients, instructions, notes, data, updated_at)
+VALUES (?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (url) DO UPDATE SET
+    title = excluded.title, ingredients = excluded.ingredients, instructions = excluded.instructions,
+    notes = excluded.notes, data = excluded.data, updated_at = excluded.updated_at
+WHERE recipes.data != excluded.data
+'''
+
+
+def _text(value) -> Optional[str]:
+    if value is None:
+        return None
+    if isinstance(value, (list, tuple)):
+        return '\n'.join(str(v) for v in value) or None
+    return str(value)
+
+
+def fts_query(text: str) -> str:
+    """Plain words -> an FTS5 query matching all of them ('cottage cheese' -> '"cottage" "cheese"').
+
+    Quoting every word keeps FTS5 operators and punctuation in user input from
+    being parsed as query syntax.
+    """
+    return ' '.join(f'"{token}"' for token in TOKEN_RE.findall(text))
+
+
+def read_jsonl(path: str) -> Iterable[Dict]:
+    """Records in a JSON lines file (gzip if the name ends in .gz); malformed lines are skipped."""
+    opener = gzip.open if path.endswith('.gz') else open
+    with opener(path, 'rb') as fp:
+        for line in fp:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if isinstance(record, dict) and record.get('url'):
+                yield record
+
+
+class RecipeStore:
+    """Recipes keyed by URL in SQLite, with an FTS5 index over their text."""
+
+    def __init__(self, path: str = DEFAULT_STORE_PATH, batch_size: int = DEFAULT_BATCH_SIZE):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.batch_size = batch_size
+        self.conn = sqlite3.connect(path)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.executescript(SCHEMA)
+
+    def __enter__(self) -> 'RecipeStore':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    @staticmethod
+    def _row(record: Dict, now: float) -> tuple:
+        return (record['url'],) + tuple(_text(record.get(field)) for field in TEXT_FIELDS) + (
+            json.dumps(record, ensure_ascii=False, sort_keys=True), now)
+
+    def upsert_many(self, records: Iterable[Dict]) -> int:
+        """Insert or replace records by URL, batch_size rows per transaction.
+
+        Returns the number of rows inserted or changed (unchanged records are not counted).
+        """
+        changed = 0
+        now = time.time()
+        batch = []
+        for record in records:
+            batch.append(self._row(record, now))
+            if len(batch) >= self.batch_size:
+                changed += self._write(batch)
+                batch = []
+        if batch:
+            changed += self._write(batch)
+        return changed
+
+    def _write(self, rows: List[tuple]) -> int:
+        with self.conn:
+            # rowcount sums the rows each statement changed; skipped upserts count 0
+            return self.conn.executemany(UPSERT, rows).rowcount
+
+    def upsert(self, record: Dict) -> int:
+        return self.upsert_many([record])
+
+    def load_jsonl(self, path: str) -> int:
+        return self.upsert_many(read_jsonl(path))
+
+    def get(self, url: str) -> Optional[Dict]:
+        row = self.conn.execute('SELECT data FROM recipes WHERE url = ?', (url,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def delete(self, url: str) -> bool:
+        with self.conn:
+            return self.conn.execute('DELETE FROM recipes WHERE url = ?', (url,)).rowcount > 0
+
+    def count(self) -> int:
+        return self.conn.execute('SELECT COUNT(*) FROM recipes').fetchone()[0]
+
+    def search(self, query: str, limit: int = 10, raw: bool = False) -> List[Dict]:
+        """Best matches first: [{'url', 'title', 'score', 'snippet'}, ...].
+
+        query is plain words, all of which must match; with raw=True it is
+        passed to FTS5 as is (phrases, OR, NEAR, column filters, prefix*).
+        """
+        match = query if raw else fts_query(query)
+        if not match:
+            return []
+        weights = ', '.join(str(w) for w in BM25_WEIGHTS)
+        rows = self.conn.execute(
+            f'SELECT r.url, r.title, bm25(recipes_fts, {weights}) AS score, '
+            f"snippet(recipes_fts, -1, '[', ']', '...', 12) "
+            f'FROM recipes_fts JOIN recipes r ON r.id = recipes_fts.rowid '
+            f'WHERE recipes_fts MATCH ? ORDER BY score LIMIT ?', (match, limit))
+        # bm25 is lower for better matches; report it so that higher is better
+        return [{'url': url, 'title': title, 'score': -score, 'snippet': snippet}
+                for url, title, score, snippet in rows]
+
+    def optimize(self) -> None:
+        """Merge the FTS index segments; worth running after a large load."""
+        with self.conn:
+            self.conn.execute("INSERT INTO recipes_fts (recipes_fts) VALUES ('optimize')")
+
+    def close(self) -> None:
+        self.conn.close()
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description='SQLite recipe store with full-text search.')
+    parser.add_argument('--db', default=DEFAULT_STORE_PATH, help=f'database file (default: {DEFAULT_STORE_PATH})')
+    commands = parser.add_subparsers(dest='command', required=True)
+    load = commands.add_parser('load', help='upsert the records of JSON lines files')
+    load.add_argument('paths', nargs='+')
+    search = commands.add_parser('search', help='ranked full-text search')
+    search.add_argument('query')
+    search.add_argument('--limit', type=int, default=10)
+    search.add_argument('--raw', action='store_true', help='pass the query to FTS5 unchanged')
+    get = commands.add_parser('get', help='print the stored record for a URL')
+    get.add_argument('url')
+    commands.add_parser('count', help='number of stored recipes')
+    args = parser.parse_args(argv)
+
+    with RecipeStore(args.db) as store:
+        if args.command == 'load':
+            for path in args.paths:
+                start = time.perf_counter()
+                changed = store.load_jsonl(path)
+                print(f'{path}: {changed} recipes added or changed in {time.perf_counter() - start:.2f}s')
+            store.optimize()
+            print(f'{store.count()} recipes in {args.db}')
+        elif args.command == 'search':
+            start = time.perf_counter()
+            try:
+                results = store.search(args.query, args.limit, raw=args.raw)
+            except sqlite3.OperationalError as exc:
+                print(f'Bad query: {exc}')
+                return 2
+            elapsed = (time.perf_counter() - start) * 1000
+            for result in results:
+                snippet = ' '.join(result['snippet'].split())
+                print(f"{result['score']:7.2f}  {result['title']}\n         {result['url']}\n         {snippet}")
+            print(f'{len(results)} matches in {elapsed:.1f} ms')
+        elif args.command == 'get':
+            record = store.get(args.url)
+            if record is None:
+                print(f'No recipe stored for {args.url}')
+                return 1
+            print(json.dumps(record, indent=2, ensure_ascii=False))
+        else:
+            print(store.count())
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
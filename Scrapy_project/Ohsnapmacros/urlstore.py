@@ -0,0 +1,151 @@
+"""URL canonicalization and a persistent fingerprint store.
+
+`canonicalize_url` maps the many spellings of one page (tracking parameters,
+fragments, missing trailing slash, upper-case host) to a single URL. It is only
+a de-duplication key: requests still fetch the URL as it was found.
+`CanonicalDupeFilter` fingerprints requests on that canonical form and, for requests
+marked with ``meta['persist_fingerprint']``, also skips pages that a previous
+run fetched within FINGERPRINT_FRESHNESS_DAYS, using an SQLite file that
+survives between runs.
+"""
+import hashlib
+import os
+import sqlite3
+import time
+from typing import Optional
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+from scrapy import signals
+from scrapy.dupefilters import RFPDupeFilter
+from w3lib.url import canonicalize_url as w3lib_canonicalize_url
+
+
+TRACKING_PREFIXES = ('utm_', 'mc_', 'pk_', 'hsa_')
+TRACKING_PARAMS = {'fbclid', 'gclid', 'dclid', 'gbraid', 'wbraid', 'msclkid', 'igshid', 'yclid',
+                   'twclid', 'ttclid', '_ga', '_gl', '_hsenc', '_hsmi', 'mkt_tok'}
+DEFAULT_STORE_PATH = 'fingerprints.sqlite3'
+DEFAULT_FRESHNESS_DAYS = 7
+
+
+def canonicalize_url(url: str) -> str:
+    """Return the canonical form of url used for de-duplication."""
+    url = w3lib_canonicalize_url(url.strip(), keep_fragments=False)
+    parts = urlsplit(url)
+    query = [(k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True)
+             if k.lower() not in TRACKING_PARAMS and not k.lower().startswith(TRACKING_PREFIXES)]
+    netloc = parts.netloc.lower()
+    if parts.port in (80, 443) and netloc.endswith(f':{parts.port}'):
+        netloc = netloc.rsplit(':', 1)[0]
+    # Paths are case-sensitive on most servers, so only the host is lower-cased
+    path = parts.path or '/'
+    while '//' in path:
+        path = path.replace('//', '/')
+    # WordPress permalinks end in '/'; leave file-like paths (feed.xml, image.jpg) alone
+    if not path.endswith('/') and '.' not in path.rsplit('/', 1)[-1]:
+        path += '/'
+    return urlunsplit((parts.scheme.lower(), netloc, path, urlencode(query), ''))
+
+
+def url_fingerprint(url: str) -> str:
+    return hashlib.sha1(canonicalize_url(url).encode('utf-8')).hexdigest()
+
+
+class FingerprintStore:
+    """SQLite table of canonical-URL fingerprints and when each page was last fetched."""
+
+    def __init__(self, path: str = DEFAULT_STORE_PATH, commit_every: int = 100):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.conn = sqlite3.connect(path)
+        self.conn.execute(
+            'CREATE TABLE IF NOT EXISTS fingerprints ('
+            ' fp TEXT PRIMARY KEY, url TEXT NOT NULL, fetched_at REAL NOT NULL)'
+        )
+        self.commit_every = commit_every
+        self._uncommitted = 0
+
+    def fetched_at(self, fp: str) -> Optional[float]:
+        row = self.conn.execute('SELECT fetched_at FROM fingerprints WHERE fp = ?', (fp,)).fetchone()
+        return row[0] if row else None
+
+    def is_fresh(self, fp: str, max_age: float) -> bool:
+        fetched_at = self.fetched_at(fp)
+        return fetched_at is not None and time.time() - fetched_at < max_age
+
+    def mark(self, fp: str, url: str) -> None:
+        self.conn.execute(
+            'INSERT OR REPLACE INTO fingerprints (fp, url, fetched_at) VALUES (?, ?, ?)',
+            (fp, url, time.time()),
+        )
+        self._uncommitted += 1
+        if self._uncommitted >= self.commit_every:
+            self.commit()
+
+    def commit(self) -> None:
+        self.conn.commit()
+        self._uncommitted = 0
+
+    def close(self) -> None:
+        self.commit()
+        self.conn.close()
+
+
+class CanonicalRequestFingerprinter:
+    """Wraps a request fingerprinter so it fingerprints the canonical URL.
+
+    Only the dupefilter uses it; the HTTP cache and other components keep
+    fingerprinting the URL that is actually fetched.
+    """
+
+    def __init__(self, fingerprinter):
+        self.fingerprinter = fingerprinter
+
+    def fingerprint(self, request) -> bytes:
+        return self.fingerprinter.fingerprint(request.replace(url=canonicalize_url(request.url)))
+
+
+class CanonicalDupeFilter(RFPDupeFilter):
+    """RFPDupeFilter on canonical URLs, plus a cross-run freshness check.
+
+    Settings:
+    - FINGERPRINT_STORE_PATH: SQLite file for fetched fingerprints.
+    - FINGERPRINT_FRESHNESS_DAYS: skip persisted pages fetched more recently
+      than this; 0 turns the cross-run check off.
+    """
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        df = super().from_crawler(crawler)
+        df.fingerprinter = CanonicalRequestFingerprinter(df.fingerprinter)
+        settings = crawler.settings
+        df.max_age = settings.getfloat('FINGERPRINT_FRESHNESS_DAYS', DEFAULT_FRESHNESS_DAYS) * 24 * 60 * 60
+        df.store = FingerprintStore(settings.get('FINGERPRINT_STORE_PATH', DEFAULT_STORE_PATH))
+        df.stats = crawler.stats
+        crawler.signals.connect(df.response_received, signal=signals.response_received)
+        return df
+
+    def request_seen(self, request) -> bool:
+        if super().request_seen(request):
+            return True
+        if self.max_age > 0 and request.meta.get('persist_fingerprint'):
+            if self.store.is_fresh(url_fingerprint(request.url), self.max_age):
+                self.stats.inc_value('fingerprints/fresh_skipped')
+                return True
+        return False
+
+    def response_received(self, response, request, spider):
+        if response.status != 200 or not request.meta.get('persist_fingerprint'):
+            return
+        # Record the original URL too when the request was redirected
+        for url in request.meta.get('redirect_urls', []) + [request.url]:
+            self.store.mark(url_fingerprint(url), url)
+        self.stats.inc_value('fingerprints/stored')
+
+    def checkpoint(self) -> None:
+        """Commit pending fingerprints; used by the CrawlCheckpoint extension."""
+        self.store.commit()
+
+    def close(self, reason):
+        self.store.close()
+        return super().close(reason)
@@ -0,0 +1,361 @@
+"""Background JSON lines writer for pipeline output.
+
+`BatchedJsonlWriter.write` only puts the item on a bounded queue; a worker
+thread serializes whatever has queued up as one batch and writes it with a
+single call, so the reactor thread never waits on json.dumps or disk I/O
+unless the queue is full. Output can be gzip or zstd compressed (zstd needs
+the optional ``zstandard`` package) and is split into numbered parts by size
+or record count:
+
+    recipes_valid.jl, recipes_valid.0001.jl, recipes_valid.0002.jl, ...
+
+With resume on, the URLs already in the parts are loaded so they are not
+written twice, and writing continues in the last part (uncompressed, after
+cutting off a torn last line) or in a new part (compressed, because a torn
+compressed stream cannot be appended to safely).
+"""
+import glob
+import gzip
+import json
+import os
+import queue
+import re
+import threading
+from typing import Dict, Iterator, List, Optional, Set
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+COMPRESSION_SUFFIXES = {None: '', 'gzip': '.gz', 'zstd': '.zst'}
+
+_FLUSH = object()
+_CLOSE = object()
+
+
+class BatchedJsonlWriter:
+    """Writes dict records as JSON lines from a background thread.
+
+    max_bytes / max_records: start a new part once the current one reaches
+    this many bytes on disk or records; 0 means no limit.
+    """
+
+    def __init__(self, path: str, compression: Optional[str] = None, batch_size: int = 100,
+                 queue_size: int = 1000, max_bytes: int = 0, max_records: int = 0,
+                 resume: bool = True, key: str = 'url'):
+        if compression not in COMPRESSION_SUFFIXES:
+            raise ValueError(f'compression must be one of {sorted(c for c in COMPRESSION_SUFFIXES if c)} or None, '
+                             f'not {compression!r}')
+        if compression == 'zstd' and zstandard is None:
+            raise ImportError('zstd output needs the zstandard package (pip install zstandard)')
+        self.path = path
+        self.compression = compression
+        self.suffix = COMPRESSION_SUFFIXES[compression]
+        self.batch_size = batch_size
+        self.max_bytes = max_bytes
+        self.max_records = max_records
+        self.key = key
+        self.seen: Set[str] = set()
+        self.written = 0
+        self.skipped = 0
+        self.batches = 0
+        self.rotations = 0
+        self._error: Optional[BaseException] = None
+        self._queue: queue.Queue = queue.Queue(maxsize=queue_size)
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        parts = self.parts()
+        part_records = {}
+        if resume:
+            for part in parts:
+                part_records[part] = self._load_keys(part)
+        else:
+            for part in parts:
+                os.remove(part)
+            parts = []
+        if parts and compression is None:
+            self._index = self._part_index(parts[-1])
+        else:
+            self._index = self._part_index(parts[-1]) + 1 if parts else 0
+        self._open()
+        # Appending to an existing part: its records count towards max_records
+        self._part_records = part_records.get(self._raw.name, 0)
+        self._thread = threading.Thread(target=self._run, name='BatchedJsonlWriter', daemon=True)
+        self._thread.start()
+
+    # -- file naming ---------------------------------------------------------
+
+    def _part_path(self, index: int) -> str:
+        if index == 0:
+            return self.path + self.suffix
+        root, ext = os.path.splitext(self.path)
+        return f'{root}.{index:04d}{ext}{self.suffix}'
+
+    def _part_index(self, part: str) -> int:
+        if part == self.path + self.suffix:
+            return 0
+        root, ext = os.path.splitext(self.path)
+        match = re.search(r'\.(\d{4,})' + re.escape(ext + self.suffix) + '$', part)
+        return int(match.group(1))
+
+    def parts(self) -> List[str]:
+        """Existing output parts, in write order."""
+        return output_parts(self.path, self.compression)
+
+    # -- resume ---------------------------------------------------------------
+
+    def _load_keys(self, part: str) -> int:
+        """Add the keys in part to self.seen; returns the number of records read."""
+        if self.compression is None:
+            self._truncate_torn_tail(part)
+        count = 0
+        for key in read_keys(part, self.compression, self.key):
+            self.seen.add(key)
+            count += 1
+        return count
+
+    @staticmethod
+    def _truncate_torn_tail(part: str) -> None:
+        with open(part, 'rb+') as fp:
+            fp.seek(0, os.SEEK_END)
+            size = fp.tell()
+            if size == 0:
+                return
+            fp.seek(max(0, size - 1))
+            if fp.read(1) == b'\n':
+                return
+            # Walk back to the last complete line
+            pos = size
+            while pos > 0:
+                step = min(65536, pos)
+                fp.seek(pos - step)
+                chunk = fp.read(step)
+                newline = chunk.rfind(b'\n')
+                if newline != -1:
+                    fp.truncate(pos - step + newline + 1)
+                    return
+                pos -= step
+            fp.truncate(0)
+
+    # -- writing --------------------------------------------------------------
+
+    def _open(self) -> None:
+        part = self._part_path(self._index)
+        self._raw = open(part, 'ab')
+        if self.compression == 'gzip':
+            self._file = gzip.GzipFile(fileobj=self._raw, mode='ab')
+        elif self.compression == 'zstd':
+            self._file = zstandard.ZstdCompressor().stream_writer(self._raw, closefd=False)
+        else:
+            self._file = self._raw
+        self._part_records = 0
+
+    def _close_file(self) -> None:
+        if self._file is not self._raw:
+            self._file.close()
+        self._raw.close()
+
+    def _rotate_if_full(self) -> None:
+        full = ((self.max_records and self._part_records >= self.max_records) or
+                (self.max_bytes and self._raw.tell() >= self.max_bytes))
+        if full:
+            self._close_file()
+            self._index += 1
+            self.rotations += 1
+            self._open()
+
+    def _write_batch(self, batch: List[Dict]) -> None:
+        start = 0
+        while start < len(batch):
+            # Rotate before writing, so a resumed part that is already full
+            # (or over max_records) is never written to
+            self._rotate_if_full()
+            # Never write past max_records in one part, even within a batch
+            end = len(batch)
+            if self.max_records:
+                end = min(end, start + self.max_records - self._part_records)
+            data = ''.join(json.dumps(record, ensure_ascii=False) + '\n' for record in batch[start:end])
+            self._file.write(data.encode('utf-8'))
+            self._part_records += end - start
+            self.written += end - start
+            start = end
+        self.batches += 1
+
+    def _flush_file(self) -> None:
+        if self.compression == 'zstd':
+            self._file.flush(zstandard.FLUSH_FRAME)
+        else:
+            self._file.flush()
+        self._raw.flush()
+
+    def _run(self) -> None:
+        try:
+            self._process_queue()
+        except BaseException as exc:
+            # flush(), close() and write() see the thread is gone and raise this
+            if self._error is None:
+                self._error = exc
+            raise
+
+    def _process_queue(self) -> None:
+        while True:
+            message = self._queue.get()
+            batch = []
+            markers = []
+            while True:
+                if message is _FLUSH or message is _CLOSE:
+                    markers.append(message)
+                    break
+                batch.append(message)
+                if len(batch) >= self.batch_size:
+                    break
+                try:
+                    message = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+            try:
+                if batch and self._error is None:
+                    self._write_batch(batch)
+                if markers and self._error is None:
+                    self._flush_file()
+            except Exception as exc:
+                self._error = exc
+            for _ in range(len(batch) + len(markers)):
+                self._queue.task_done()
+            if _CLOSE in markers:
+                self._close_file()
+                return
+
+    def _raise_error(self) -> None:
+        if self._error is not None:
+            raise self._error
+
+    def _check_thread(self) -> None:
+        self._raise_error()
+        if not self._thread.is_alive():
+            raise RuntimeError('BatchedJsonlWriter thread has stopped')
+
+    def _put(self, message) -> None:
+        # A plain put() would block forever on a full queue once the thread has died
+        while True:
+            self._check_thread()
+            try:
+                self._queue.put(message, timeout=0.1)
+                return
+            except queue.Full:
+                pass
+
+    def _join(self) -> None:
+        # Like queue.join(), but gives up when the writer thread dies
+        with self._queue.all_tasks_done:
+            while self._queue.unfinished_tasks:
+                if not self._thread.is_alive():
+                    break
+                self._queue.all_tasks_done.wait(0.1)
+        self._raise_error()
+
+    def write(self, record: Dict) -> bool:
+        """Queue one record. Returns False (and queues nothing) if its key was written before.
+
+        Blocks only when the queue is full.
+        """
+        self._raise_error()
+        key = record.get(self.key)
+        if key in self.seen:
+            self.skipped += 1
+            return False
+        self._put(record)
+        self.seen.add(key)
+        return True
+
+    def flush(self) -> None:
+        """Wait until every queued record is written and flushed to the OS.
+
+        Raises the writer thread's error instead of waiting if it failed.
+        """
+        self._put(_FLUSH)
+        self._join()
+        self._check_thread()
+
+    def close(self) -> None:
+        if not self._thread.is_alive():
+            self._raise_error()
+            return
+        self._put(_CLOSE)
+        self._thread.join()
+        self._raise_error()
+
+    def position(self) -> Dict:
+        """Current part and its size on disk; call flush() first for an exact offset."""
+        return {'path': self._raw.name, 'offset': self._raw.tell(), 'written': self.written}
+
+    def summary(self) -> str:
+        return (f'written={self.written}, skipped={self.skipped}, batches={self.batches}, '
+                f'parts={self._index + 1}, rotations={self.rotations}')
+
+
+def output_parts(path: str, compression: Optional[str] = None) -> List[str]:
+    """The output parts written for path, in write order."""
+    suffix = COMPRESSION_SUFFIXES[compression]
+    root, ext = os.path.splitext(path)
+    pattern = re.compile(re.escape(root) + r'\.(\d{4,})' + re.escape(ext + suffix) + '$')
+    rotated = [p for p in glob.glob(glob.escape(root) + '.*' + ext + suffix) if pattern.match(p)]
+    first = [path + suffix] if os.path.exists(path + suffix) else []
+    return first + sorted(rotated, key=lambda p: int(pattern.match(p).group(1)))
+
+
+def read_records(part: str, compression: Optional[str] = None) -> Iterator[Dict]:
+    """Every complete record in one part.
+
+    Lines that are not JSON objects are skipped; a compressed part cut off by
+    a crash yields the records before the cut.
+    """
+    if compression is None:
+        opener = open(part, 'rb')
+    elif compression == 'gzip':
+        opener = gzip.open(part, 'rb')
+    else:
+        opener = zstandard.ZstdDecompressor().stream_reader(open(part, 'rb'), closefd=True)
+    try:
+        with opener as fp:
+            for line in fp if compression != 'zstd' else _lines(fp):
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                if isinstance(record, dict):
+                    yield record
+    except (EOFError, OSError, ValueError, getattr(zstandard, 'ZstdError', OSError)):
+        pass
+
+
+def read_keys(part: str, compression: Optional[str] = None, key: str = 'url') -> Iterator:
+    """The key of every complete record in one part (see read_records)."""
+    for record in read_records(part, compression):
+        yield record.get(key)
+
+
+def written_keys(path: str, compression: Optional[str] = None, key: str = 'url') -> Set:
+    """The keys of every record in the output parts for path (read only, nothing is truncated)."""
+    keys = set()
+    for part in output_parts(path, compression):
+        keys.update(read_keys(part, compression, key))
+    return keys
+
+
+def _lines(stream, chunk_size: int = 65536):
+    """Split a binary stream without line iteration (zstd readers) into lines."""
+    pending = b''
+    while True:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            break
+        pending += chunk
+        *lines, pending = pending.split(b'\n')
+        yield from lines
+    if pending:
+        yield pending
@@ -1,16 +1,181 @@
+import argparse
+import math
+import multiprocessing
+import os
+import shutil
+import sys
+
 from scrapy.crawler import CrawlerProcess
-from scrapy.settings import Settings
-
-# Build settings programmatically to avoid importing the project's settings module
-settings = Settings()
-settings.set('CLOSESPIDER_ITEMCOUNT', 3)
-settings.set('ITEM_PIPELINES', {})
-settings.set('LOG_LEVEL', 'INFO')
-# Point SPIDER_MODULES to the importable package (the existing capitalized one is importable)
-settings.set('SPIDER_MODULES', ['Ohsnapmacros.spiders'])
-settings.set('NEWSPIDER_MODULE', 'Ohsnapmacros.spiders')
-settings.set('FEEDS', {'out.jl': {'format': 'jl', 'encoding': 'utf-8'}})
-
-process = CrawlerProcess(settings)
-process.crawl('ohsnap')
-process.start()
+from scrapy.utils.project import get_project_settings
+
+from ohsnapmacros import sharding
+from ohsnapmacros.checkpoint import read_checkpoint, restore_checkpoint
+from ohsnapmacros.spiders.ohsnap_spider import OhsnapSpider
+
+# Crawl state lives in --jobdir: the pending request queue, the seen-request
+# fingerprints and checkpoint.json, written every --checkpoint-interval seconds.
+# If a run is killed, `python run_spider.py --resume` continues from the last
+# checkpoint instead of starting over from start_urls.
+#
+# With --workers N the crawl runs in N processes (see ohsnapmacros/sharding.py).
+# Worker i keeps its state in --jobdir/shard-i and writes out.shard-i.jl; the
+# requests worker 0 forwards to the others are spooled in --jobdir/spool, so
+# they survive a kill too. The shard outputs are merged into --output, one
+# line per URL, when all are done.
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Run the ohsnap spider with resumable crawl state.')
+    parser.add_argument('--jobdir', default=os.path.join('crawls', 'ohsnap'),
+                        help='directory for the crawl state (default: crawls/ohsnap)')
+    parser.add_argument('--resume', action='store_true',
+                        help='continue the crawl saved in --jobdir instead of starting a new one')
+    parser.add_argument('--checkpoint-interval', type=float, default=60.0,
+                        help='seconds between checkpoints (default: 60)')
+    parser.add_argument('--max-items', type=int, default=3,
+                        help='stop after this many items, 0 for no limit (default: 3)')
+    parser.add_argument('--output', default='out.jl', help='JSON lines output file (default: out.jl)')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='crawler processes, each owning a hash partition of the recipe URLs (default: 1)')
+    return parser.parse_args()
+
+
+def prepare_jobdir(jobdir, resume):
+    """Roll jobdir back to its last checkpoint (resume) or remove it (new crawl)."""
+    if resume:
+        if read_checkpoint(jobdir) is None and not os.path.isdir(os.path.join(jobdir, 'requests.queue')):
+            sys.exit(f'Nothing to resume in {jobdir}')
+        state = restore_checkpoint(jobdir)
+        if state is not None and not state.get('clean'):
+            print(f"Restored the checkpoint in {jobdir} ({state['in_progress']} requests in flight)")
+    elif os.path.isdir(jobdir):
+        print(f'Starting a new crawl; removing the old state in {jobdir}')
+        shutil.rmtree(jobdir)
+
+
+def shard_path(path, index):
+    root, ext = os.path.splitext(path)
+    return f'{root}.shard-{index}{ext}'
+
+
+def state_path(output, name):
+    """A state file that belongs to one output file: out.jl -> out.dedup.sqlite3."""
+    root, _ = os.path.splitext(output)
+    return f'{root}.{name}'
+
+
+def build_settings(args, jobdir, output, max_items):
+    """The project settings (settings.py), with the crawl state and output of this run."""
+    os.environ.setdefault('SCRAPY_SETTINGS_MODULE', 'ohsnapmacros.settings')
+    settings = get_project_settings()
+    settings.set('CLOSESPIDER_ITEMCOUNT', max_items)
+    settings.set('LOG_LEVEL', 'INFO')
+    settings.set('JOBDIR', jobdir)
+    # FIFO disk queues can be rolled back to a checkpoint; the default LIFO ones cannot
+    settings.set('SCHEDULER_DISK_QUEUE', 'scrapy.squeues.PickleFifoDiskQueue')
+    settings.set('SCHEDULER_MEMORY_QUEUE', 'scrapy.squeues.FifoMemoryQueue')
+    settings.set('EXTENSIONS', {**settings.getdict('EXTENSIONS'), 'ohsnapmacros.checkpoint.CrawlCheckpoint': 900})
+    settings.set('CHECKPOINT_INTERVAL', args.checkpoint_interval)
+    # Output goes through ValidateAndWritePipeline instead of a feed export, so a
+    # resumed run skips the URLs already written instead of appending them again
+    settings.set('VALID_OUTPUT_PATH', output)
+    settings.set('VALID_OUTPUT_RESUME', args.resume)
+    settings.set('VALID_MIN_FIELDS', 0)
+    # The dedup and fetched-page stores describe what is in this output, so each
+    # output (and each shard's) gets its own
+    settings.set('DEDUP_STORE_PATH', state_path(output, 'dedup.sqlite3'))
+    settings.set('FINGERPRINT_STORE_PATH', state_path(output, 'fingerprints.sqlite3'))
+    # JOBDIR already remembers what this crawl fetched; skipping pages fetched by
+    # earlier runs would leave them out of a new crawl's (emptied) output
+    settings.set('FINGERPRINT_FRESHNESS_DAYS', 0)
+    return settings
+
+
+def shard_settings(settings, index, workers, spool_dir):
+    """Settings for worker index out of workers: its partition and its share of the politeness limits."""
+    settings.set('SPIDER_MIDDLEWARES', {**settings.getdict('SPIDER_MIDDLEWARES'),
+                                        'ohsnapmacros.sharding.ShardMiddleware': 50})
+    settings.set('SHARD_INDEX', index)
+    settings.set('SHARD_COUNT', workers)
+    settings.set('SHARD_SPOOL_DIR', spool_dir)
+    if index == sharding.DISCOVERY_SHARD:
+        # Closing the discovery shard at its item share would stop the other
+        # workers from getting URLs; it stops taking on its own recipes instead
+        settings.set('SHARD_ITEM_LIMIT', settings.getint('CLOSESPIDER_ITEMCOUNT'))
+        settings.set('CLOSESPIDER_ITEMCOUNT', 0)
+    # Every worker crawls the same host, so each gets 1/workers of the request
+    # rate: fewer slots and a longer delay, and the same for the limits the
+    # adaptive concurrency controller ramps up to. 'cmdline' priority so the
+    # spider's custom_settings do not override the shares.
+    base = settings.copy()
+    base.setdict(OhsnapSpider.custom_settings, priority='spider')
+    for name in ('CONCURRENT_REQUESTS', 'CONCURRENT_REQUESTS_PER_DOMAIN'):
+        settings.set(name, sharding.split_limit(base.getint(name), workers), priority='cmdline')
+    max_concurrency = base.getint('ADAPTIVE_MAX_CONCURRENCY', base.getint('CONCURRENT_REQUESTS_PER_DOMAIN'))
+    settings.set('ADAPTIVE_MAX_CONCURRENCY', sharding.split_limit(max_concurrency, workers), priority='cmdline')
+    settings.set('DOWNLOAD_DELAY', base.getfloat('DOWNLOAD_DELAY') * workers, priority='cmdline')
+    settings.set('ADAPTIVE_MIN_DELAY', base.getfloat('ADAPTIVE_MIN_DELAY', 0.25) * workers, priority='cmdline')
+    # Each worker serves its metrics on its own port and writes its own snapshot
+    if settings.getint('METRICS_PORT'):
+        settings.set('METRICS_PORT', settings.getint('METRICS_PORT') + index)
+    if settings.get('METRICS_SNAPSHOT_PATH'):
+        settings.set('METRICS_SNAPSHOT_PATH', shard_path(settings.get('METRICS_SNAPSHOT_PATH'), index))
+    return settings
+
+
+def spool_dir(args):
+    return os.path.join(args.jobdir, 'spool')
+
+
+def run_worker(args, index):
+    jobdir = os.path.join(args.jobdir, f'shard-{index}')
+    if args.resume:
+        # A worker that had not checkpointed yet just starts over in its partition
+        restore_checkpoint(jobdir)
+    max_items = math.ceil(args.max_items / args.workers) if args.max_items else 0
+    settings = shard_settings(build_settings(args, jobdir, shard_path(args.output, index), max_items),
+                              index, args.workers, spool_dir(args))
+    process = CrawlerProcess(settings)
+    process.crawl('ohsnap')
+    process.start()
+
+
+def run_sharded(args):
+    if not args.resume and os.path.isdir(args.jobdir):
+        print(f'Starting a new crawl; removing the old state in {args.jobdir}')
+        shutil.rmtree(args.jobdir)
+    sharding.start_discovery(spool_dir(args))
+    context = multiprocessing.get_context('spawn')
+    workers = [context.Process(target=run_worker, args=(args, i), name=f'shard-{i}')
+               for i in range(args.workers)]
+    for worker in workers:
+        worker.start()
+    # Only the discovery shard finds new recipe URLs; once it has exited
+    # (finished or not) the other workers can stop waiting for more
+    workers[sharding.DISCOVERY_SHARD].join()
+    sharding.finish_discovery(spool_dir(args))
+    for worker in workers:
+        worker.join()
+    failed = [worker.name for worker in workers if worker.exitcode]
+    if failed:
+        print(f"Workers {', '.join(failed)} exited with an error; merging what they wrote")
+    outputs = [shard_path(args.output, i) for i in range(args.workers)]
+    compression = build_settings(args, args.jobdir, args.output, 0).get('VALID_OUTPUT_COMPRESSION') or None
+    counts = sharding.merge_outputs(outputs, args.output, compression=compression)
+    print(f"Merged {counts['read']} records from {args.workers} workers into {args.output} "
+          f"({counts['written']} unique URLs)")
+
+
+def main():
+    args = parse_args()
+    if args.workers > 1:
+        run_sharded(args)
+        return
+    prepare_jobdir(args.jobdir, args.resume)
+    process = CrawlerProcess(build_settings(args, args.jobdir, args.output, args.max_items))
+    process.crawl('ohsnap')
+    process.start()
+
+
+if __name__ == '__main__':
+    main()
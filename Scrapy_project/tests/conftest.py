@@ -0,0 +1,27 @@
+import os
+import sys
+import types
+
+import pytest
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PACKAGE_DIR = os.path.join(PROJECT_DIR, 'Ohsnapmacros')
+
+# scrapy.cfg imports the package as `ohsnapmacros`, but the directory is
+# `Ohsnapmacros` and its __init__ rejects that old name. Register the
+# lowercase package without running __init__ so the modules import the same
+# way they do under `scrapy crawl` on a case-insensitive filesystem.
+if 'ohsnapmacros' not in sys.modules:
+    package = types.ModuleType('ohsnapmacros')
+    package.__path__ = [PACKAGE_DIR]
+    package.__file__ = os.path.join(PACKAGE_DIR, '__init__.py')
+    sys.modules['ohsnapmacros'] = package
+if PROJECT_DIR not in sys.path:
+    sys.path.insert(0, PROJECT_DIR)
+
+
+@pytest.fixture
+def in_tmp(tmp_path, monkeypatch):
+    """Run the test from an empty directory, so relative store/cache paths land there."""
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
@@ -0,0 +1,99 @@
+from types import SimpleNamespace
+from urllib.parse import urlparse
+
+import pytest
+import scrapy
+from scrapy.exceptions import NotConfigured
+from scrapy.http import Response
+from scrapy.utils.test import get_crawler
+
+from ohsnapmacros.middlewares import AdaptiveConcurrencyMiddleware
+from ohsnapmacros.robots import RobotsStore
+
+HOST = 'ohsnapmacros.com'
+
+
+class Downloader:
+    """The two downloader attributes the middleware uses, with one slot per host."""
+
+    def __init__(self):
+        self.slots = {}
+
+    def get_slot_key(self, request):
+        return urlparse(request.url).netloc
+
+
+def _middleware(tmp_path, **settings):
+    settings = {'ADAPTIVE_CONCURRENCY_ENABLED': True, 'AUTOTHROTTLE_ENABLED': False,
+                'ROBOTSTXT_CACHE_DIR': str(tmp_path / 'robots'), 'DOWNLOAD_DELAY': 1.0,
+                'ADAPTIVE_MIN_DELAY': 0.25, 'ADAPTIVE_DELAY_STEP': 0.25, 'ADAPTIVE_MAX_CONCURRENCY': 4,
+                'ADAPTIVE_TARGET_LATENCY': 2.0, **settings}
+    crawler = get_crawler(scrapy.Spider, settings)
+    crawler.stats.open_spider()
+    crawler.engine = SimpleNamespace(downloader=Downloader())
+    crawler.engine.downloader.slots[HOST] = SimpleNamespace(concurrency=1, delay=1.0)
+    return AdaptiveConcurrencyMiddleware.from_crawler(crawler), crawler
+
+
+def _respond(mw, status=200, latency=0.1, **headers):
+    request = scrapy.Request(f'https://{HOST}/r/', meta={'download_latency': latency})
+    mw.process_request(request, None)
+    return mw.process_response(request, Response(request.url, status=status, headers=headers), None)
+
+
+def test_refuses_to_run_alongside_autothrottle(tmp_path):
+    with pytest.raises(NotConfigured):
+        _middleware(tmp_path, AUTOTHROTTLE_ENABLED=True)
+    with pytest.raises(NotConfigured):
+        _middleware(tmp_path, ADAPTIVE_CONCURRENCY_ENABLED=False)
+
+
+def test_healthy_responses_shrink_the_delay_then_add_concurrency(tmp_path):
+    mw, crawler = _middleware(tmp_path)
+    slot = crawler.engine.downloader.slots[HOST]
+    for _ in range(3):
+        _respond(mw)
+    assert (slot.concurrency, slot.delay) == (1, 0.25)
+    for _ in range(1 + 2 + 3 + 10):
+        _respond(mw)
+    assert slot.concurrency == 4
+    assert crawler.stats.get_value(f'adaptive/{HOST}/concurrency') == 4
+    assert crawler.stats.get_value(f'adaptive/{HOST}/delay_ms') == 250
+
+
+def test_throttling_backs_off_once_per_window_and_honours_retry_after(tmp_path):
+    mw, crawler = _middleware(tmp_path)
+    slot = crawler.engine.downloader.slots[HOST]
+    mw.hosts[HOST] = mw._state(HOST, f'https://{HOST}/')
+    mw.hosts[HOST].concurrency = 4
+    for _ in range(3):
+        _respond(mw, status=429, **{'Retry-After': '5'})
+    assert (slot.concurrency, slot.delay) == (2, 5.0)
+    assert crawler.stats.get_value('adaptive/backoff_throttled') == 1
+    assert crawler.stats.get_value(f'adaptive/{HOST}/throttle_rate') > 0
+
+
+def test_errors_and_slow_responses_slow_the_host_down(tmp_path):
+    mw, crawler = _middleware(tmp_path)
+    slot = crawler.engine.downloader.slots[HOST]
+    request = scrapy.Request(f'https://{HOST}/r/')
+    mw.process_exception(request, TimeoutError(), None)
+    assert slot.delay == 2.0
+    assert crawler.stats.get_value('adaptive/backoff_error') == 1
+
+    mw, crawler = _middleware(tmp_path)
+    slot = crawler.engine.downloader.slots[HOST]
+    mw.hosts[HOST] = mw._state(HOST, f'https://{HOST}/')
+    mw.hosts[HOST].concurrency = 3
+    _respond(mw, latency=5.0)
+    assert (slot.concurrency, slot.delay) == (2, 1.25)
+    assert crawler.stats.get_value('adaptive/slow_down') == 1
+
+
+def test_robots_crawl_delay_is_the_floor(tmp_path):
+    # Stored by an earlier run; two shards each wait twice the Crawl-delay
+    RobotsStore(str(tmp_path / 'robots')).put(HOST, f'https://{HOST}/robots.txt', 'User-agent: *\nCrawl-delay: 3\n')
+    mw, crawler = _middleware(tmp_path, SHARD_COUNT=2)
+    for _ in range(5):
+        _respond(mw)
+    assert crawler.engine.downloader.slots[HOST].delay == 6.0
@@ -0,0 +1,71 @@
+import os
+
+from queuelib import FifoDiskQueue
+
+from ohsnapmacros.checkpoint import read_checkpoint, restore_checkpoint, write_checkpoint
+
+
+def _queue_state(q):
+    q._saveinfo(q.info)
+    return {'path': q.path, 'info': dict(q.info), 'head_bytes': os.path.getsize(q.headf.name)}
+
+
+def _drain(path, chunksize):
+    q = FifoDiskQueue(path, chunksize=chunksize)
+    items = [q.pop() for _ in range(len(q))]
+    q.close()
+    return items
+
+
+def _checkpoint(jobdir, queue, seen_bytes):
+    write_checkpoint(str(jobdir), {'clean': False, 'time': 0, 'pipelines': {}, 'queues': [queue],
+                                   'active': None, 'in_progress': 0, 'requests_seen_bytes': seen_bytes})
+
+
+def test_restore_rolls_the_queue_and_fingerprints_back(tmp_path):
+    path = str(tmp_path / 'requests.queue' / 'p0')
+    q = FifoDiskQueue(path, chunksize=100)
+    for i in range(5):
+        q.push(b'r%d' % i)
+    q.pop()
+    seen = tmp_path / 'requests.seen'
+    seen.write_bytes(b'fp0\n')
+    _checkpoint(tmp_path, _queue_state(q), 4)
+
+    # Work done after the checkpoint, then a kill
+    for i in range(5, 8):
+        q.push(b'r%d' % i)
+    q.pop()
+    q.pop()
+    q.close()
+    with open(seen, 'ab') as fp:
+        fp.write(b'fp1\nfp2\n')
+
+    state = restore_checkpoint(str(tmp_path))
+    assert state['clean'] is False
+    assert seen.read_bytes() == b'fp0\n'
+    assert _drain(path, 100) == [b'r1', b'r2', b'r3', b'r4']
+
+
+def test_restore_skips_a_chunk_consumed_after_the_checkpoint(tmp_path):
+    path = str(tmp_path / 'requests.queue' / 'p0')
+    q = FifoDiskQueue(path, chunksize=2)
+    for i in range(5):
+        q.push(b'r%d' % i)
+    _checkpoint(tmp_path, _queue_state(q), 0)
+    for _ in range(3):
+        q.pop()
+    q.close()
+    assert not os.path.exists(os.path.join(path, 'q00000'))
+
+    restore_checkpoint(str(tmp_path))
+    assert _drain(path, 2) == [b'r2', b'r3', b'r4']
+
+
+def test_clean_checkpoint_is_left_alone(tmp_path):
+    seen = tmp_path / 'requests.seen'
+    seen.write_bytes(b'fp0\nfp1\n')
+    write_checkpoint(str(tmp_path), {'clean': True, 'requests_seen_bytes': 4, 'queues': []})
+    assert restore_checkpoint(str(tmp_path)) == read_checkpoint(str(tmp_path))
+    assert seen.read_bytes() == b'fp0\nfp1\n'
+    assert restore_checkpoint(str(tmp_path / 'missing')) is None
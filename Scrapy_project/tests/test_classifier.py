@@ -0,0 +1,70 @@
+import json
+
+from scrapy.utils.test import get_crawler
+
+from ohsnapmacros.classifier import RecipeUrlClassifier, is_recipe_record, url_tokens
+from ohsnapmacros.spiders.ohsnap_spider import OhsnapSpider
+
+SITE = 'https://ohsnapmacros.com'
+
+
+def test_url_tokens():
+    assert url_tokens(f'{SITE}/high-protein-dill-dip/?x=1') == {'high', 'protein', 'dill', 'dip'}
+
+
+def test_structural_pages_score_zero():
+    classifier = RecipeUrlClassifier()
+    for path in ('/', '/category/dinner/', '/tag/low-carb/', '/shop/', '/page/3/', '/wp-login.php',
+                 '/recipes/page/2/', '/privacy-policy/', '/cart'):
+        assert classifier.score(SITE + path) == 0.0
+    # Slugs that merely start with a structural word are still scored
+    for path in ('/shopska-salad/', '/production-day-protein-bowls/', '/pagespeed-muffins/', '/tagine/'):
+        assert classifier.score(SITE + path) > 0.0
+
+
+def test_slug_keywords_and_sitemaps_move_the_score():
+    classifier = RecipeUrlClassifier()
+    recipe = classifier.score(f'{SITE}/protein-chicken-tacos/')
+    post = classifier.score(f'{SITE}/macro-friendly-costco-haul/')
+    assert post < 0.5 < recipe
+    classifier.add_sitemap_urls([f'{SITE}/macro-friendly-costco-haul'])
+    assert classifier.score(f'{SITE}/macro-friendly-costco-haul/') > post
+
+
+def test_history_is_learned_and_generalized(in_tmp):
+    records = [{'url': f'{SITE}/{food}-stuffed-peppers/', 'ingredients': ['1 pepper']}
+               for food in ('beef', 'turkey', 'lentil')]
+    records += [{'url': f'{SITE}/{store}-grocery-list/', 'ingredients': []} for store in ('aldi', 'target')]
+    with open('recipes.jl', 'w', encoding='utf-8') as fp:
+        fp.write('\n'.join(json.dumps(r) for r in records) + '\n{"url": torn')
+
+    classifier = RecipeUrlClassifier()
+    assert classifier.learn_from_file('recipes.jl') == 5
+    assert classifier.score(f'{SITE}/beef-stuffed-peppers') == 0.95
+    assert classifier.score(f'{SITE}/aldi-grocery-list/') == 0.05
+    assert classifier.score(f'{SITE}/tofu-stuffed-peppers/') > 0.5 > classifier.score(f'{SITE}/costco-grocery-list/')
+
+
+def test_relearning_a_url_replaces_its_counts():
+    classifier = RecipeUrlClassifier()
+    classifier.learn(f'{SITE}/dip/', False)
+    classifier.learn(f'{SITE}/dip/', True)
+    classifier.learn(f'{SITE}/dip', True)
+    assert classifier.page_counts == [1, 0]
+    assert classifier.token_counts['dip'] == [1, 0]
+    assert is_recipe_record({'instructions': ['Mix.']})
+    assert not is_recipe_record({'ingredients': [], 'instructions': []})
+
+
+def test_spider_skips_low_scores_and_prioritizes_likely_recipes(in_tmp):
+    crawler = get_crawler(OhsnapSpider, {'RECIPE_CLASSIFIER_HISTORY': [], 'RECIPE_CLASSIFIER_MIN_SCORE': 0.2})
+    crawler.stats.open_spider()
+    spider = OhsnapSpider.from_crawler(crawler)
+    assert spider.recipe_request(f'{SITE}/category/dinner/') is None
+    request = spider.recipe_request(f'{SITE}/Protein-Pancakes?utm_source=x')
+    # The URL is fetched as found; canonical forms are only used as dedup keys
+    assert request.url == f'{SITE}/Protein-Pancakes?utm_source=x'
+    assert request.priority == int(request.meta['recipe_score'] * 100) > 50
+    assert request.meta['persist_fingerprint']
+    assert crawler.stats.get_value('classifier/skipped') == 1
+    assert crawler.stats.get_value('classifier/scheduled') == 1
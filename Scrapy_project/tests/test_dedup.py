@@ -0,0 +1,206 @@
+import json
+import random
+
+import scrapy
+from scrapy import signals
+from scrapy.exceptions import DropItem
+from scrapy.utils.test import get_crawler
+
+from ohsnapmacros.dedup import DedupStore, hamming, simhash
+from ohsnapmacros.pipelines import DedupPipeline, ValidateAndWritePipeline
+
+FOODS = ['oats', 'quinoa', 'lentils', 'tofu', 'salmon', 'turkey', 'chickpeas', 'spinach', 'mango', 'cocoa']
+
+
+def _recipe(i, **fields):
+    food = FOODS[i % len(FOODS)]
+    recipe = {
+        'url': f'https://ohsnapmacros.com/recipe-{i}/',
+        'title': f'{food.title()} bowl {i}',
+        'author': 'Ohsnapmacros',
+        'publish_date': '2024-01-01',
+        'categories': ['Dinner'],
+        'image': f'https://ohsnapmacros.com/{i}.jpg',
+        'servings': str(i + 1),
+        'prep_time': '10mins',
+        'cook_time': f'{i + 5}mins',
+        'total_time': f'{i + 15}mins',
+        'ingredients': [f'{i + 1} cups {food}', f'{i + 2} tbsp {FOODS[(i + 3) % len(FOODS)]} sauce', 'salt'],
+        'instructions': [f'Cook the {food} for {i + 5} minutes.', f'Serve {food} {i} warm.'],
+        'nutrition': f'Calories:{200 + i}kcal',
+    }
+    recipe.update(fields)
+    return recipe
+
+
+class Run:
+    """Both pipelines wired to one crawler, fed the way the scraper feeds them."""
+
+    def __init__(self, **settings):
+        settings = {'DEDUP_STORE_PATH': 'dedup.sqlite3', 'VALID_OUTPUT_PATH': 'out.jl', **settings}
+        self.crawler = get_crawler(scrapy.Spider, settings)
+        self.spider = scrapy.Spider('test')
+        self.stats = self.crawler.stats
+        self.stats.open_spider()
+        self.dedup = DedupPipeline.from_crawler(self.crawler)
+        self.validate = ValidateAndWritePipeline.from_crawler(self.crawler)
+        self.dedup.open_spider(self.spider)
+        self.validate.open_spider(self.spider)
+
+    def feed(self, item):
+        try:
+            for pipe in (self.dedup, self.validate):
+                item = pipe.process_item(item, self.spider)
+        except DropItem as exc:
+            self.crawler.signals.send_catch_log(signals.item_dropped, item=item, response=None,
+                                                exception=exc, spider=self.spider)
+            return
+        self.crawler.signals.send_catch_log(signals.item_scraped, item=item, response=None, spider=self.spider)
+
+    def close(self):
+        self.validate.close_spider(self.spider)
+        self.dedup.close_spider(self.spider)
+        return self.stats.get_stats()
+
+
+def _crawl(items, **settings):
+    run = Run(**settings)
+    for item in items:
+        run.feed(dict(item))
+    return run.close()
+
+
+def _output_urls(path='out.jl'):
+    with open(path, encoding='utf-8') as fp:
+        return [json.loads(line)['url'] for line in fp]
+
+
+def test_rerun_drops_unchanged_pages(in_tmp):
+    recipes = [_recipe(i) for i in range(5)]
+    assert _crawl(recipes)['dedup/new'] == 5
+    stats = _crawl(recipes)
+    assert stats['dedup/unchanged'] == 5
+    assert 'dedup/new' not in stats
+    assert len(_output_urls()) == 5
+
+
+def test_rerun_without_output_resume_writes_everything_again(in_tmp):
+    recipes = [_recipe(i) for i in range(5)]
+    _crawl(recipes)
+    stats = _crawl(recipes, VALID_OUTPUT_RESUME=False)
+    assert 'dedup/unchanged' not in stats
+    assert stats['dedup/new'] == 5
+    assert _output_urls() == [r['url'] for r in recipes]
+    # The index is kept, so content seen before is still recognized under a new URL
+    assert _crawl([dict(recipes[0], url='https://ohsnapmacros.com/copy/')],
+                  VALID_OUTPUT_RESUME=False)['dedup/exact'] == 1
+
+
+def test_dedup_reset_empties_the_store(in_tmp):
+    _crawl([_recipe(i) for i in range(5)])
+    stats = _crawl([_recipe(0)], DEDUP_RESET=True)
+    assert stats['dedup/new'] == 1
+    store = DedupStore('dedup.sqlite3')
+    assert store.count() == 1
+    store.close()
+
+
+def test_items_missing_from_the_output_are_written_again(in_tmp):
+    recipes = [_recipe(i) for i in range(5)]
+    _crawl(recipes)
+    # Lose the output's last two lines, as after a crash before the flush
+    with open('out.jl', encoding='utf-8') as fp:
+        lines = fp.readlines()
+    with open('out.jl', 'w', encoding='utf-8') as fp:
+        fp.writelines(lines[:3])
+
+    stats = _crawl(recipes)
+    assert stats['dedup/unchanged'] == 3
+    assert stats['dedup/new'] == 2
+    assert sorted(_output_urls()) == sorted(r['url'] for r in recipes)
+
+
+def test_fingerprint_of_an_item_dropped_later_is_not_stored(in_tmp):
+    thin = {'url': 'https://ohsnapmacros.com/thin/', 'title': 'Thin', 'ingredients': ['1 egg']}
+    _crawl([thin])
+    store = DedupStore('dedup.sqlite3')
+    assert store.count() == 0
+    store.close()
+    assert _crawl([thin])['dedup/new'] == 1
+
+
+def test_same_content_under_another_url_is_dropped_within_a_run(in_tmp):
+    first = _recipe(1)
+    copy = dict(first, url='https://ohsnapmacros.com/copy/')
+    stats = _crawl([first, copy])
+    assert stats['dedup/exact'] == 1
+    assert _output_urls() == [first['url']]
+
+    stats = _crawl([dict(copy, url='https://ohsnapmacros.com/copy-2/')])
+    assert stats['dedup/exact'] == 1
+
+
+def test_lightly_edited_copy_is_flagged_as_near_duplicate(in_tmp):
+    original = _recipe(1, ingredients=[
+        '1 cup rolled oats', '1 scoop vanilla protein powder', '1 ripe banana', '2 egg whites',
+        '1/2 cup unsweetened almond milk', '1 tsp baking powder', '1/2 tsp cinnamon', 'pinch of salt',
+    ], instructions=[
+        'Blend the oats into a fine flour.',
+        'Add the protein powder, banana, egg whites, almond milk, baking powder, cinnamon and salt.',
+        'Blend until smooth.',
+        'Heat a nonstick pan over medium heat and pour in a quarter of the batter.',
+        'Cook until bubbles form on top, then flip and cook for another minute.',
+    ])
+    edited = dict(original, url='https://ohsnapmacros.com/edited/',
+                  ingredients=original['ingredients'] + ['pepper'])
+    assert hamming(simhash(original), simhash(edited)) <= 4
+    _crawl([original])
+    assert _crawl([edited])['dedup/near'] == 1
+    with open('out.jl', encoding='utf-8') as fp:
+        last = json.loads(fp.readlines()[-1])
+    assert last['near_duplicate_of'] == original['url']
+
+
+def test_store_retain_forgets_other_urls(tmp_path):
+    store = DedupStore(str(tmp_path / 'dedup.sqlite3'))
+    for i in range(4):
+        recipe = _recipe(i)
+        store.put(recipe['url'], f'hash-{i}', simhash(recipe))
+    assert store.retain([_recipe(0)['url'], _recipe(2)['url']]) == 2
+    assert store.count() == 2
+    assert store.find_near(simhash(_recipe(1)), 'x', 0) is None
+    store.clear()
+    assert store.count() == 0
+    store.close()
+
+
+def test_find_near_matches_a_brute_force_scan(tmp_path):
+    rng = random.Random(3)
+    store = DedupStore(str(tmp_path / 'dedup.sqlite3'), commit_every=0)
+    hashes = {}
+    for i in range(300):
+        h = rng.getrandbits(64)
+        if i % 3 and hashes:
+            # A copy of an earlier hash with a few bits flipped
+            h = rng.choice(list(hashes.values()))
+            for bit in rng.sample(range(64), rng.randint(1, 6)):
+                h ^= 1 << bit
+        hashes[f'u{i}'] = h
+        store.put(f'u{i}', f'hash-{i}', h)
+    for url, h in list(hashes.items())[::7]:
+        for max_distance in (0, 2, 4):
+            near = [(hamming(h, other), u) for u, other in hashes.items()
+                    if u != url and hamming(h, other) <= max_distance]
+            expected = min(near)[::-1] if near else None
+            assert store.find_near(h, url, max_distance) == expected
+    store.close()
+
+
+def test_find_near_compares_at_most_max_candidates(tmp_path):
+    store = DedupStore(str(tmp_path / 'dedup.sqlite3'), max_candidates=1)
+    store.put('far', 'a', 0b111)
+    store.put('near', 'b', 0b1)
+    assert store.find_near(0, 'x', 3) == ('far', 3)
+    store.max_candidates = 2
+    assert store.find_near(0, 'x', 3) == ('near', 1)
+    store.close()
@@ -0,0 +1,97 @@
+import json
+
+import pytest
+from scrapy.http import HtmlResponse
+
+from ohsnapmacros.extraction import SelectorPlan, _minutes, extract_recipe, find_jsonld_recipe
+
+RECIPE = {
+    '@type': ['Recipe'],
+    'name': 'Protein Pancakes',
+    'author': {'@type': 'Person', 'name': 'Ohsnapmacros'},
+    'datePublished': '2024-01-02T08:00:00+00:00',
+    'image': ['https://ohsnapmacros.com/pancakes.jpg'],
+    'recipeYield': ['4', '4 pancakes'],
+    'prepTime': 'PT5M',
+    'cookTime': 'PT1H5M',
+    'totalTime': 'PT1H10M',
+    'recipeIngredient': ['1 cup oats', '2 eggs'],
+    'recipeInstructions': [
+        {'@type': 'HowToSection', 'name': 'Batter', 'itemListElement': [
+            {'@type': 'HowToStep', 'text': 'Blend everything.'}]},
+        {'@type': 'HowToStep', 'text': 'Cook for 2 minutes a side.'},
+    ],
+    'nutrition': {'@type': 'NutritionInformation', 'calories': '310 kcal', 'proteinContent': '24 g'},
+    'aggregateRating': {'ratingValue': '4.9'},
+}
+
+CSS_BODY = '''<h1 class="entry-title">Protein Pancakes</h1>
+<a rel="category tag">Breakfast</a>
+<span class="wprm-recipe-servings">4</span>
+<ul class="wprm-recipe-ingredients">
+  <li class="wprm-recipe-ingredient"><span class="wprm-recipe-ingredient-name">1 cup oats</span></li>
+  <li class="wprm-recipe-ingredient"><span class="wprm-recipe-ingredient-name">2 eggs</span></li>
+</ul>
+<ol class="wprm-recipe-instructions"><li>Blend everything.</li><li>Cook for 2 minutes a side.</li></ol>'''
+
+
+def _root(body, jsonld=None):
+    script = ''
+    if jsonld is not None:
+        script = f'<script type="application/ld+json">{json.dumps(jsonld)}</script>'
+    html = f'<html><head>{script}</head><body>{body}</body></html>'
+    return HtmlResponse('https://ohsnapmacros.com/protein-pancakes/', body=html.encode('utf-8')).selector.root
+
+
+@pytest.fixture(scope='module')
+def plan():
+    return SelectorPlan()
+
+
+@pytest.mark.parametrize('duration, minutes', [
+    ('PT5M', '5'), ('PT1H5M', '65'), ('P1DT45S', '1441'), ('PT90S', '2'), ('5 mins', '5 mins'), ('P', 'P'),
+])
+def test_iso_durations_become_minutes(duration, minutes):
+    assert _minutes(duration) == minutes
+
+
+def test_recipe_is_found_inside_a_graph():
+    root = _root('', {'@context': 'https://schema.org', '@graph': [{'@type': 'WebPage'}, RECIPE]})
+    assert find_jsonld_recipe(root)['name'] == 'Protein Pancakes'
+    assert find_jsonld_recipe(_root('<script type="application/ld+json">{broken</script>')) is None
+
+
+def test_jsonld_fields_fill_the_item_and_css_fills_the_gaps(plan):
+    item = extract_recipe(_root(CSS_BODY, RECIPE), plan)
+    assert item['extraction'] == 'jsonld'
+    assert item['author'] == 'Ohsnapmacros'
+    assert item['image'] == 'https://ohsnapmacros.com/pancakes.jpg'
+    assert item['servings'] == '4'
+    assert (item['prep_time'], item['cook_time'], item['total_time']) == ('5', '65', '70')
+    assert item['instructions'] == ['Blend everything.', 'Cook for 2 minutes a side.']
+    assert item['nutrition'] == 'Calories: 310 kcal, Protein: 24 g'
+    assert item['ratings'] == '4.9'
+    # No recipeCategory in the JSON-LD block, so the category link is used
+    assert item['categories'] == ['Breakfast']
+
+
+def test_pages_without_jsonld_use_the_compiled_selectors(plan):
+    item = extract_recipe(_root(CSS_BODY), plan)
+    assert item['extraction'] == 'css'
+    assert item['title'] == 'Protein Pancakes'
+    assert item['author'] is None
+    assert item['categories'] == ['Breakfast']
+
+
+def test_both_paths_agree_on_the_recipe(plan):
+    jsonld = extract_recipe(_root(CSS_BODY, RECIPE), plan)
+    css = extract_recipe(_root(CSS_BODY), plan)
+    for field in ('title', 'servings', 'ingredients', 'instructions', 'categories'):
+        assert jsonld[field] == css[field]
+
+
+def test_single_string_values_are_kept_whole(plan):
+    recipe = dict(RECIPE, recipeIngredient='1 cup oats, ground', recipeCategory='Breakfast, Brunch')
+    item = extract_recipe(_root('', recipe), plan)
+    assert item['ingredients'] == ['1 cup oats, ground']
+    assert item['categories'] == ['Breakfast, Brunch']
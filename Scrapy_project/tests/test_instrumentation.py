@@ -0,0 +1,120 @@
+import json
+
+import pytest
+import scrapy
+from scrapy import signals
+from scrapy.exceptions import DropItem, NotConfigured
+from scrapy.http import HtmlResponse
+from scrapy.utils.test import get_crawler
+
+from ohsnapmacros.instrumentation import (CallbackTimingMiddleware, CrawlMetrics, Histogram, MetricsRegistry,
+                                          drop_reason)
+
+
+class RecipeSpider(scrapy.Spider):
+    name = 'recipes'
+
+    def parse_recipe(self, response):
+        yield {'url': response.url}
+        yield scrapy.Request('https://ohsnapmacros.com/next/')
+        yield {'url': response.url + '#2'}
+        yield {'url': response.url + '#3'}
+
+
+def test_histogram_quantiles():
+    h = Histogram(buckets=(0.1, 1.0))
+    assert h.quantile(0.5) is None
+    for value in (0.05, 0.05, 0.5, 5.0):
+        h.observe(value)
+    assert (h.quantile(0.5), h.quantile(0.75), h.quantile(1.0)) == (0.1, 1.0, None)
+    assert h.to_dict()['count'] == 4
+
+
+def test_drop_reason_groups_messages():
+    assert drop_reason(DropItem('Dropped item with only 3 non-empty fields: https://x/')) == \
+        'Dropped item with only N non-empty fields'
+    assert drop_reason(DropItem('')) == 'DropItem'
+
+
+def test_disabled_metrics_are_not_configured():
+    crawler = get_crawler(RecipeSpider)
+    with pytest.raises(NotConfigured):
+        CrawlMetrics.from_crawler(crawler)
+    with pytest.raises(NotConfigured):
+        CallbackTimingMiddleware.from_crawler(crawler)
+
+
+def test_items_are_timed_through_the_pipeline_signals(tmp_path):
+    snapshot_path = tmp_path / 'metrics.json'
+    crawler = get_crawler(RecipeSpider, {'METRICS_ENABLED': True, 'METRICS_PORT': 0,
+                                         'METRICS_SNAPSHOT_PATH': str(snapshot_path)})
+    spider = RecipeSpider()
+    metrics = CrawlMetrics.from_crawler(crawler)
+    middleware = CallbackTimingMiddleware.from_crawler(crawler)
+    assert metrics.registry is middleware.registry is MetricsRegistry.for_crawler(crawler)
+
+    request = scrapy.Request('https://ohsnapmacros.com/recipe/', callback=spider.parse_recipe)
+    response = HtmlResponse(request.url, body=b'<html></html>', request=request)
+    output = list(middleware.process_spider_output(response, spider.parse_recipe(response), spider))
+    first, _, second, third = output
+
+    send = crawler.signals.send_catch_log
+    send(signals.item_scraped, item=first, response=response, spider=spider)
+    send(signals.item_dropped, item=second, response=response, exception=DropItem('Unchanged since: x'),
+         spider=spider)
+    send(signals.item_error, item=third, response=response, spider=spider, failure=None)
+
+    registry = metrics.registry
+    assert registry.callbacks['parse_recipe'].count == 1
+    assert registry.item_pipelines.count == 3
+    assert (registry.items, registry.item_errors) == (1, 1)
+    assert registry.drops == {'Unchanged since': 1}
+    assert not registry._item_starts
+    text = registry.prometheus()
+    assert 'scrapy_item_pipeline_seconds_count 3' in text
+    assert 'scrapy_items_dropped_total{reason="Unchanged since"} 1' in text
+
+    assert metrics.spider_closed(spider, 'finished') is None
+    snapshot = json.loads(snapshot_path.read_text(encoding='utf-8'))
+    assert snapshot['item_pipelines']['count'] == 3
+    assert snapshot['item_errors'] == 1
+
+
+def test_each_pipeline_is_timed_separately(in_tmp):
+    from ohsnapmacros.pipelines import DedupPipeline, ValidateAndWritePipeline
+
+    crawler = get_crawler(RecipeSpider, {'METRICS_ENABLED': True, 'VALID_OUTPUT_PATH': 'out.jl',
+                                         'DEDUP_STORE_PATH': 'dedup.sqlite3', 'VALID_MIN_FIELDS': 2})
+    crawler.stats.open_spider()
+    spider = RecipeSpider()
+    pipelines = [DedupPipeline.from_crawler(crawler), ValidateAndWritePipeline.from_crawler(crawler)]
+    for pipeline in pipelines:
+        pipeline.open_spider(spider)
+    for item in ({'url': 'https://ohsnapmacros.com/a/', 'title': 'A', 'ingredients': ['oats']},
+                 {'url': 'https://ohsnapmacros.com/b/', 'title': ''}):
+        try:
+            for pipeline in pipelines:
+                item = pipeline.process_item(item, spider)
+        except DropItem:
+            pass
+    for pipeline in pipelines:
+        pipeline.close_spider(spider)
+
+    registry = MetricsRegistry.for_crawler(crawler)
+    assert registry.pipelines['DedupPipeline'].count == 2
+    assert registry.pipelines['ValidateAndWritePipeline'].count == 2
+    assert registry.pipeline_drops == {'ValidateAndWritePipeline': 1}
+    text = registry.prometheus()
+    assert 'scrapy_pipeline_seconds_count{pipeline="DedupPipeline"} 2' in text
+    assert 'scrapy_pipeline_dropped_total{pipeline="ValidateAndWritePipeline"} 1' in text
+    snapshot = registry.snapshot()
+    assert set(snapshot['pipelines']) == {'DedupPipeline', 'ValidateAndWritePipeline'}
+    assert snapshot['dropped_by_pipeline'] == {'ValidateAndWritePipeline': 1}
+
+
+def test_pipelines_are_not_timed_with_metrics_off(in_tmp):
+    from ohsnapmacros.pipelines import DedupPipeline
+
+    crawler = get_crawler(RecipeSpider, {'DEDUP_STORE_PATH': 'dedup.sqlite3'})
+    pipeline = DedupPipeline.from_crawler(crawler)
+    assert pipeline.metrics is None
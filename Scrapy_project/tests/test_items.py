@@ -0,0 +1,53 @@
+import gzip
+import json
+
+import pytest
+
+from ohsnapmacros.items import FIELD_NAMES, RecipeItem, as_dict, load_jsonl, to_columns
+
+
+def _line(**record):
+    return json.dumps(record) + '\n'
+
+
+def test_load_jsonl_skips_lines_that_are_not_objects(tmp_path):
+    path = tmp_path / 'recipes.jl'
+    path.write_text(
+        _line(url='https://ohsnapmacros.com/a/', title='A', ingredients=['1 egg'])
+        + '[1, 2]\n"just a string"\n42\nnull\n{not json\n\n'
+        + _line(url='https://ohsnapmacros.com/b/', title='B', categories='Dinner'),
+        encoding='utf-8')
+    items = load_jsonl(str(path))
+    assert [item.url for item in items] == ['https://ohsnapmacros.com/a/', 'https://ohsnapmacros.com/b/']
+    assert items[0].ingredients == ('1 egg',)
+    assert items[1].categories == ('Dinner',)
+    assert items[1].instructions == ()
+
+
+def test_load_jsonl_reads_gzip(tmp_path):
+    path = tmp_path / 'recipes.jl.gz'
+    with gzip.open(path, 'wt', encoding='utf-8') as fp:
+        fp.write(_line(url='https://ohsnapmacros.com/a/', title='A'))
+    assert [item.title for item in load_jsonl(str(path))] == ['A']
+
+
+def test_from_jsonl_line_rejects_non_objects():
+    with pytest.raises(ValueError):
+        RecipeItem.from_jsonl_line(b'[{"url": "x"}]')
+
+
+def test_repeated_strings_are_shared():
+    first = RecipeItem.from_jsonl_line(_line(url='a', title='A', author='Ohsnap' + 'macros', prep_time='10 mins'))
+    second = RecipeItem.from_jsonl_line(_line(url='b', title='B', author='Ohsnap' + 'macros', prep_time='10 mins'))
+    assert first.author is second.author
+    assert first.prep_time is second.prep_time
+
+
+def test_to_columns_and_as_dict():
+    items = [RecipeItem(url='a', title='A', servings='4'), RecipeItem(url='b', title='B')]
+    columns = to_columns(items)
+    assert list(columns) == list(FIELD_NAMES)
+    assert columns['url'] == ['a', 'b']
+    assert columns['servings'] == ['4', None]
+    assert to_columns([])['title'] == []
+    assert as_dict(items[0])['title'] == 'A'
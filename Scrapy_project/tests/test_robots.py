@@ -0,0 +1,71 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+import scrapy
+from scrapy.exceptions import IgnoreRequest
+from scrapy.http import TextResponse
+from scrapy.utils.test import get_crawler
+
+from ohsnapmacros.robots import CachedRobotsTxtMiddleware, RobotsStore
+
+HOST = 'ohsnapmacros.com'
+ROBOTS = 'User-agent: *\nDisallow: /wp-admin/\n'
+
+
+class Engine:
+    """Serves robots.txt with a fixed status and records what was downloaded."""
+
+    def __init__(self, status=200, body=ROBOTS):
+        self.status = status
+        self.body = body
+        self.downloads = []
+
+    async def download_async(self, request):
+        self.downloads.append(request.url)
+        return TextResponse(request.url, status=self.status, body=self.body.encode('utf-8'))
+
+
+def _middleware(tmp_path, engine):
+    crawler = get_crawler(scrapy.Spider, {'ROBOTSTXT_OBEY': True, 'ROBOTSTXT_CACHE_DIR': str(tmp_path / 'robots')})
+    crawler.stats.open_spider()
+    crawler.engine = engine
+    return CachedRobotsTxtMiddleware.from_crawler(crawler), crawler.stats
+
+
+def _allowed(mw, path):
+    try:
+        asyncio.run(mw.process_request(scrapy.Request(f'https://{HOST}{path}')))
+    except IgnoreRequest:
+        return False
+    return True
+
+
+def test_stored_robots_is_used_without_a_download(tmp_path):
+    RobotsStore(str(tmp_path / 'robots')).put(HOST, f'https://{HOST}/robots.txt', ROBOTS)
+    engine = Engine()
+    mw, stats = _middleware(tmp_path, engine)
+    assert _allowed(mw, '/protein-pancakes/')
+    assert not _allowed(mw, '/wp-admin/options.php')
+    assert engine.downloads == []
+    assert stats.get_value('robotstxt/cache_hit_count') == 1
+
+
+def test_downloaded_robots_is_stored_for_the_next_run(tmp_path):
+    engine = Engine()
+    mw, _ = _middleware(tmp_path, engine)
+    assert not _allowed(mw, '/wp-admin/')
+    assert engine.downloads == [f'https://{HOST}/robots.txt']
+    assert RobotsStore.from_settings(mw.crawler.settings).get_text(HOST) == ROBOTS
+
+    engine = Engine()
+    mw, _ = _middleware(tmp_path, engine)
+    assert not _allowed(mw, '/wp-admin/')
+    assert engine.downloads == []
+
+
+@pytest.mark.parametrize('status, stored', [(404, ''), (503, None)])
+def test_missing_robots_is_stored_empty_and_server_errors_are_not(tmp_path, status, stored):
+    mw, _ = _middleware(tmp_path, Engine(status=status, body='error'))
+    assert _allowed(mw, '/wp-admin/')
+    assert RobotsStore(str(tmp_path / 'robots')).get_text(HOST) == stored
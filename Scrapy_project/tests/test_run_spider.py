@@ -0,0 +1,69 @@
+import sys
+
+import pytest
+
+import run_spider
+
+
+@pytest.fixture
+def args(monkeypatch):
+    monkeypatch.setattr(sys, 'argv', ['run_spider.py', '--checkpoint-interval', '5'])
+    monkeypatch.setenv('SCRAPY_SETTINGS_MODULE', 'ohsnapmacros.settings')
+    return run_spider.parse_args()
+
+
+def test_build_settings_keeps_the_project_components(args):
+    settings = run_spider.build_settings(args, 'crawls/ohsnap', 'out.jl', 3)
+    assert list(settings.getdict('ITEM_PIPELINES')) == ['ohsnapmacros.pipelines.DedupPipeline',
+                                                         'ohsnapmacros.pipelines.ValidateAndWritePipeline']
+    assert settings.get('DUPEFILTER_CLASS') == 'ohsnapmacros.urlstore.CanonicalDupeFilter'
+    middlewares = settings.getdict('DOWNLOADER_MIDDLEWARES')
+    assert 'ohsnapmacros.robots.CachedRobotsTxtMiddleware' in middlewares
+    assert 'ohsnapmacros.middlewares.AdaptiveConcurrencyMiddleware' in middlewares
+    assert settings.getdict('EXTENSIONS') == {'ohsnapmacros.instrumentation.CrawlMetrics': 500,
+                                              'ohsnapmacros.checkpoint.CrawlCheckpoint': 900}
+    assert settings.get('JOBDIR') == 'crawls/ohsnap'
+    assert settings.getint('CLOSESPIDER_ITEMCOUNT') == 3
+    assert settings.getfloat('CHECKPOINT_INTERVAL') == 5
+    assert settings.get('VALID_OUTPUT_PATH') == 'out.jl'
+    assert settings.getbool('VALID_OUTPUT_RESUME') is False
+    assert settings.get('DEDUP_STORE_PATH') == 'out.dedup.sqlite3'
+
+
+def test_shard_settings_add_the_shard_middleware(args):
+    output = run_spider.shard_path('out.jl', 1)
+    settings = run_spider.shard_settings(run_spider.build_settings(args, 'crawls/ohsnap/shard-1', output, 2),
+                                         1, 4, 'crawls/ohsnap/spool')
+    assert settings.getdict('SPIDER_MIDDLEWARES') == {
+        'ohsnapmacros.instrumentation.CallbackTimingMiddleware': 999,
+        'ohsnapmacros.sharding.ShardMiddleware': 50,
+    }
+    assert settings.get('DEDUP_STORE_PATH') == 'out.shard-1.dedup.sqlite3'
+    assert settings.getint('CONCURRENT_REQUESTS') == 2
+    assert settings.getfloat('DOWNLOAD_DELAY') == 4.0
+    assert settings.get('SHARD_SPOOL_DIR') == 'crawls/ohsnap/spool'
+    assert settings.getint('CLOSESPIDER_ITEMCOUNT') == 2
+
+
+def test_shards_split_the_adaptive_limits_and_metrics_outputs(args):
+    settings = run_spider.build_settings(args, 'crawls/ohsnap/shard-2', 'out.shard-2.jl', 2)
+    settings.set('METRICS_SNAPSHOT_PATH', 'metrics/crawl.json')
+    settings = run_spider.shard_settings(settings, 2, 4, 'crawls/ohsnap/spool')
+    assert settings.getint('ADAPTIVE_MAX_CONCURRENCY') == 2
+    assert settings.getfloat('ADAPTIVE_MIN_DELAY') == 1.0
+    assert settings.getint('METRICS_PORT') == 9412
+    assert settings.get('METRICS_SNAPSHOT_PATH') == 'metrics/crawl.shard-2.json'
+
+    settings = run_spider.build_settings(args, 'crawls/ohsnap/shard-1', 'out.shard-1.jl', 2)
+    settings.set('METRICS_PORT', 0)
+    settings.set('METRICS_SNAPSHOT_PATH', '')
+    settings = run_spider.shard_settings(settings, 1, 4, 'crawls/ohsnap/spool')
+    assert settings.getint('METRICS_PORT') == 0
+    assert not settings.get('METRICS_SNAPSHOT_PATH')
+
+
+def test_discovery_shard_is_not_closed_at_its_item_share(args):
+    settings = run_spider.shard_settings(run_spider.build_settings(args, 'crawls/ohsnap/shard-0', 'out.jl', 2),
+                                         0, 4, 'crawls/ohsnap/spool')
+    assert settings.getint('CLOSESPIDER_ITEMCOUNT') == 0
+    assert settings.getint('SHARD_ITEM_LIMIT') == 2
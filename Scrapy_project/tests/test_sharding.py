@@ -0,0 +1,167 @@
+import gzip
+import json
+import types
+
+import pytest
+import scrapy
+from scrapy.exceptions import DontCloseSpider
+from scrapy.utils.test import get_crawler
+
+from ohsnapmacros import sharding
+from ohsnapmacros.sharding import ShardMiddleware, SpoolReader, SpoolWriter, merge_outputs, shard_of, split_limit
+from ohsnapmacros.writer import BatchedJsonlWriter, output_parts
+
+
+class RecipeSpider(scrapy.Spider):
+    name = 'recipes'
+
+    def parse(self, response):
+        pass
+
+    def parse_recipe(self, response):
+        pass
+
+
+def _urls_by_shard(count, per_shard=2):
+    by_shard = {i: [] for i in range(count)}
+    i = 0
+    while any(len(urls) < per_shard for urls in by_shard.values()):
+        url = f'https://ohsnapmacros.com/recipe-{i}/'
+        owner = shard_of(url, count)
+        if len(by_shard[owner]) < per_shard:
+            by_shard[owner].append(url)
+        i += 1
+    return by_shard
+
+
+def _middleware(tmp_path, index, count=3, **settings):
+    crawler = get_crawler(RecipeSpider, {'SHARD_INDEX': index, 'SHARD_COUNT': count,
+                                         'SHARD_SPOOL_DIR': str(tmp_path / 'spool'), **settings})
+    crawler.spider = RecipeSpider()
+    crawler.stats.open_spider()
+    crawler.engine = types.SimpleNamespace(scheduled=[])
+    crawler.engine.crawl = crawler.engine.scheduled.append
+    return ShardMiddleware.from_crawler(crawler)
+
+
+def _route(mw, requests):
+    return list(mw.process_spider_output(None, requests, mw.crawler.spider))
+
+
+def test_shard_of_is_stable_and_canonical():
+    url = 'https://ohsnapmacros.com/protein-pancakes/'
+    assert shard_of(url, 4) == shard_of('https://OhSnapMacros.com/protein-pancakes/?utm_source=x', 4)
+    assert {shard_of(f'https://ohsnapmacros.com/r{i}/', 4) for i in range(100)} == {0, 1, 2, 3}
+
+
+def test_split_limit_never_drops_to_zero():
+    assert [split_limit(8, 4), split_limit(9, 4), split_limit(2, 4)] == [2, 2, 1]
+
+
+def test_spool_reads_only_complete_records(tmp_path):
+    path = str(tmp_path / 'shard-1.spool')
+    writer = SpoolWriter(path)
+    reader = SpoolReader(path)
+    writer.append({'url': 'a', 'body': b'\x00'})
+    assert reader.read() == [{'url': 'a', 'body': b'\x00'}]
+    # A record torn by a kill is not read, and the next writer cuts it off
+    with open(path, 'ab') as fp:
+        fp.write(b'\x00\x00\x01\x00partial')
+    assert reader.read() == []
+    writer.close()
+    writer = SpoolWriter(path)
+    writer.append({'url': 'b'})
+    writer.close()
+    assert reader.read() == [{'url': 'b'}]
+    reader.close()
+    assert SpoolReader(path).read(limit=1) == [{'url': 'a', 'body': b'\x00'}]
+
+
+def test_discovery_shard_spools_foreign_requests(tmp_path):
+    by_shard = _urls_by_shard(3)
+    mw = _middleware(tmp_path, 0)
+    spider = mw.crawler.spider
+    listing = scrapy.Request('https://ohsnapmacros.com/all-recipes/', callback=spider.parse)
+    recipes = [scrapy.Request(url, callback=spider.parse_recipe) for urls in by_shard.values() for url in urls]
+    kept = _route(mw, [listing] + recipes)
+    assert [r.url for r in kept] == [listing.url] + by_shard[0]
+    mw.spider_closed(spider, 'finished')
+
+    assert [r['url'] for r in SpoolReader(sharding.spool_path(str(tmp_path / 'spool'), 1)).read()] == by_shard[1]
+    assert mw.crawler.stats.get_value('shard/forwarded') == 4
+
+
+def test_discovery_shard_item_limit_only_stops_its_own_recipes(tmp_path):
+    by_shard = _urls_by_shard(3)
+    mw = _middleware(tmp_path, 0, SHARD_ITEM_LIMIT=1)
+    spider = mw.crawler.spider
+    mw.crawler.stats.set_value('item_scraped_count', 1)
+    kept = _route(mw, [scrapy.Request(url, callback=spider.parse_recipe) for url in by_shard[0] + by_shard[2]])
+    assert kept == []
+    assert mw.crawler.stats.get_value('shard/over_item_limit') == 2
+    assert mw.crawler.stats.get_value('shard/forwarded') == 2
+
+
+def test_worker_schedules_its_spool_and_rereads_it_on_resume(tmp_path):
+    spool_dir = str(tmp_path / 'spool')
+    sharding.start_discovery(spool_dir)
+    writer = SpoolWriter(sharding.spool_path(spool_dir, 2))
+    spider = RecipeSpider()
+    for i in range(3):
+        writer.append(scrapy.Request(f'https://ohsnapmacros.com/r{i}/', callback=spider.parse_recipe).to_dict(
+            spider=spider))
+
+    mw = _middleware(tmp_path, 2)
+    mw.reader = SpoolReader(sharding.spool_path(spool_dir, 2))
+    mw.poll()
+    assert len(mw.crawler.engine.scheduled) == 3
+    assert mw.crawler.engine.scheduled[0].callback.__name__ == 'parse_recipe'
+    with pytest.raises(DontCloseSpider):
+        mw.spider_idle(mw.crawler.spider)
+
+    writer.append({'url': 'https://ohsnapmacros.com/r3/', 'callback': 'parse_recipe'})
+    writer.close()
+    sharding.finish_discovery(spool_dir)
+    mw.poll()
+    assert len(mw.crawler.engine.scheduled) == 4
+    assert mw.discovery_done
+    mw.spider_idle(mw.crawler.spider)
+    mw.spider_closed(mw.crawler.spider, 'finished')
+
+    # A resumed worker reads the whole spool again; its dupefilter drops what it already had
+    resumed = _middleware(tmp_path, 2)
+    resumed.reader = SpoolReader(sharding.spool_path(spool_dir, 2))
+    resumed.poll()
+    assert len(resumed.crawler.engine.scheduled) == 4
+    sharding.start_discovery(spool_dir)
+    assert not sharding.discovery_finished(spool_dir)
+
+
+def test_merge_outputs_keeps_the_first_record_per_url(tmp_path):
+    first, second = tmp_path / 'out.shard-0.jl', tmp_path / 'out.shard-1.jl'
+    first.write_text(json.dumps({'url': 'a', 'n': 1}) + '\n' + json.dumps({'url': 'b', 'n': 1}) + '\n',
+                     encoding='utf-8')
+    second.write_text(json.dumps({'url': 'a', 'n': 2}) + '\nnot json\n' + json.dumps({'url': 'c', 'n': 2}) + '\n',
+                      encoding='utf-8')
+    counts = merge_outputs([str(first), str(second)], str(tmp_path / 'out.jl'))
+    assert counts == {'read': 4, 'written': 3}
+    with open(tmp_path / 'out.jl', encoding='utf-8') as fp:
+        assert [json.loads(line) for line in fp] == [{'url': 'a', 'n': 1}, {'url': 'b', 'n': 1},
+                                                      {'url': 'c', 'n': 2}]
+
+
+def test_merge_outputs_reads_rotated_and_compressed_parts(tmp_path):
+    for shard in range(2):
+        path = str(tmp_path / f'out.shard-{shard}.jl')
+        writer = BatchedJsonlWriter(path, compression='gzip', max_records=2)
+        for i in range(3):
+            writer.write({'url': f'r{i + shard}', 'shard': shard})
+        writer.close()
+        assert len(output_parts(path, 'gzip')) == 2
+    with gzip.open(tmp_path / 'out.shard-1.0001.jl.gz', 'at', encoding='utf-8') as fp:
+        fp.write('[1, 2]\n')
+    paths = [str(tmp_path / f'out.shard-{shard}.jl') for shard in range(3)]
+    counts = merge_outputs(paths, str(tmp_path / 'out.jl'), compression='gzip')
+    assert counts == {'read': 6, 'written': 4}
+    with gzip.open(tmp_path / 'out.jl.gz', 'rt', encoding='utf-8') as fp:
+        assert [json.loads(line)['url'] for line in fp] == ['r0', 'r1', 'r2', 'r3']
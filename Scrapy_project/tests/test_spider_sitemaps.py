@@ -0,0 +1,70 @@
+import pytest
+from scrapy.exceptions import IgnoreRequest
+from scrapy.http import XmlResponse
+from scrapy.utils.test import get_crawler
+from twisted.python.failure import Failure
+
+from ohsnapmacros.spiders.ohsnap_spider import OhsnapSpider
+
+INDEX = '''<?xml version="1.0" encoding="UTF-8"?>
+<sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">
+<sitemap><loc>https://ohsnapmacros.com/post-sitemap.xml</loc></sitemap>
+<sitemap><loc>https://ohsnapmacros.com/post-sitemap.xml</loc></sitemap>
+<sitemap><loc>https://ohsnapmacros.com/post-sitemap2.xml</loc></sitemap>
+<sitemap><loc>https://ohsnapmacros.com/page-sitemap.xml</loc></sitemap>
+</sitemapindex>'''
+
+EMPTY_URLSET = '''<?xml version="1.0" encoding="UTF-8"?>
+<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9"></urlset>'''
+
+
+@pytest.fixture
+def spider(in_tmp):
+    crawler = get_crawler(OhsnapSpider, {'RECIPE_CLASSIFIER_HISTORY': []})
+    return OhsnapSpider.from_crawler(crawler)
+
+
+def _response(url, body, request):
+    return XmlResponse(url, body=body.encode('utf-8'), request=request)
+
+
+def _fail(request):
+    # Scrapy attaches the request to the failure before calling the errback
+    failure = Failure(IgnoreRequest(f'dropped {request.url}'))
+    failure.request = request
+    return failure
+
+
+def test_sitemap_requests_bypass_the_dupe_filter(spider):
+    (index_request,) = list(spider.sitemap_requests(['https://ohsnapmacros.com/sitemap_index.xml']))
+    assert index_request.dont_filter
+    children = list(spider.parse_sitemap(_response(index_request.url, INDEX, index_request)))
+    assert [r.url for r in children] == ['https://ohsnapmacros.com/post-sitemap.xml'] * 2 + [
+        'https://ohsnapmacros.com/post-sitemap2.xml']
+    assert all(r.dont_filter and r.errback == spider.sitemap_failed for r in children)
+    assert spider._pending_sitemaps == 3
+
+
+def test_failed_sitemaps_still_trigger_the_fallback(spider):
+    (index_request,) = list(spider.sitemap_requests(['https://ohsnapmacros.com/sitemap_index.xml']))
+    children = list(spider.parse_sitemap(_response(index_request.url, INDEX, index_request)))
+    assert list(spider.parse_sitemap(_response(children[0].url, EMPTY_URLSET, children[0]))) == []
+    assert list(spider.sitemap_failed(_fail(children[1]))) == []
+    fallback = list(spider.sitemap_failed(_fail(children[2])))
+    assert spider._pending_sitemaps == 0
+    assert [r.url for r in fallback] == spider.start_urls
+    assert fallback[0].callback == spider.parse
+
+
+def test_no_fallback_when_sitemaps_list_posts(spider):
+    (request,) = list(spider.sitemap_requests(['https://ohsnapmacros.com/post-sitemap.xml']))
+    urlset = EMPTY_URLSET.replace('</urlset>', '<url><loc>https://ohsnapmacros.com/chicken-pesto-sliders/</loc>'
+                                               '</url></urlset>')
+    requests = list(spider.parse_sitemap(_response(request.url, urlset, request)))
+    assert [r.callback for r in requests] == [spider.parse_recipe]
+    assert not spider._fell_back
+
+
+def test_robots_without_sitemaps_falls_back(spider):
+    requests = list(spider.sitemap_requests([]))
+    assert [r.url for r in requests] == spider.start_urls
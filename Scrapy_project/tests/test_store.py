@@ -0,0 +1,94 @@
+import gzip
+import json
+
+import pytest
+import scrapy
+from scrapy.utils.test import get_crawler
+
+from ohsnapmacros import store as store_module
+from ohsnapmacros.pipelines import ValidateAndWritePipeline
+from ohsnapmacros.store import RecipeStore, fts_query, read_jsonl
+
+RECIPES = [
+    {'url': 'https://ohsnapmacros.com/cottage-cheese-pancakes/', 'title': 'Cottage Cheese Pancakes',
+     'ingredients': ['1 cup cottage cheese', '2 eggs'], 'instructions': ['Blend.', 'Cook.']},
+    {'url': 'https://ohsnapmacros.com/lasagna/', 'title': 'Protein Lasagna',
+     'ingredients': ['noodles', '1 cup cottage cheese', 'ground beef'], 'instructions': ['Layer and bake.']},
+    {'url': 'https://ohsnapmacros.com/brownies/', 'title': 'Brownies',
+     'ingredients': ['cocoa', 'eggs'], 'instructions': ['Bake the brownies.'], 'notes': 'Cheesecake swirl optional'},
+]
+
+
+@pytest.fixture
+def store(tmp_path):
+    with RecipeStore(str(tmp_path / 'db' / 'recipes.sqlite3'), batch_size=2) as store:
+        yield store
+
+
+def test_fts_query_quotes_words():
+    assert fts_query('cottage cheese') == '"cottage" "cheese"'
+    assert fts_query('eggs AND "NEAR(') == '"eggs" "AND" "NEAR"'
+    assert fts_query('  --  ') == ''
+
+
+def test_upsert_replaces_by_url_and_skips_unchanged_records(store):
+    assert store.upsert_many(RECIPES) == 3
+    assert store.upsert_many(RECIPES) == 0
+    changed = dict(RECIPES[2], title='Fudgy Brownies')
+    assert store.upsert(changed) == 1
+    assert store.count() == 3
+    assert store.get(changed['url']) == changed
+    assert store.search('fudgy')[0]['url'] == changed['url']
+    assert store.delete(changed['url'])
+    assert not store.delete(changed['url'])
+    assert store.get(changed['url']) is None
+    assert store.search('brownies') == []
+
+
+def test_search_ranks_title_matches_first(store):
+    store.upsert_many(RECIPES)
+    results = store.search('cottage cheese')
+    assert [r['url'] for r in results] == [RECIPES[0]['url'], RECIPES[1]['url']]
+    assert results[0]['score'] > results[1]['score']
+    assert '[cottage]' in results[0]['snippet'].lower()
+    # Porter stemming: "pancake" matches "Pancakes"
+    assert [r['title'] for r in store.search('pancake')] == ['Cottage Cheese Pancakes']
+    assert sorted(r['title'] for r in store.search('lasagna OR brownies', raw=True)) == ['Brownies', 'Protein Lasagna']
+    assert store.search('!!!') == []
+
+
+def test_read_jsonl_skips_bad_and_url_less_lines(tmp_path):
+    path = str(tmp_path / 'recipes.jl.gz')
+    with gzip.open(path, 'wt', encoding='utf-8') as fp:
+        fp.write('\n'.join([json.dumps(RECIPES[0]), '{"title": "no url"}', '{torn', '[]']) + '\n')
+    assert [r['url'] for r in read_jsonl(path)] == [RECIPES[0]['url']]
+
+
+def test_cli_load_search_and_get(tmp_path, capsys):
+    src = tmp_path / 'recipes.jsonl'
+    src.write_text(''.join(json.dumps(r) + '\n' for r in RECIPES), encoding='utf-8')
+    db = str(tmp_path / 'recipes.sqlite3')
+    assert store_module.main(['--db', db, 'load', str(src)]) == 0
+    assert '3 recipes in' in capsys.readouterr().out
+    assert store_module.main(['--db', db, 'search', 'lasagna']) == 0
+    assert 'Protein Lasagna' in capsys.readouterr().out
+    assert store_module.main(['--db', db, 'search', 'NEAR(', '--raw']) == 2
+    assert store_module.main(['--db', db, 'get', 'https://ohsnapmacros.com/missing/']) == 1
+
+
+def test_pipeline_upserts_items_in_batches(in_tmp):
+    crawler = get_crawler(scrapy.Spider, {'VALID_OUTPUT_PATH': 'out.jl', 'VALID_STORE_PATH': 'recipes.sqlite3',
+                                          'VALID_STORE_BATCH_SIZE': 2})
+    crawler.stats.open_spider()
+    spider = scrapy.Spider('test')
+    pipeline = ValidateAndWritePipeline.from_crawler(crawler)
+    pipeline.min_fields = 4
+    pipeline.open_spider(spider)
+    for recipe in RECIPES:
+        pipeline.process_item(dict(recipe), spider)
+    with RecipeStore('recipes.sqlite3') as store:
+        assert store.count() == 2
+    pipeline.close_spider(spider)
+    with RecipeStore('recipes.sqlite3') as store:
+        assert store.count() == 3
+    assert crawler.stats.get_value('valid_output/store_upserts') == 3
@@ -0,0 +1,89 @@
+import time
+
+import pytest
+import scrapy
+from scrapy.http import HtmlResponse
+from scrapy.utils.test import get_crawler
+
+from ohsnapmacros.urlstore import CanonicalDupeFilter, FingerprintStore, canonicalize_url, url_fingerprint
+
+
+@pytest.mark.parametrize('url', [
+    'https://ohsnapmacros.com/protein-pancakes/',
+    'https://OhSnapMacros.com/protein-pancakes',
+    'https://ohsnapmacros.com:443//protein-pancakes/#wprm-recipe-container',
+    'https://ohsnapmacros.com/protein-pancakes/?utm_source=pinterest&fbclid=abc',
+    ' https://ohsnapmacros.com/protein-pancakes/?gclid=12&mc_cid=3 ',
+])
+def test_spellings_of_one_page_share_a_canonical_url(url):
+    assert canonicalize_url(url) == 'https://ohsnapmacros.com/protein-pancakes/'
+
+
+def test_meaningful_query_and_file_paths_are_kept():
+    assert canonicalize_url('https://ohsnapmacros.com/page/2?s=oats&utm_medium=x') == \
+        'https://ohsnapmacros.com/page/2/?s=oats'
+    assert canonicalize_url('https://ohsnapmacros.com/feed.xml') == 'https://ohsnapmacros.com/feed.xml'
+    # Only known trackers are dropped, and the path keeps its case
+    assert canonicalize_url('https://ohsnapmacros.com/Shop/?ref=nav&share=1&amp=1') == \
+        'https://ohsnapmacros.com/Shop/?amp=1&ref=nav&share=1'
+
+
+def test_fingerprint_store_freshness_survives_reopen(in_tmp):
+    store = FingerprintStore('state/fp.sqlite3', commit_every=1000)
+    fp = url_fingerprint('https://ohsnapmacros.com/a/')
+    assert not store.is_fresh(fp, 60)
+    store.mark(fp, 'https://ohsnapmacros.com/a/')
+    store.close()
+
+    store = FingerprintStore('state/fp.sqlite3')
+    assert store.fetched_at(fp) <= time.time()
+    assert store.is_fresh(fp, 60)
+    assert not store.is_fresh(fp, 0)
+    store.close()
+
+
+def _dupefilter(**settings):
+    crawler = get_crawler(scrapy.Spider, {'FINGERPRINT_STORE_PATH': 'fp.sqlite3', **settings})
+    crawler.stats.open_spider()
+    df = CanonicalDupeFilter.from_crawler(crawler)
+    return df, crawler.stats
+
+
+def test_dupefilter_matches_canonical_urls(in_tmp):
+    df, _ = _dupefilter()
+    assert not df.request_seen(scrapy.Request('https://ohsnapmacros.com/a/'))
+    assert df.request_seen(scrapy.Request('https://OHSNAPMACROS.com/a?utm_source=x#top'))
+    assert not df.request_seen(scrapy.Request('https://ohsnapmacros.com/b/'))
+    assert not df.request_seen(scrapy.Request('https://ohsnapmacros.com/B/'))
+    assert df.request_fingerprint(scrapy.Request('https://ohsnapmacros.com/b?fbclid=1')) == \
+        df.request_fingerprint(scrapy.Request('https://ohsnapmacros.com/b/'))
+    df.close('finished')
+
+
+def test_persisted_pages_are_skipped_on_the_next_run(in_tmp):
+    df, _ = _dupefilter()
+    request = scrapy.Request('https://ohsnapmacros.com/new/', meta={
+        'persist_fingerprint': True, 'redirect_urls': ['https://ohsnapmacros.com/old/']})
+    assert not df.request_seen(request)
+    df.response_received(HtmlResponse(request.url, status=200), request, None)
+    df.close('finished')
+
+    df, stats = _dupefilter()
+    for url in ('https://ohsnapmacros.com/new/', 'https://ohsnapmacros.com/old'):
+        assert df.request_seen(scrapy.Request(url, meta={'persist_fingerprint': True}))
+    # Requests not marked persistent are only de-duplicated within the run
+    assert not df.request_seen(scrapy.Request('https://ohsnapmacros.com/new/?page=1'))
+    assert stats.get_value('fingerprints/fresh_skipped') == 2
+    df.close('finished')
+
+    df, _ = _dupefilter(FINGERPRINT_FRESHNESS_DAYS=0)
+    assert not df.request_seen(scrapy.Request('https://ohsnapmacros.com/new/', meta={'persist_fingerprint': True}))
+    df.close('finished')
+
+
+def test_failed_responses_are_not_persisted(in_tmp):
+    df, _ = _dupefilter()
+    request = scrapy.Request('https://ohsnapmacros.com/gone/', meta={'persist_fingerprint': True})
+    df.response_received(HtmlResponse(request.url, status=404), request, None)
+    assert df.store.fetched_at(url_fingerprint(request.url)) is None
+    df.close('finished')
@@ -0,0 +1,105 @@
+import gzip
+import json
+
+import pytest
+
+from ohsnapmacros.writer import BatchedJsonlWriter
+
+
+def _records(start, stop):
+    return [{'url': f'https://ohsnapmacros.com/r{i}/', 'title': f'Recipe {i}'} for i in range(start, stop)]
+
+
+def _lines(path, opener=open):
+    with opener(path, 'rt', encoding='utf-8') as fp:
+        return [json.loads(line) for line in fp]
+
+
+def _write_all(writer, records):
+    for record in records:
+        writer.write(record)
+    writer.close()
+
+
+def test_rotates_by_record_count_within_a_batch(tmp_path):
+    path = str(tmp_path / 'out.jl')
+    writer = BatchedJsonlWriter(path, batch_size=10, max_records=4)
+    _write_all(writer, _records(0, 10))
+    assert writer.parts() == [path, str(tmp_path / 'out.0001.jl'), str(tmp_path / 'out.0002.jl')]
+    assert [len(_lines(part)) for part in writer.parts()] == [4, 4, 2]
+    assert writer.rotations == 2
+
+
+def test_resumed_part_over_the_limit_is_rotated_first(tmp_path):
+    path = tmp_path / 'out.jl'
+    path.write_text(''.join(json.dumps(r) + '\n' for r in _records(0, 5)), encoding='utf-8')
+    writer = BatchedJsonlWriter(str(path), max_records=3)
+    _write_all(writer, _records(3, 9))
+    assert writer.skipped == 2
+    assert [len(_lines(part)) for part in writer.parts()] == [5, 3, 1]
+
+
+def test_resume_skips_written_urls_and_cuts_a_torn_line(tmp_path):
+    path = tmp_path / 'out.jl'
+    path.write_text(json.dumps(_records(0, 1)[0]) + '\n{"url": "https://ohsnapmacros.com/r1/", "ti',
+                    encoding='utf-8')
+    writer = BatchedJsonlWriter(str(path))
+    assert writer.seen == {'https://ohsnapmacros.com/r0/'}
+    _write_all(writer, _records(0, 3))
+    assert [r['url'] for r in _lines(path)] == [r['url'] for r in _records(0, 3)]
+
+
+def test_no_resume_starts_over(tmp_path):
+    path = str(tmp_path / 'out.jl')
+    _write_all(BatchedJsonlWriter(path, max_records=2), _records(0, 5))
+    writer = BatchedJsonlWriter(path, resume=False)
+    _write_all(writer, _records(0, 1))
+    assert writer.parts() == [path]
+    assert len(_lines(path)) == 1
+
+
+def test_gzip_parts_read_back(tmp_path):
+    path = str(tmp_path / 'out.jl')
+    _write_all(BatchedJsonlWriter(path, compression='gzip', max_records=3), _records(0, 4))
+    writer = BatchedJsonlWriter(path, compression='gzip', max_records=3)
+    assert len(writer.seen) == 4
+    _write_all(writer, _records(4, 5))
+    assert [len(_lines(part, gzip.open)) for part in writer.parts()] == [3, 1, 1]
+
+
+def test_write_error_is_raised_by_flush(tmp_path, monkeypatch):
+    writer = BatchedJsonlWriter(str(tmp_path / 'out.jl'))
+
+    def broken(batch):
+        raise OSError('disk full')
+
+    monkeypatch.setattr(writer, '_write_batch', broken)
+    writer.write(_records(0, 1)[0])
+    with pytest.raises(OSError, match='disk full'):
+        writer.flush()
+    with pytest.raises(OSError, match='disk full'):
+        writer.close()
+
+
+class WriterKilled(BaseException):
+    pass
+
+
+@pytest.mark.filterwarnings('ignore::pytest.PytestUnhandledThreadExceptionWarning')
+def test_dead_writer_thread_raises_instead_of_hanging(tmp_path, monkeypatch):
+    writer = BatchedJsonlWriter(str(tmp_path / 'out.jl'), queue_size=1)
+
+    def killed(batch):
+        raise WriterKilled()
+
+    monkeypatch.setattr(writer, '_write_batch', killed)
+    with pytest.raises(WriterKilled):
+        # The queue holds one record; once the thread is dead the next put must not block
+        for record in _records(0, 5):
+            writer.write(record)
+        writer.flush()
+    writer._thread.join()
+    with pytest.raises(WriterKilled):
+        writer.flush()
+    with pytest.raises(WriterKilled):
+        writer.close()
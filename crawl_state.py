@@ -0,0 +1,82 @@
+# Per-URL crawl state for incremental recrawls.
+# For every recipe URL we remember the sitemap <lastmod> we saw and a hash of the
+# extracted record, so a rerun only re-extracts pages that are new or changed.
+
+import hashlib
+import json
+import os
+
+DEFAULT_STATE_FILE = "crawl_state.json"
+
+
+def content_hash(record):
+    """Returns a stable hash of a recipe record (key order does not matter)."""
+    data = json.dumps(record, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+
+class CrawlState:
+    """
+    Maps url -> {"lastmod": ..., "hash": ...} and persists it as JSON.
+    """
+
+    def __init__(self, path=DEFAULT_STATE_FILE):
+        self.path = path
+        self.entries = {}
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as fp:
+                self.entries = json.load(fp)
+
+    def needs_fetch(self, url, lastmod):
+        """
+        True if the URL is new, or its lastmod moved since the last run.
+        Pages without a lastmod are always fetched; their hash decides if they changed.
+        """
+        entry = self.entries.get(url)
+        if entry is None or lastmod is None:
+            return True
+        return entry.get("lastmod") != lastmod
+
+    def update(self, url, lastmod, record_hash):
+        """Records the latest lastmod/hash and returns True if the content changed."""
+        entry = self.entries.get(url)
+        changed = entry is None or entry.get("hash") != record_hash
+        self.entries[url] = {"lastmod": lastmod, "hash": record_hash}
+        return changed
+
+    def save(self):
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as fp:
+            json.dump(self.entries, fp)
+        os.replace(tmp_path, self.path)
+
+
+def load_jsonl_records(path):
+    """
+    Reads a JSON lines file into a dict keyed by url (file order, last line wins).
+    Lines that are not JSON objects, e.g. one torn by a crash mid-write, are skipped.
+    """
+    records = {}
+    if not os.path.exists(path):
+        return records
+    with open(path, encoding="utf-8") as fp:
+        for line in fp:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if isinstance(record, dict):
+                records[record.get("url")] = record
+    return records
+
+
+def write_jsonl_records(path, records):
+    """Rewrites a JSON lines file through a temp file so a crash never leaves it half written."""
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as fp:
+        for record in records:
+            fp.write(json.dumps(record) + "\n")
+    os.replace(tmp_path, path)
@@ -0,0 +1,200 @@
+# Shared HTTP fetcher.
+# All of the scripts download through one requests.Session so connections to a
+# host are kept alive and reused instead of doing a new TCP+TLS handshake for
+# every robots file, sitemap and recipe page.
+
+import os
+import threading
+import time
+from collections import defaultdict
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from http_cache import DEFAULT_CACHE_DIR, HttpCache
+
+USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/139.0.0.0 Safari/537.36"
+
+# urllib3 only decodes brotli when one of these packages is installed,
+# so only advertise "br" when we can actually read it.
+try:
+    import brotli  # noqa: F401
+    ACCEPT_ENCODING = "gzip, deflate, br"
+except ImportError:
+    try:
+        import brotlicffi  # noqa: F401
+        ACCEPT_ENCODING = "gzip, deflate, br"
+    except ImportError:
+        ACCEPT_ENCODING = "gzip, deflate"
+
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+class FetchStats:
+    """Per-host request counts, timings and byte totals. Safe to share between threads."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = defaultdict(int)
+        self.errors = defaultdict(int)
+        self.seconds = defaultdict(float)
+        self.bytes = defaultdict(int)
+        self.statuses = defaultdict(int)
+
+    def record(self, url, seconds, status=None, nbytes=0):
+        host = urlparse(url).netloc
+        with self._lock:
+            self.requests[host] += 1
+            self.seconds[host] += seconds
+            self.bytes[host] += nbytes
+            if status is None:
+                self.errors[host] += 1
+            else:
+                self.statuses[status] += 1
+
+    def summary(self):
+        total = sum(self.requests.values())
+        seconds = sum(self.seconds.values())
+        average = seconds / total if total else 0
+        lines = [f"{total} requests to {len(self.requests)} host(s) in {seconds:.2f}s (avg {average:.3f}s)"]
+        for host in sorted(self.requests):
+            lines.append(f"  {host}: {self.requests[host]} requests, {self.errors[host]} errors, "
+                         f"{self.seconds[host]:.2f}s, {self.bytes[host] / 1024:.1f} KB")
+        if self.statuses:
+            lines.append("  statuses: " + ", ".join(f"{code}={n}" for code, n in sorted(self.statuses.items())))
+        return "\n".join(lines)
+
+
+class HostThrottle:
+    """
+    Keeps requests to one host at least `delay` seconds apart, across threads.
+    Hosts without a delay are not throttled.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.delays = {}
+        self._next_slot = {}
+
+    def set_delay(self, url, delay):
+        host = urlparse(url).netloc
+        with self._lock:
+            self.delays[host] = delay or 0
+
+    def wait(self, url):
+        host = urlparse(url).netloc
+        with self._lock:
+            delay = self.delays.get(host)
+            if not delay:
+                return
+            now = time.monotonic()
+            slot = max(now, self._next_slot.get(host, now))
+            self._next_slot[host] = slot + delay
+        if slot > now:
+            time.sleep(slot - now)
+
+
+class Fetcher:
+    """
+    A pooled HTTP client: keep-alive connections per host, gzip/brotli decoding,
+    retry with exponential backoff on 429/5xx (honouring Retry-After) and timing stats.
+    If `cache` is an HttpCache, GETs are revalidated against it and 304s served from disk.
+    """
+
+    def __init__(self, user_agent=USER_AGENT, pool_maxsize=10, retries=3, backoff_factor=0.5, timeout=30,
+                 cache=None):
+        self.timeout = timeout
+        self.cache = cache
+        self.stats = FetchStats()
+        self.throttle = HostThrottle()
+        self.session = requests.Session()
+        self.session.headers.update({"User-Agent": user_agent, "Accept-Encoding": ACCEPT_ENCODING})
+        retry = Retry(
+            total=retries,
+            backoff_factor=backoff_factor,
+            status_forcelist=RETRY_STATUSES,
+            allowed_methods=frozenset(["GET", "HEAD"]),
+            respect_retry_after_header=True,
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_maxsize=pool_maxsize, max_retries=retry)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def get(self, url, **kwargs):
+        """
+        Same as requests.get but through the shared session.
+        With stream=True the timing covers the time to the response headers.
+        """
+        kwargs.setdefault("timeout", self.timeout)
+        if self.cache is None:
+            return self._send(url, kwargs)
+        headers = kwargs.get("headers") or {}
+        kwargs["headers"] = {**headers, **self.cache.conditional_headers(url)}
+        response = self.cache.update(url, self._send(url, kwargs), stream=kwargs.get("stream", False))
+        if response is None:
+            # The cached copy was evicted after the validators were sent; fetch it in full
+            kwargs["headers"] = headers
+            response = self._send(url, kwargs)
+        return response
+
+    def _send(self, url, kwargs):
+        self.throttle.wait(url)
+        start = time.perf_counter()
+        try:
+            response = self.session.get(url, **kwargs)
+        except requests.RequestException:
+            self.stats.record(url, time.perf_counter() - start)
+            raise
+        if kwargs.get("stream"):
+            nbytes = int(response.headers.get("Content-Length") or 0)
+        else:
+            nbytes = len(response.content)
+        self.stats.record(url, time.perf_counter() - start, response.status_code, nbytes)
+        return response
+
+    def set_crawl_delay(self, url, delay):
+        """Spaces later requests to url's host by `delay` seconds (e.g. robots.txt crawl-delay)."""
+        self.throttle.set_delay(url, delay)
+
+    def connections_opened(self):
+        """Number of TCP connections opened so far, summed over every host pool."""
+        total = 0
+        for adapter in set(self.session.adapters.values()):
+            pools = adapter.poolmanager.pools
+            for key in pools.keys():
+                pool = pools.get(key)
+                if pool is not None:
+                    total += pool.num_connections
+        return total
+
+    def summary(self):
+        text = self.stats.summary() + f"\n  connections opened: {self.connections_opened()}"
+        if self.cache is not None:
+            text += "\n  " + self.cache.summary()
+        return text
+
+    def close(self):
+        if self.cache is not None:
+            self.cache.close()
+        self.session.close()
+
+
+_default_fetcher = None
+_default_lock = threading.Lock()
+
+
+def get_fetcher():
+    """
+    Returns the process-wide Fetcher, creating it on first use.
+    It caches to .http_cache/ unless HTTP_CACHE_DIR is set (an empty value turns the cache off).
+    """
+    global _default_fetcher
+    with _default_lock:
+        if _default_fetcher is None:
+            cache_dir = os.environ.get("HTTP_CACHE_DIR", DEFAULT_CACHE_DIR)
+            cache = HttpCache(cache_dir) if cache_dir else None
+            _default_fetcher = Fetcher(cache=cache)
+        return _default_fetcher
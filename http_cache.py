@@ -0,0 +1,222 @@
+# On-disk HTTP cache used by fetcher.Fetcher.
+# Bodies are stored with their ETag / Last-Modified validators. Later requests
+# for the same URL are sent as conditional GETs (If-None-Match /
+# If-Modified-Since) and a 304 answer is served from disk. The cache is bounded
+# by total body size and evicts the least recently used entries first.
+# The index is written every SAVE_EVERY changes and on close()/exit, not after
+# every response; writes go through a unique temp file under the lock, so
+# threads fetching in parallel never trip over each other's index file.
+
+import atexit
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+
+import requests
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+
+DEFAULT_CACHE_DIR = ".http_cache"
+DEFAULT_MAX_BYTES = 200 * 1024 * 1024
+CHUNK_SIZE = 64 * 1024
+SAVE_EVERY = 100
+
+# The stored body is already decoded, so these no longer describe it
+DROPPED_HEADERS = ("Content-Encoding", "Content-Length", "Transfer-Encoding")
+
+
+class HttpCache:
+    """
+    A size-bounded LRU cache of response bodies on disk.
+    hits/misses/stores/evictions count what happened since the cache was opened.
+    """
+
+    def __init__(self, directory=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES, save_every=SAVE_EVERY):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.save_every = save_every
+        self.index_path = os.path.join(directory, "index.json")
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+        self._lock = threading.RLock()
+        # Changes to the index since it was last written
+        self._dirty = 0
+        os.makedirs(directory, exist_ok=True)
+        # url -> entry, oldest use first
+        self.entries = OrderedDict()
+        if os.path.exists(self.index_path):
+            with open(self.index_path, encoding="utf-8") as fp:
+                self.entries.update(json.load(fp))
+        self.total_bytes = sum(entry["size"] for entry in self.entries.values())
+        atexit.register(self.save)
+
+    def _body_path(self, url):
+        return os.path.join(self.directory, hashlib.sha1(url.encode("utf-8")).hexdigest() + ".body")
+
+    def conditional_headers(self, url):
+        """Returns the If-None-Match / If-Modified-Since headers for a cached URL."""
+        entry = self.entries.get(url)
+        if not entry:
+            return {}
+        headers = {}
+        if entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+    def update(self, url, response, stream=False):
+        """
+        Takes the response to a (possibly conditional) GET and returns the response
+        the caller should see: the cached copy on 304, otherwise the live one.
+        Cacheable 200 responses are written to disk while they are read.
+        Returns None if the cached copy was evicted before it could be served;
+        the caller should then GET the URL again without validators.
+        """
+        if response.status_code == 304:
+            response.close()
+            with self._lock:
+                opened = self._open_entry(url)
+                if opened is not None:
+                    self.hits += 1
+                    self.entries.move_to_end(url)
+                    self._dirty += 1
+            if opened is None:
+                return None
+            return self._cached_response(url, response, opened, stream)
+
+        with self._lock:
+            self.misses += 1
+        etag = response.headers.get("ETag")
+        last_modified = response.headers.get("Last-Modified")
+        if response.status_code != 200 or not (etag or last_modified):
+            if response.status_code == 200:
+                self._forget(url)
+            return response
+
+        self._store(url, response, etag, last_modified)
+        opened = self._open_entry(url)
+        if opened is None:
+            return None
+        return self._cached_response(url, response, opened, stream)
+
+    def _temp_file(self, suffix):
+        # A unique name per call: two threads storing the same URL must not share a temp file
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=suffix)
+        return os.fdopen(fd, "wb"), tmp_path
+
+    def _store(self, url, response, etag, last_modified):
+        path = self._body_path(url)
+        fp, tmp_path = self._temp_file(".body.tmp")
+        size = 0
+        try:
+            with fp:
+                for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+                    fp.write(chunk)
+                    size += len(chunk)
+            os.replace(tmp_path, path)
+        except BaseException:
+            try:
+                os.remove(tmp_path)
+            except FileNotFoundError:
+                pass
+            raise
+        headers = {k: v for k, v in response.headers.items() if k not in DROPPED_HEADERS}
+        with self._lock:
+            old = self.entries.pop(url, None)
+            if old:
+                self.total_bytes -= old["size"]
+            self.entries[url] = {
+                "etag": etag,
+                "last_modified": last_modified,
+                "headers": headers,
+                "size": size,
+            }
+            self.total_bytes += size
+            self.stores += 1
+            self._dirty += 1
+            self._evict()
+            if self._dirty >= self.save_every:
+                self.save()
+
+    def _evict(self):
+        # Always keep the newest entry, even if it alone is over the limit
+        while self.total_bytes > self.max_bytes and len(self.entries) > 1:
+            url, entry = self.entries.popitem(last=False)
+            self.total_bytes -= entry["size"]
+            self.evictions += 1
+            try:
+                os.remove(self._body_path(url))
+            except FileNotFoundError:
+                pass
+
+    def _forget(self, url):
+        with self._lock:
+            entry = self.entries.pop(url, None)
+            if entry:
+                self.total_bytes -= entry["size"]
+                self._dirty += 1
+        if entry:
+            try:
+                os.remove(self._body_path(url))
+            except FileNotFoundError:
+                pass
+
+    def _open_entry(self, url):
+        """
+        Returns (entry, open body file) for url, or None if it is not cached.
+        Both are read under the lock, so eviction cannot remove the body in between.
+        """
+        with self._lock:
+            entry = self.entries.get(url)
+            if entry is None:
+                return None
+            return entry, open(self._body_path(url), "rb")
+
+    def _cached_response(self, url, original, opened, stream):
+        entry, body = opened
+        cached = requests.Response()
+        cached.status_code = 200
+        cached.reason = "OK"
+        cached.url = url
+        cached.request = original.request
+        cached.headers = CaseInsensitiveDict(entry["headers"])
+        cached.encoding = get_encoding_from_headers(cached.headers)
+        cached.raw = body
+        if not stream:
+            cached._content = cached.raw.read()
+            cached.raw.close()
+        return cached
+
+    def save(self):
+        """Writes the index to disk (atomically) if it changed since the last save."""
+        with self._lock:
+            if not self._dirty:
+                return
+            fp, tmp_path = self._temp_file(".json.tmp")
+            try:
+                with fp:
+                    fp.write(json.dumps(self.entries).encode("utf-8"))
+                os.replace(tmp_path, self.index_path)
+            except BaseException:
+                try:
+                    os.remove(tmp_path)
+                except FileNotFoundError:
+                    pass
+                raise
+            self._dirty = 0
+
+    def close(self):
+        """Saves pending index changes; call when done fetching (also runs at exit)."""
+        self.save()
+        atexit.unregister(self.save)
+
+    def summary(self):
+        return (f"cache: {self.hits} hits, {self.misses} misses, {self.stores} stored, "
+                f"{self.evictions} evicted, {len(self.entries)} entries, "
+                f"{self.total_bytes / (1024 * 1024):.1f} MB on disk")
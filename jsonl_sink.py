@@ -0,0 +1,104 @@
+# Buffered, crash-safe JSON lines writer.
+# Records are buffered and written in batches through one open file handle.
+# When the file is opened, a torn last line left by a crash is cut off, and the
+# keys (URLs) already in the file are loaded so a rerun can skip them and resume
+# where the previous run stopped.
+
+import json
+import os
+
+FSYNC_POLICIES = ("never", "flush", "close")
+
+
+class JsonlSink:
+    """
+    Appends JSON records to `path`, one per line, skipping records whose `key`
+    value is already in the file.
+    flush_every: records to buffer before writing them out.
+    fsync: "never", after every "flush", or only on "close".
+    """
+
+    def __init__(self, path, key="url", flush_every=50, fsync="close"):
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError(f"fsync must be one of {FSYNC_POLICIES}, not {fsync!r}")
+        self.path = path
+        self.key = key
+        self.flush_every = flush_every
+        self.fsync = fsync
+        self.seen = set()
+        self.buffer = []
+        self.written = 0
+        self.skipped = 0
+        self._load_existing()
+        self.file = open(path, "a", encoding="utf-8")
+
+    def _load_existing(self):
+        """
+        Reads the keys already in the file and truncates a torn or unparsable last line.
+        A complete last record that only lacks its newline is kept and the newline added.
+        """
+        if not os.path.exists(self.path):
+            return
+        offset = 0
+        torn_at = None
+        missing_newline = False
+        with open(self.path, "rb") as fp:
+            for line in fp:
+                try:
+                    if line.strip():
+                        record = json.loads(line)
+                        if not isinstance(record, dict):
+                            raise ValueError("not a JSON object")
+                        self.seen.add(record.get(self.key))
+                    torn_at = None
+                    missing_newline = not line.endswith(b"\n")
+                except ValueError:
+                    if torn_at is None:
+                        torn_at = offset
+                offset += len(line)
+        # Only bad lines at the very end are a torn write; bad lines in the middle are left alone
+        if torn_at is not None:
+            print(f"Truncating {offset - torn_at} bytes of incomplete output from {self.path}")
+            with open(self.path, "r+b") as fp:
+                fp.truncate(torn_at)
+        elif missing_newline:
+            with open(self.path, "ab") as fp:
+                fp.write(b"\n")
+
+    def __contains__(self, key):
+        return key in self.seen
+
+    def write(self, record):
+        """Buffers one record. Returns False (and writes nothing) if its key was already written."""
+        key = record.get(self.key)
+        if key in self.seen:
+            self.skipped += 1
+            return False
+        self.seen.add(key)
+        self.buffer.append(json.dumps(record))
+        if len(self.buffer) >= self.flush_every:
+            self.flush()
+        return True
+
+    def flush(self):
+        if self.buffer:
+            self.file.write("\n".join(self.buffer) + "\n")
+            self.written += len(self.buffer)
+            self.buffer = []
+        self.file.flush()
+        if self.fsync == "flush":
+            os.fsync(self.file.fileno())
+
+    def close(self):
+        if self.file.closed:
+            return
+        self.flush()
+        if self.fsync == "close":
+            os.fsync(self.file.fileno())
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
@@ -0,0 +1,197 @@
+# Columnar export of scraped recipes.
+# Reads a JSON lines file once (recipes.jsonl from HomeWork3.py, or recipes.jl /
+# recipes_valid.jl from the Scrapy project) and writes it as an Arrow IPC file
+# (.arrow) or Parquet (.parquet) with typed columns:
+#   - author and extraction as dictionary (categorical) columns, categories as a
+#     list of dictionary values,
+#   - servings and prep/cook/total time in minutes as integers,
+#   - one float column per macro (calories, protein_g, ...) next to the raw
+#     nutrition text.
+# The typed columns come from recipe_normalize.normalize_frame, which parses
+# whole columns at once and counts the values it could not read.
+# Arrow IPC files are memory-mapped when loaded, so a report reading two columns
+# of a large export only touches those columns' pages and loads in milliseconds.
+#   python recipe_export.py recipes.jsonl recipes.arrow
+#   python recipe_export.py recipes_valid.jl recipes.parquet --compression zstd
+#   python recipe_export.py --show recipes.arrow calories protein_g
+
+import argparse
+import gzip
+import json
+import os
+import sys
+import time
+
+try:
+    import pyarrow as pa
+    import pyarrow.ipc
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+from recipe_normalize import MACRO_COLUMNS, TIME_FIELDS, normalize_columns
+
+STRING_COLUMNS = ("url", "title", "publish_date", "image", "nutrition", "scraped")
+CATEGORICAL_COLUMNS = ("author", "extraction")
+LIST_COLUMNS = ("ingredients", "instructions", "notes")
+ARROW_EXTENSIONS = (".arrow", ".feather", ".ipc")
+PARQUET_EXTENSIONS = (".parquet", ".pq")
+
+
+def _require_pyarrow():
+    if pa is None:
+        raise ImportError("recipe_export.py needs pyarrow (pip install pyarrow)")
+
+
+def _text(value):
+    if value is None:
+        return None
+    if isinstance(value, (list, tuple)):
+        return " | ".join(str(v) for v in value) or None
+    return str(value)
+
+
+def _strings(value):
+    if value is None:
+        return []
+    if isinstance(value, str):
+        return [value]
+    return [str(v) for v in value]
+
+
+def _float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+# This function yields every record in a JSON lines file (gzip if it ends in .gz), skipping bad lines.
+def read_records(path):
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rb") as fp:
+        for line in fp:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if isinstance(record, dict):
+                yield record
+
+
+# This function returns the format ("arrow" or "parquet") implied by a file name.
+def format_for(path):
+    ext = os.path.splitext(path)[1].lower()
+    if ext in ARROW_EXTENSIONS:
+        return "arrow"
+    if ext in PARQUET_EXTENSIONS:
+        return "parquet"
+    raise ValueError(f"cannot tell the format of {path}; use one of {ARROW_EXTENSIONS + PARQUET_EXTENSIONS}")
+
+
+def _categorical_lists(rows):
+    """list<dictionary<int32, string>>: one dictionary shared by every row's values."""
+    offsets = [0]
+    flat = []
+    for values in rows:
+        flat.extend(values)
+        offsets.append(len(flat))
+    values = pa.array(flat, pa.string()).dictionary_encode()
+    return pa.ListArray.from_arrays(pa.array(offsets, pa.int32()), values)
+
+
+# This function builds the typed table for a list of recipe records.
+# Returns the table and the parse-failure counts (None without pandas).
+def build_table(records):
+    _require_pyarrow()
+    typed, failures = normalize_columns(records)
+    columns = {}
+    for name in STRING_COLUMNS:
+        columns[name] = pa.array([_text(r.get(name)) for r in records], pa.string())
+    for name in CATEGORICAL_COLUMNS:
+        columns[name] = pa.array([_text(r.get(name)) for r in records], pa.string()).dictionary_encode()
+    columns["categories"] = _categorical_lists([_strings(r.get("categories")) for r in records])
+    for name in LIST_COLUMNS:
+        columns[name] = pa.array([_strings(r.get(name)) for r in records], pa.list_(pa.string()))
+    columns["servings"] = pa.array(typed["servings"], pa.int32())
+    for field in TIME_FIELDS:
+        columns[field + "_min"] = pa.array(typed[field + "_min"], pa.int32())
+    for name in MACRO_COLUMNS:
+        columns[name] = pa.array(typed[name], pa.float32())
+    columns["ratings"] = pa.array([_float(r.get("ratings")) for r in records], pa.float32())
+    return pa.table(columns), failures
+
+
+# This function writes a table as Arrow IPC or Parquet, chosen by fmt or the file extension.
+# Arrow files are written uncompressed by default: compressed buffers cannot be memory-mapped.
+def write_table(table, path, fmt=None, compression=None):
+    _require_pyarrow()
+    fmt = fmt or format_for(path)
+    tmp_path = path + ".tmp"
+    if fmt == "arrow":
+        options = pa.ipc.IpcWriteOptions(compression=compression)
+        with pa.OSFile(tmp_path, "wb") as sink:
+            with pa.ipc.new_file(sink, table.schema, options=options) as writer:
+                writer.write_table(table)
+    elif fmt == "parquet":
+        # Parquet pages are dictionary-encoded anyway; a list of dictionary values
+        # is stored as a list of strings
+        index = table.schema.get_field_index("categories")
+        if index != -1:
+            table = table.set_column(index, "categories", table.column("categories").cast(pa.list_(pa.string())))
+        pq.write_table(table, tmp_path, compression=compression or "snappy")
+    else:
+        raise ValueError(f"fmt must be 'arrow' or 'parquet', not {fmt!r}")
+    os.replace(tmp_path, path)
+
+
+# This function loads an export, memory-mapped, optionally reading only some columns.
+def load_table(path, columns=None):
+    _require_pyarrow()
+    if format_for(path) == "arrow":
+        table = pa.ipc.open_file(pa.memory_map(path, "r")).read_all()
+        return table.select(columns) if columns else table
+    return pq.read_table(path, columns=columns, memory_map=True)
+
+
+# This function exports a JSON lines file; returns the table that was written and the failure counts.
+def export(src, dst, fmt=None, compression=None):
+    table, failures = build_table(list(read_records(src)))
+    write_table(table, dst, fmt=fmt, compression=compression)
+    return table, failures
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export scraped recipes to Arrow IPC or Parquet.")
+    parser.add_argument("src", help="JSON lines input, or the export to load with --show")
+    parser.add_argument("dst", nargs="*", help="output file (.arrow or .parquet), or columns with --show")
+    parser.add_argument("--format", choices=("arrow", "parquet"), help="default: from the output extension")
+    parser.add_argument("--compression", help="e.g. zstd, lz4 or snappy (default: none for Arrow, snappy for Parquet)")
+    parser.add_argument("--show", action="store_true", help="load an export and print its schema and row count")
+    args = parser.parse_args(argv)
+    if pa is None:
+        sys.exit("recipe_export.py needs pyarrow (pip install pyarrow)")
+
+    if args.show:
+        start = time.perf_counter()
+        table = load_table(args.src, args.dst or None)
+        elapsed = (time.perf_counter() - start) * 1000
+        print(table.schema)
+        print(f"{table.num_rows} rows, {table.num_columns} columns loaded in {elapsed:.1f} ms")
+        return 0
+
+    if len(args.dst) != 1:
+        parser.error("give one output file")
+    start = time.perf_counter()
+    table, failures = export(args.src, args.dst[0], fmt=args.format, compression=args.compression)
+    elapsed = time.perf_counter() - start
+    size = os.path.getsize(args.dst[0])
+    print(f"Wrote {table.num_rows} recipes to {args.dst[0]} ({size} bytes) in {elapsed:.2f}s")
+    if failures:
+        unreadable = ", ".join(f"{field}={count}" for field, count in failures.items() if count)
+        print(f"Unreadable values: {unreadable or 'none'}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
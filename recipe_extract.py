@@ -0,0 +1,214 @@
+# Recipe extraction engines.
+# Each extractor turns a recipe page's HTML into the same dictionary of fields.
+#   bs4  - the original BeautifulSoup/html.parser code, kept as the reference.
+#   lxml - builds the tree with lxml's C parser and collects every field in one
+#          walk over the document instead of a separate soup.find per field.
+# Running this file compares both extractors on saved pages, e.g.
+#   python recipe_extract.py .http_cache/*.body
+# and exits non-zero if any page produces different dictionaries.
+# tests/test_recipe_extract.py does the same on the pages in tests/fixtures/pages.
+
+import sys
+
+from bs4 import BeautifulSoup, UnicodeDammit
+
+try:
+    import lxml.html
+except ImportError:
+    lxml = None
+
+FIELDS = ("title", "servings", "prep_time", "cook_time", "ingredients", "instructions", "notes", "nutrition")
+
+# Text inside these elements is not part of get_text() in BeautifulSoup either
+SKIPPED_TEXT_TAGS = ("script", "style", "template")
+
+
+class SoupExtractor:
+    """
+    Reference extractor: the BeautifulSoup/html.parser code HomeWork3.py always used.
+    html.parser does not close elements the HTML spec closes implicitly, so on
+    malformed pages (an unclosed <li> swallows every following item) it differs
+    from the lxml extractor; the parity check reports those pages.
+    """
+
+    name = "bs4"
+    tree_builder = "html.parser"
+
+    def extract(self, html):
+        soup = BeautifulSoup(html, self.tree_builder)
+        recipe = {}
+
+        # Title (usually in <h1>)
+        recipe['title'] = soup.find('h1').get_text(strip=True) if soup.find('h1') else None
+
+        # Servings
+        servings = soup.find(class_="wprm-recipe-servings")
+        recipe['servings'] = servings.get_text(strip=True) if servings else None
+
+        # Prep time
+        prep_time = soup.find(class_="wprm-recipe-prep-time")
+        recipe['prep_time'] = prep_time.get_text(strip=True) if prep_time else None
+
+        # Cook time
+        cook_time = soup.find(class_="wprm-recipe-cook-time")
+        recipe['cook_time'] = cook_time.get_text(strip=True) if cook_time else None
+
+        # Ingredients
+        ingredients_list = []
+        ingredients_ul = soup.find("ul", class_="wprm-recipe-ingredients")
+        if ingredients_ul:
+            for li in ingredients_ul.find_all("li"):
+                ingredients_list.append(li.get_text(strip=True))
+        recipe['ingredients'] = ingredients_list
+
+        # Instructions
+        instructions_list = []
+        instructions_ul = soup.find("ul", class_="wprm-recipe-instructions")
+        if instructions_ul:
+            for li in instructions_ul.find_all("li"):
+                instructions_list.append(li.get_text(strip=True))
+        recipe['instructions'] = instructions_list
+
+        # Notes
+        notes_div = soup.find("div", class_="wprm-recipe-notes")
+        notes = []
+        if notes_div:
+            for li in notes_div.find_all("li"):
+                notes.append(li.get_text(strip=True))
+            # If notes are not in <li>, get the text directly
+            if not notes and notes_div.get_text(strip=True):
+                notes.append(notes_div.get_text(strip=True))
+        recipe['notes'] = notes
+
+        # Nutrition
+        nutrition_div = soup.find("div", class_="wprm-recipe-nutrition")
+        recipe['nutrition'] = nutrition_div.get_text(strip=True) if nutrition_div else None
+
+        return recipe
+
+
+def _text_parts(element):
+    if element.text and element.tag not in SKIPPED_TEXT_TAGS:
+        yield element.text
+    for child in element:
+        # Comments and processing instructions have a non-string tag; skip their text, keep their tail
+        if isinstance(child.tag, str):
+            yield from _text_parts(child)
+        if child.tail:
+            yield child.tail
+
+
+# Same result as BeautifulSoup's get_text(strip=True)
+def _text(element):
+    return "".join(part.strip() for part in _text_parts(element))
+
+
+def _li_texts(element):
+    return [_text(li) for li in element.iter("li")]
+
+
+class LxmlExtractor:
+    """Fast extractor: lxml tree, one pass over the elements for all fields."""
+
+    name = "lxml"
+
+    def extract(self, html):
+        if isinstance(html, bytes):
+            # Decode the way BeautifulSoup does: the declared charset (BOM, <meta>), then UTF-8, then Windows-1252
+            html = UnicodeDammit(html, is_html=True).unicode_markup
+        root = lxml.html.document_fromstring(html)
+        recipe = {
+            "title": None,
+            "servings": None,
+            "prep_time": None,
+            "cook_time": None,
+            "ingredients": None,
+            "instructions": None,
+            "notes": None,
+            "nutrition": None,
+        }
+        # Like soup.find, every field takes the first match in document order
+        for element in root.iter():
+            tag = element.tag
+            if not isinstance(tag, str):
+                continue
+            if tag == "h1":
+                if recipe["title"] is None:
+                    recipe["title"] = _text(element)
+                continue
+            class_attr = element.get("class")
+            if not class_attr or "wprm-recipe-" not in class_attr:
+                continue
+            classes = class_attr.split()
+            if recipe["servings"] is None and "wprm-recipe-servings" in classes:
+                recipe["servings"] = _text(element)
+            if recipe["prep_time"] is None and "wprm-recipe-prep-time" in classes:
+                recipe["prep_time"] = _text(element)
+            if recipe["cook_time"] is None and "wprm-recipe-cook-time" in classes:
+                recipe["cook_time"] = _text(element)
+            if tag == "ul":
+                if recipe["ingredients"] is None and "wprm-recipe-ingredients" in classes:
+                    recipe["ingredients"] = _li_texts(element)
+                if recipe["instructions"] is None and "wprm-recipe-instructions" in classes:
+                    recipe["instructions"] = _li_texts(element)
+            elif tag == "div":
+                if recipe["notes"] is None and "wprm-recipe-notes" in classes:
+                    notes = _li_texts(element)
+                    # If notes are not in <li>, get the text directly
+                    if not notes and _text(element):
+                        notes.append(_text(element))
+                    recipe["notes"] = notes
+                if recipe["nutrition"] is None and "wprm-recipe-nutrition" in classes:
+                    recipe["nutrition"] = _text(element)
+        for field in ("ingredients", "instructions", "notes"):
+            if recipe[field] is None:
+                recipe[field] = []
+        return recipe
+
+
+EXTRACTORS = {
+    SoupExtractor.name: SoupExtractor,
+    LxmlExtractor.name: LxmlExtractor,
+}
+
+DEFAULT_EXTRACTOR = "lxml" if lxml is not None else "bs4"
+
+_instances = {}
+
+
+def get_extractor(name=None):
+    """Returns the extractor called `name` (default: lxml when installed, else bs4)."""
+    name = name or DEFAULT_EXTRACTOR
+    if name == "lxml" and lxml is None:
+        raise ImportError("The lxml extractor needs the lxml package (pip install lxml)")
+    if name not in _instances:
+        _instances[name] = EXTRACTORS[name]()
+    return _instances[name]
+
+
+# This function runs both extractors on the same HTML and returns the fields they disagree on.
+def compare_extractors(html):
+    reference = get_extractor("bs4").extract(html)
+    fast = get_extractor("lxml").extract(html)
+    return [field for field in FIELDS if reference.get(field) != fast.get(field)]
+
+
+def check_parity(paths):
+    """Compares both extractors on each saved page. Returns the number of pages that differ."""
+    mismatched = 0
+    for path in paths:
+        with open(path, "rb") as fp:
+            html = fp.read()
+        fields = compare_extractors(html)
+        if fields:
+            mismatched += 1
+            print(f"MISMATCH {path}: {', '.join(fields)}")
+    print(f"{len(paths) - mismatched}/{len(paths)} pages identical")
+    return mismatched
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("usage: python recipe_extract.py PAGE.html [PAGE.html ...]")
+        sys.exit(2)
+    sys.exit(1 if check_parity(sys.argv[1:]) else 0)
@@ -0,0 +1,434 @@
+# In-memory index for multi-criteria recipe queries, e.g.
+# "chicken AND rice, at least 30g protein, ready in 30 minutes or less".
+#   - Ingredients: an inverted index from ingredient word to the recipes that
+#     use it. Each posting list is a bitmap held in a plain Python int (bit i set
+#     = recipe id i), so "chicken AND rice" is a single `&` over machine words
+#     instead of a set intersection.
+#   - Numbers: for servings, the times in minutes and every macro from
+#     recipe_normalize, one sorted array of values with the matching recipe ids.
+#     A range filter is two bisects; the ids between them become a bitmap, or,
+#     when the ingredient filter already left fewer recipes than the range holds,
+#     the candidates are checked one by one instead.
+# Recipes can be added, replaced (same URL) and removed as new crawl output
+# arrives, and the index is pickled to disk so a service can load it at startup
+# instead of re-parsing every JSON line.
+#   python recipe_index.py add recipes.jsonl Scrapy_project/recipes_valid.jl
+#   python recipe_index.py query --has chicken --has rice --min protein_g=30 --max total_time_min=30
+
+import argparse
+import gzip
+import json
+import os
+import pickle
+import re
+import sys
+import time
+from array import array
+from bisect import bisect_left, bisect_right
+from itertools import compress
+
+from recipe_normalize import TYPED_COLUMNS, normalize_record
+
+DEFAULT_INDEX_FILE = "recipes.idx"
+INDEX_VERSION = 1
+NUMERIC_FIELDS = TYPED_COLUMNS
+
+# Letters only, split at case changes: "8slicesDeli" -> "slices", "Deli"; "BBQSauce" -> "BBQ", "Sauce"
+WORD_RE = re.compile(r"[A-Z]?[a-z]+|[A-Z]+(?![a-z])")
+# Quantities, units and preparation words that say nothing about what is in the recipe
+STOPWORDS = frozenset("""
+    a an and or of to for the with without into in on as at by about
+    cup cups c tbsp tbs tablespoon tablespoons tsp teaspoon teaspoons oz ounce ounces lb lbs pound pounds
+    g gram grams kg ml l liter litre quart quarts pint pints pinch dash can cans jar jars pack package
+    packages packet bag box container slice slices clove cloves piece pieces stick sticks bunch sprig sprigs
+    scoop scoops serving servings whole half
+    large medium small fresh freshly chopped diced minced sliced shredded grated crushed ground melted
+    softened divided optional taste plus more needed desired juiced peeled cooked uncooked raw finely
+    roughly thinly about approx
+""".split())
+# Bits set in each byte value, for turning a sparse bitmap back into ids
+_BYTE_BITS = tuple(tuple(bit for bit in range(8) if value >> bit & 1) for value in range(256))
+_DIGITS_TO_FLAGS = bytes.maketrans(b"01", b"\x00\x01")
+_FLAGS_TO_DIGITS = bytes.maketrans(b"\x00\x01", b"01")
+# Word as written -> index token ("" for stopwords). Ingredient lists reuse a
+# small vocabulary, so this stays small and saves re-stemming every word.
+_TOKENS = {}
+
+
+# This function reduces a word to a crude singular so "tomatoes" finds "tomato"
+# and "berries" finds "berry". It only has to agree with itself: queries go
+# through the same function.
+def _stem(word):
+    if len(word) <= 3 or word.endswith("ss"):
+        return word
+    if word.endswith("ies"):
+        return word[:-3] + "y"
+    if word.endswith(("oes", "ches", "shes", "xes")):
+        return word[:-2]
+    if word.endswith("s"):
+        return word[:-1]
+    return word
+
+
+def _token(word):
+    lower = word.lower()
+    token = "" if lower in STOPWORDS else _stem(lower)
+    token = _TOKENS[word] = "" if token in STOPWORDS else sys.intern(token)
+    return token
+
+
+# This function returns the ingredient words of a list of ingredient lines (or one line).
+# The scraped lines look like "▢8slicesDeli Chicken", so digits and camel case split words.
+def ingredient_tokens(ingredients):
+    if ingredients is None:
+        return set()
+    if isinstance(ingredients, str):
+        ingredients = [ingredients]
+    words = WORD_RE.findall(" ".join(map(str, ingredients)))
+    tokens = {_TOKENS[word] if word in _TOKENS else _token(word) for word in words}
+    tokens.discard("")
+    return tokens
+
+
+# This function returns the NUMERIC_FIELDS values of a record as a tuple (None where unknown).
+# A missing total time is taken as prep + cook time when both are known.
+def numeric_values(record):
+    typed = normalize_record(record)
+    if typed["total_time_min"] is None and typed["prep_time_min"] is not None \
+            and typed["cook_time_min"] is not None:
+        typed["total_time_min"] = typed["prep_time_min"] + typed["cook_time_min"]
+    return tuple(None if typed[field] is None else float(typed[field]) for field in NUMERIC_FIELDS)
+
+
+# This function yields every record with a url in a JSON lines file (gzip if it ends in .gz).
+def read_records(path):
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rb") as fp:
+        for line in fp:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if isinstance(record, dict) and record.get("url"):
+                yield record
+
+
+# This function returns the ids whose bits are set in a bitmap, in ascending order.
+# A dense bitmap is spelled out as one flag byte per id and picked apart by
+# compress() in C; a sparse one is walked byte by byte, skipping the zeros.
+def bitmap_ids(bits):
+    size = bits.bit_length()
+    if bits.bit_count() * 16 >= size:
+        flags = bin(bits)[:1:-1].encode("ascii").translate(_DIGITS_TO_FLAGS)
+        return list(compress(range(size), flags))
+    ids = []
+    for offset, byte in enumerate(bits.to_bytes((bits.bit_length() + 7) // 8, "little")):
+        if byte:
+            base = offset * 8
+            ids.extend(base + bit for bit in _BYTE_BITS[byte])
+    return ids
+
+
+# This function returns a bitmap with the given ids set.
+def ids_bitmap(ids):
+    if not ids:
+        return 0
+    size = max(ids) + 1
+    if len(ids) * 16 >= size:
+        flags = bytearray(size)
+        for i in ids:
+            flags[i] = 1
+        return int(flags[::-1].translate(_FLAGS_TO_DIGITS), 2)
+    data = bytearray(size // 8 + 1)
+    for i in ids:
+        data[i >> 3] |= 1 << (i & 7)
+    return int.from_bytes(data, "little")
+
+
+class RecipeIndex:
+    """
+    Recipes by ingredient word and numeric field, queried with bitmaps.
+    Recipe ids are small ints; the ids of removed recipes are reused.
+    """
+
+    def __init__(self):
+        self.docs = []        # id -> (url, ingredient tokens, NUMERIC_FIELDS values), None if free
+        self.by_url = {}      # url -> id
+        self.free = []        # ids of removed recipes, reused by add()
+        self.live = 0         # bitmap of the ids in use
+        self.postings = {}    # ingredient word -> bitmap of recipe ids
+        # field -> (sorted values, recipe id of each value)
+        self.ranges = {field: (array("d"), array("l")) for field in NUMERIC_FIELDS}
+
+    def __len__(self):
+        return len(self.by_url)
+
+    def __contains__(self, url):
+        return url in self.by_url
+
+    def add(self, record):
+        """
+        Indexes a recipe record, replacing the one with the same url.
+        Returns False if the record was already indexed with the same contents.
+        """
+        return self.add_many([record]) > 0
+
+    def add_many(self, records):
+        """
+        Adds (or replaces) every record; returns how many were new or changed.
+        Bitmaps and range arrays are updated once for the whole batch: setting
+        one bit at a time copies a posting int per recipe, which adds up to
+        minutes on a large crawl.
+        """
+        batch = {}
+        for record in records:
+            # A url seen twice in one batch keeps its last record
+            batch[record["url"]] = (tuple(sorted(ingredient_tokens(record.get("ingredients")))),
+                                    numeric_values(record))
+        new_ids = []
+        token_ids = {}
+        field_values = {field: [] for field in NUMERIC_FIELDS}
+        for url, (tokens, values) in batch.items():
+            doc_id = self.by_url.get(url)
+            if doc_id is not None:
+                if self.docs[doc_id][1:] == (tokens, values):
+                    continue
+                self.remove(url)
+            if self.free:
+                doc_id = self.free.pop()
+                self.docs[doc_id] = (url, tokens, values)
+            else:
+                doc_id = len(self.docs)
+                self.docs.append((url, tokens, values))
+            self.by_url[url] = doc_id
+            new_ids.append(doc_id)
+            for token in tokens:
+                token_ids.setdefault(token, []).append(doc_id)
+            for field, value in zip(NUMERIC_FIELDS, values):
+                if value is not None:
+                    field_values[field].append((value, doc_id))
+
+        self.live |= ids_bitmap(new_ids)
+        for token, ids in token_ids.items():
+            self.postings[token] = self.postings.get(token, 0) | ids_bitmap(ids)
+        for field, pairs in field_values.items():
+            if pairs:
+                self._insert_values(field, pairs)
+        return len(new_ids)
+
+    def _insert_values(self, field, pairs):
+        keys, ids = self.ranges[field]
+        if len(pairs) * 16 < len(keys):
+            # A few values: insert each in place
+            for value, doc_id in pairs:
+                position = bisect_right(keys, value)
+                keys.insert(position, value)
+                ids.insert(position, doc_id)
+            return
+        merged = sorted(list(zip(keys, ids)) + pairs)
+        self.ranges[field] = (array("d", [value for value, _ in merged]),
+                              array("l", [doc_id for _, doc_id in merged]))
+
+    def remove(self, url):
+        """Drops a recipe from the index; returns False if it was not indexed."""
+        doc_id = self.by_url.pop(url, None)
+        if doc_id is None:
+            return False
+        _, tokens, values = self.docs[doc_id]
+        bit = 1 << doc_id
+        self.live &= ~bit
+        for token in tokens:
+            remaining = self.postings[token] & ~bit
+            if remaining:
+                self.postings[token] = remaining
+            else:
+                del self.postings[token]
+        for field, value in zip(NUMERIC_FIELDS, values):
+            if value is not None:
+                keys, ids = self.ranges[field]
+                position = bisect_left(keys, value)
+                while ids[position] != doc_id:
+                    position += 1
+                del keys[position]
+                del ids[position]
+        self.docs[doc_id] = None
+        self.free.append(doc_id)
+        return True
+
+    def _span(self, field, low, high):
+        keys = self.ranges[field][0]
+        start = 0 if low is None else bisect_left(keys, low)
+        stop = len(keys) if high is None else bisect_right(keys, high)
+        return start, max(start, stop)
+
+    def query(self, include=(), exclude=(), ranges=None, limit=None):
+        """
+        Returns the urls of the recipes that use every ingredient in `include`,
+        none in `exclude`, and have each field in `ranges` within its
+        (low, high) bounds, inclusive; None leaves a bound open. A recipe with an
+        unknown value for a filtered field does not match. Example:
+            index.query(["chicken", "rice"], ranges={"protein_g": (30, None), "total_time_min": (None, 30)})
+        Ingredients are matched word by word: "cottage cheese" needs both words.
+        """
+        ids = self.match(include, exclude, ranges)
+        if limit is not None:
+            ids = ids[:limit]
+        return [self.docs[doc_id][0] for doc_id in ids]
+
+    def match(self, include=(), exclude=(), ranges=None):
+        """Like query(), but returns the matching recipe ids, all of them."""
+        ranges = ranges or {}
+        unknown = set(ranges) - set(NUMERIC_FIELDS)
+        if unknown:
+            raise ValueError(f"cannot filter on {', '.join(sorted(unknown))}; fields are {', '.join(NUMERIC_FIELDS)}")
+        bits = self.live
+        for token in ingredient_tokens(include):
+            bits &= self.postings.get(token, 0)
+            if not bits:
+                return []
+        for token in ingredient_tokens(exclude):
+            bits &= ~self.postings.get(token, 0)
+
+        # Narrowest range first; once there are fewer candidates than ids in a
+        # range, checking the candidates is cheaper than building its bitmap
+        candidates = None
+        spans = sorted((stop - start, field, start, stop)
+                       for field, (start, stop) in ((f, self._span(f, *ranges[f])) for f in ranges))
+        for size, field, start, stop in spans:
+            if candidates is None and bits.bit_count() > size:
+                bits &= ids_bitmap(self.ranges[field][1][start:stop])
+                continue
+            if candidates is None:
+                candidates = bitmap_ids(bits)
+            column = NUMERIC_FIELDS.index(field)
+            low, high = ranges[field]
+            low = float("-inf") if low is None else low
+            high = float("inf") if high is None else high
+            docs = self.docs
+            candidates = [doc_id for doc_id in candidates
+                          if (value := docs[doc_id][2][column]) is not None and low <= value <= high]
+        if candidates is None:
+            candidates = bitmap_ids(bits)
+        return candidates
+
+    def values(self, url):
+        """Returns {field: value} of the numeric fields of an indexed recipe, or None."""
+        doc_id = self.by_url.get(url)
+        if doc_id is None:
+            return None
+        return dict(zip(NUMERIC_FIELDS, self.docs[doc_id][2]))
+
+    def summary(self):
+        return {
+            "recipes": len(self),
+            "ingredient_words": len(self.postings),
+            "free_ids": len(self.free),
+            **{field: len(self.ranges[field][0]) for field in NUMERIC_FIELDS},
+        }
+
+    def save(self, path=DEFAULT_INDEX_FILE):
+        """Pickles the index through a temp file so a crash never leaves it half written."""
+        state = {
+            "version": INDEX_VERSION,
+            "fields": NUMERIC_FIELDS,
+            "docs": self.docs,
+            "free": self.free,
+            "postings": self.postings,
+            "ranges": self.ranges,
+        }
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as fp:
+            pickle.dump(state, fp, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path=DEFAULT_INDEX_FILE):
+        """
+        Loads a saved index. An index saved by another version, or with other
+        numeric fields, raises ValueError: rebuild it from the JSON lines files.
+        """
+        with open(path, "rb") as fp:
+            state = pickle.load(fp)
+        if state.get("version") != INDEX_VERSION or tuple(state.get("fields", ())) != NUMERIC_FIELDS:
+            raise ValueError(f"{path} was saved by another version of recipe_index.py; rebuild it")
+        index = cls()
+        index.docs = state["docs"]
+        index.free = state["free"]
+        index.postings = state["postings"]
+        index.ranges = state["ranges"]
+        index.by_url = {doc[0]: doc_id for doc_id, doc in enumerate(index.docs) if doc is not None}
+        index.live = ids_bitmap(list(index.by_url.values()))
+        return index
+
+    @classmethod
+    def open(cls, path=DEFAULT_INDEX_FILE):
+        """Loads the index at path, or returns an empty one if there is none yet."""
+        return cls.load(path) if os.path.exists(path) else cls()
+
+
+# This function parses a --min/--max value such as "protein_g=30".
+def _bound(text):
+    field, sep, value = text.partition("=")
+    if not sep or field not in NUMERIC_FIELDS:
+        raise argparse.ArgumentTypeError(f"expected FIELD=NUMBER with FIELD one of {', '.join(NUMERIC_FIELDS)}")
+    try:
+        return field, float(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"{value!r} is not a number")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Ingredient and macro index for recipe queries.")
+    parser.add_argument("--index", default=DEFAULT_INDEX_FILE, help=f"index file (default: {DEFAULT_INDEX_FILE})")
+    commands = parser.add_subparsers(dest="command", required=True)
+    add = commands.add_parser("add", help="index (or re-index) the records of JSON lines files")
+    add.add_argument("paths", nargs="+")
+    add.add_argument("--rebuild", action="store_true", help="start from an empty index")
+    remove = commands.add_parser("remove", help="drop recipes from the index by url")
+    remove.add_argument("urls", nargs="+")
+    query = commands.add_parser("query", help="recipes matching every filter")
+    query.add_argument("--has", action="append", default=[], metavar="INGREDIENT")
+    query.add_argument("--without", action="append", default=[], metavar="INGREDIENT")
+    query.add_argument("--min", action="append", default=[], type=_bound, metavar="FIELD=N")
+    query.add_argument("--max", action="append", default=[], type=_bound, metavar="FIELD=N")
+    query.add_argument("--limit", type=int, default=20)
+    commands.add_parser("stats", help="index size")
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    index = RecipeIndex() if getattr(args, "rebuild", False) else RecipeIndex.open(args.index)
+    print(f"Loaded {len(index)} recipes in {(time.perf_counter() - start) * 1000:.1f} ms")
+
+    if args.command == "add":
+        for path in args.paths:
+            start = time.perf_counter()
+            changed = index.add_many(read_records(path))
+            print(f"{path}: {changed} recipes added or changed in {time.perf_counter() - start:.2f}s")
+        index.save(args.index)
+    elif args.command == "remove":
+        removed = sum(index.remove(url) for url in args.urls)
+        print(f"Removed {removed} recipes")
+        index.save(args.index)
+    elif args.command == "query":
+        ranges = {}
+        for field, value in args.min:
+            ranges[field] = (value, ranges.get(field, (None, None))[1])
+        for field, value in args.max:
+            ranges[field] = (ranges.get(field, (None, None))[0], value)
+        start = time.perf_counter()
+        ids = index.match(args.has, args.without, ranges)
+        elapsed = (time.perf_counter() - start) * 1000
+        for doc_id in ids[:args.limit]:
+            url, _, values = index.docs[doc_id]
+            shown = dict(zip(NUMERIC_FIELDS, values))
+            details = ", ".join(f"{field}={shown[field]:g}" for field in ranges)
+            print(f"{url}  {details}" if details else url)
+        print(f"{len(ids)} matches in {elapsed:.2f} ms")
+    else:
+        for name, value in index.summary().items():
+            print(f"{name}: {value}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,216 @@
+# Typed values from the free-text recipe fields.
+# The scrapers keep servings, times and nutrition as the text on the page
+# ("4-6", "1 hr 5 mins", "Calories: 213kcal | Protein: 25g | ..."), and
+# HomeWork3.py flattens the nutrition block with get_text(strip=True), so its
+# labels run into the previous value ("...8gProtein:25gFat:9g"). This module
+# turns them into numbers: servings as an int, times in minutes, and one float
+# per macro. Text that cannot be read becomes None (NaN in a frame).
+#   - parse_minutes / parse_servings / parse_nutrition / normalize_record work
+#     on one record.
+#   - normalize_frame works on whole columns with pandas' vectorized string
+#     methods and counts, per field, the values that were present but could not
+#     be parsed. It is the one to use for a full crawl output:
+#         python recipe_normalize.py recipes.jsonl
+
+import json
+import re
+import sys
+import time
+
+try:
+    import pandas as pd
+except ImportError:
+    pd = None
+
+TIME_FIELDS = ("prep_time", "cook_time", "total_time")
+RAW_FIELDS = ("servings",) + TIME_FIELDS + ("nutrition",)
+
+# Output column -> label pattern in the nutrition text. There is no word boundary
+# before a label because flattened text has none; the lookbehinds keep
+# "Saturated Fat" from being read as Fat and "Net Carbs" as Carbohydrates.
+MACROS = (
+    ("calories", r"calories"),
+    ("carbs_g", r"(?<!net )carb(?:ohydrate)?s?"),
+    ("protein_g", r"protein"),
+    ("fat_g", r"(?<!saturated )(?<!trans )fat"),
+    ("saturated_fat_g", r"(?<!un)saturated fat"),
+    ("fiber_g", r"fiber"),
+    ("sugar_g", r"sugars?"),
+    ("sodium_mg", r"sodium"),
+)
+MACRO_COLUMNS = tuple(name for name, _ in MACROS)
+TYPED_COLUMNS = ("servings",) + tuple(field + "_min" for field in TIME_FIELDS) + MACRO_COLUMNS
+
+NUMBER = r"(\d+(?:\.\d+)?)"
+MACRO_RES = tuple((name, re.compile(label + r"\s*:?\s*" + NUMBER, re.IGNORECASE)) for name, label in MACROS)
+ISO_DURATION_RE = re.compile(r"^P(?:(\d+)D)?(?:T(?:(\d+)H)?(?:(\d+)M)?(?:(\d+)S)?)?$", re.IGNORECASE)
+# Units end at the next non-letter rather than a word boundary, so flattened
+# times like "1hr5mins" or "1h30m" read as 65 and 90
+HOURS_RE = re.compile(NUMBER + r"\s*(?:hours?|hrs?|h)(?![a-z])", re.IGNORECASE)
+MINUTES_RE = re.compile(NUMBER + r"\s*(?:minutes?|mins?|m)(?![a-z])", re.IGNORECASE)
+PLAIN_NUMBER_RE = re.compile(r"^\s*" + NUMBER + r"\s*$")
+SERVINGS_RE = re.compile(r"(\d+)")
+
+
+# This function reads a duration ("15", "1 hr 5 mins", "PT1H5M") as whole minutes.
+def parse_minutes(text):
+    if text is None:
+        return None
+    text = str(text).strip()
+    match = PLAIN_NUMBER_RE.match(text)
+    if match:
+        return round(float(match.group(1)))
+    match = ISO_DURATION_RE.match(text)
+    if match and any(match.groups()):
+        days, hours, minutes, seconds = (float(g or 0) for g in match.groups())
+        return round(days * 1440 + hours * 60 + minutes + seconds / 60)
+    hours = HOURS_RE.search(text)
+    minutes = MINUTES_RE.search(text)
+    if not hours and not minutes:
+        return None
+    return round((float(hours.group(1)) * 60 if hours else 0) + (float(minutes.group(1)) if minutes else 0))
+
+
+# This function reads servings ("4", "4-6", "12 sliders") as the first whole number.
+def parse_servings(text):
+    if text is None:
+        return None
+    match = SERVINGS_RE.search(str(text))
+    return int(match.group()) if match else None
+
+
+# This function reads every macro in MACROS out of a nutrition string; missing ones are None.
+def parse_nutrition(text):
+    values = dict.fromkeys(MACRO_COLUMNS)
+    if not text:
+        return values
+    if isinstance(text, (list, tuple)):
+        text = " | ".join(str(t) for t in text)
+    for name, pattern in MACRO_RES:
+        match = pattern.search(text)
+        if match:
+            values[name] = float(match.group(1))
+    return values
+
+
+# This function returns the typed fields of one recipe record:
+# servings, <field>_min for each time field, and one value per macro.
+def normalize_record(record):
+    typed = {"servings": parse_servings(record.get("servings"))}
+    for field in TIME_FIELDS:
+        typed[field + "_min"] = parse_minutes(record.get(field))
+    typed.update(parse_nutrition(record.get("nutrition")))
+    return typed
+
+
+def _require_pandas():
+    if pd is None:
+        raise ImportError("normalize_frame needs pandas (pip install pandas)")
+
+
+def _number(column):
+    # Extracted groups are digits or missing, so a plain cast is enough
+    return column.astype("Float64")
+
+
+# The vectorized path lower-cases each column once and matches these instead of
+# paying for IGNORECASE on every value
+LOWER_MACRO_RES = tuple((name, re.compile(pattern.pattern)) for name, pattern in MACRO_RES)
+LOWER_ISO_DURATION_RE = re.compile(ISO_DURATION_RE.pattern.lower())
+LOWER_HOURS_RE = re.compile(HOURS_RE.pattern)
+LOWER_MINUTES_RE = re.compile(MINUTES_RE.pattern)
+
+
+def _minutes_columns(text):
+    """Vectorized parse_minutes: the first of plain number, ISO 8601, hours and/or minutes that matches."""
+    text = text.str.strip().str.lower()
+    plain = _number(text.str.extract(PLAIN_NUMBER_RE, expand=False))
+    iso = _number(text.str.extract(LOWER_ISO_DURATION_RE))
+    iso_minutes = iso[0].fillna(0) * 1440 + iso[1].fillna(0) * 60 + iso[2].fillna(0) + iso[3].fillna(0) / 60
+    iso_minutes = iso_minutes.where(iso.notna().any(axis=1))
+    hours = _number(text.str.extract(LOWER_HOURS_RE, expand=False))
+    minutes = _number(text.str.extract(LOWER_MINUTES_RE, expand=False))
+    hours_minutes = (hours.fillna(0) * 60 + minutes.fillna(0)).where(hours.notna() | minutes.notna())
+    return pd.DataFrame({"minutes": plain.fillna(iso_minutes).fillna(hours_minutes).round().astype("Int64")})
+
+
+def _servings_columns(text):
+    return pd.DataFrame({"servings": _number(text.str.extract(SERVINGS_RE, expand=False)).astype("Int64")})
+
+
+def _macro_columns(text):
+    text = text.str.lower()
+    return pd.DataFrame({name: _number(text.str.extract(pattern, expand=False)) for name, pattern in LOWER_MACRO_RES})
+
+
+def _by_distinct(column, parse):
+    """Run parse on each distinct value of column once and spread the result back over the rows.
+
+    Crawls repeat the same few time and servings strings thousands of times, so
+    this is usually far less work than parsing every row.
+    """
+    codes, uniques = pd.factorize(column)  # missing values get code -1
+    parsed = parse(pd.Series(uniques, dtype="string"))
+    return pd.DataFrame({name: parsed[name].array.take(codes, allow_fill=True) for name in parsed},
+                        index=column.index)
+
+
+# This function normalizes whole columns at once. `records` is a list of recipe
+# dicts or a DataFrame with (some of) the RAW_FIELDS columns. Returns a frame
+# with the same columns as normalize_record, in the same row order, and a dict
+# of parse-failure counts: values that were present (not empty) but unreadable.
+# For the macros, a failure is a nutrition text that does not mention that macro.
+def normalize_frame(records):
+    _require_pandas()
+    if isinstance(records, pd.DataFrame):
+        raw = records.reindex(columns=list(RAW_FIELDS))
+    else:
+        raw = pd.DataFrame.from_records(records, columns=list(RAW_FIELDS))
+    typed = pd.DataFrame(index=raw.index)
+    failures = {}
+
+    def present(text):
+        return text.notna() & (text.str.strip() != "")
+
+    servings = raw["servings"].astype("string")
+    typed["servings"] = _by_distinct(servings, _servings_columns)["servings"]
+    failures["servings"] = int((present(servings) & typed["servings"].isna()).sum())
+
+    for field in TIME_FIELDS:
+        text = raw[field].astype("string")
+        typed[field + "_min"] = _by_distinct(text, _minutes_columns)["minutes"]
+        failures[field] = int((present(text) & typed[field + "_min"].isna()).sum())
+
+    nutrition = raw["nutrition"].astype("string")
+    has_nutrition = present(nutrition)
+    macros = _by_distinct(nutrition, _macro_columns)
+    for name in MACRO_COLUMNS:
+        typed[name] = macros[name]
+        failures[name] = int((has_nutrition & typed[name].isna()).sum())
+    return typed, failures
+
+
+# This function returns {column: values} for every TYPED_COLUMNS column and the
+# failure counts, using normalize_frame when pandas is installed. Without pandas
+# it falls back to normalize_record row by row and the counts are None.
+def normalize_columns(records):
+    if pd is not None:
+        frame, failures = normalize_frame(records)
+        return {name: frame[name] for name in TYPED_COLUMNS}, failures
+    typed = [normalize_record(r) for r in records]
+    return {name: [t[name] for t in typed] for name in TYPED_COLUMNS}, None
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2:
+        print("usage: python recipe_normalize.py RECIPES.jsonl")
+        sys.exit(2)
+    _require_pandas()
+    with open(sys.argv[1], encoding="utf-8") as fp:
+        rows = [json.loads(line) for line in fp if line.strip()]
+    start = time.perf_counter()
+    frame, counts = normalize_frame(rows)
+    print(f"Normalized {len(frame)} records in {time.perf_counter() - start:.2f}s")
+    for field, count in counts.items():
+        print(f"  {field}: {frame[field if field in frame else field + '_min'].notna().sum()} parsed, "
+              f"{count} unreadable")
@@ -0,0 +1,152 @@
+# Per-host robots.txt registry.
+# robots.txt is fetched and parsed once per host, then kept in memory and on disk
+# for `ttl` seconds, so every script asks the same parsed Protego object whether
+# a URL may be fetched, what the crawl-delay is and where the sitemaps are.
+
+import json
+import os
+import threading
+import time
+from urllib.parse import urlparse
+
+import requests
+from protego import Protego
+
+from fetcher import get_fetcher
+
+DEFAULT_ROBOTS_DIR = ".robots_cache"
+DEFAULT_TTL = 24 * 60 * 60
+
+
+def robots_url_for(url):
+    parsed = urlparse(url)
+    return f"{parsed.scheme}://{parsed.netloc}/robots.txt"
+
+
+class RobotsRegistry:
+    """
+    Caches parsed robots.txt files per host, in memory and as JSON files in `directory`.
+    Hosts whose robots.txt could not be downloaded are treated as allowing everything.
+    """
+
+    def __init__(self, fetcher=None, directory=DEFAULT_ROBOTS_DIR, ttl=DEFAULT_TTL, user_agent="*"):
+        self.fetcher = fetcher or get_fetcher()
+        self.directory = directory
+        self.ttl = ttl
+        self.user_agent = user_agent
+        self._lock = threading.Lock()
+        # netloc -> (fetched_at, robots text, Protego)
+        self._hosts = {}
+        # netloc -> Lock held while that host's robots.txt is loaded
+        self._host_locks = {}
+        os.makedirs(directory, exist_ok=True)
+
+    def _disk_path(self, netloc):
+        return os.path.join(self.directory, netloc.replace(":", "_") + ".json")
+
+    def _load_from_disk(self, netloc):
+        path = self._disk_path(netloc)
+        if not os.path.exists(path):
+            return None
+        with open(path, encoding="utf-8") as fp:
+            data = json.load(fp)
+        if time.time() - data["fetched_at"] > self.ttl:
+            return None
+        return data["fetched_at"], data["text"]
+
+    def _save_to_disk(self, netloc, robots_url, fetched_at, text):
+        path = self._disk_path(netloc)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as fp:
+            json.dump({"url": robots_url, "fetched_at": fetched_at, "text": text}, fp)
+        os.replace(tmp_path, path)
+
+    def _download(self, robots_url):
+        """Returns the robots.txt text, "" when the site has none (4xx), or None on failure."""
+        try:
+            response = self.fetcher.get(robots_url)
+        except requests.RequestException as e:
+            print(f"Error downloading robots.txt: {e}")
+            return None
+        if 400 <= response.status_code < 500:
+            return ""
+        if response.status_code != 200:
+            print(f"Error downloading robots.txt: HTTP {response.status_code}")
+            return None
+        return response.text
+
+    def _fresh_entry(self, netloc):
+        """The in-memory entry for netloc if it is still within the ttl, else None."""
+        with self._lock:
+            entry = self._hosts.get(netloc)
+        if entry and time.time() - entry[0] <= self.ttl:
+            return entry
+        return None
+
+    def _entry(self, url):
+        netloc = urlparse(url).netloc
+        entry = self._fresh_entry(netloc)
+        if entry:
+            return entry
+        with self._lock:
+            host_lock = self._host_locks.setdefault(netloc, threading.Lock())
+        # Only lookups for the same host wait on this download; other hosts go ahead
+        with host_lock:
+            entry = self._fresh_entry(netloc)
+            if entry:
+                return entry
+            cached = self._load_from_disk(netloc)
+            if cached:
+                fetched_at, text = cached
+            else:
+                robots_url = robots_url_for(url)
+                text = self._download(robots_url)
+                if text is None:
+                    return None
+                fetched_at = time.time()
+                self._save_to_disk(netloc, robots_url, fetched_at, text)
+            entry = (fetched_at, text, Protego.parse(text))
+            with self._lock:
+                self._hosts[netloc] = entry
+            return entry
+
+    def get(self, url):
+        """Returns the parsed Protego object for url's host, or None if robots.txt is unavailable."""
+        entry = self._entry(url)
+        return entry[2] if entry else None
+
+    def robots_text(self, url):
+        entry = self._entry(url)
+        return entry[1] if entry else None
+
+    def can_fetch(self, url, user_agent=None):
+        robot_parser = self.get(url)
+        if robot_parser is None:
+            return True
+        return robot_parser.can_fetch(url, user_agent or self.user_agent)
+
+    def crawl_delay(self, url, user_agent=None):
+        """The host's crawl-delay in seconds, or None if it does not set one."""
+        robot_parser = self.get(url)
+        if robot_parser is None:
+            return None
+        return robot_parser.crawl_delay(user_agent or self.user_agent)
+
+    def sitemaps(self, url):
+        robot_parser = self.get(url)
+        if robot_parser is None:
+            return []
+        return list(robot_parser.sitemaps)
+
+
+_default_registry = None
+_default_lock = threading.Lock()
+
+
+def get_robots_registry():
+    """Returns the process-wide RobotsRegistry, creating it on first use."""
+    global _default_registry
+    with _default_lock:
+        if _default_registry is None:
+            _default_registry = RobotsRegistry()
+        return _default_registry
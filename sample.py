@@ -10,6 +10,7 @@
 import requests
 from protego import Protego
 from bs4 import BeautifulSoup
+from fetcher import get_fetcher
 import urllib.robotparser
 
 # This function orchestrates the process:
@@ -60,11 +61,8 @@ def extract_sitemap_index_url(robots_txt):
 
 # This function downloads the robots.txt file from the specified URL and prints its contents.
 def download_robots_txt(url="https://ohsnapmacros.com/robots.txt"):
-    headers = {
-        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/139.0.0.0 Safari/537.36"
-    }
     try:
-        response = requests.get(url, headers=headers)
+        response = get_fetcher().get(url)
         response.raise_for_status()
         print(response.content.decode('utf-8'))
         return response.text
@@ -79,11 +77,8 @@ def download_sitemap_index(sitemap_url):
     """
     Downloads the sitemap.xml (or sitemap index) from the given URL and returns a list of sitemap URLs.
     """
-    headers = {
-        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/139.0.0.0 Safari/537.36"
-    }
     try:
-        response = requests.get(sitemap_url, headers=headers)
+        response = get_fetcher().get(sitemap_url)
         response.raise_for_status()
         soup = BeautifulSoup(response.content, "xml")
         sitemap_tags = soup.find_all("loc")
@@ -100,11 +95,8 @@ def parse_sitemap_locs(sitemap_url):
     """
     Downloads the sitemap at the given URL and returns a list of all <loc> values found.
     """
-    headers = {
-        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/139.0.0.0 Safari/537.36"
-    }
     try:
-        response = requests.get(sitemap_url, headers=headers)
+        response = get_fetcher().get(sitemap_url)
         response.raise_for_status()
         soup = BeautifulSoup(response.content, "xml")        
 
@@ -120,4 +112,5 @@ def parse_sitemap_locs(sitemap_url):
         return []
 
 if __name__ == "__main__":
-    get_sitemap_url_from_robots(target_url="https://ohsnapmacros.com/robots.txt")
\ No newline at end of file
+    get_sitemap_url_from_robots(target_url="https://ohsnapmacros.com/robots.txt")
+    print(get_fetcher().summary())
@@ -1,46 +1,137 @@
 from sys import argv
+import argparse
+import asyncio
 import time
-import requests
+import zlib
 from urllib.parse import urlparse
+from xml.etree.ElementTree import ParseError
+import requests
 from protego import Protego
-from bs4 import BeautifulSoup
+from fetcher import get_fetcher
+from robots_registry import get_robots_registry
+from sitemap_stream import iter_sitemap
+
+# A child sitemap that is missing, not XML, empty or a broken gzip file
+SITEMAP_ERRORS = (requests.RequestException, ParseError, zlib.error)
 
-HEADERS = {}
 def get_robot_parser(base_url:str)-> Protego:
-    global HEADERS
-    user_agent = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/139.0.0.0 Safari/537.36'
-    HEADERS = {'User-Agent': user_agent}
-    response = requests.get(base_url + "/robots.txt", headers=HEADERS)
-    robot_parser = Protego.parse(response.text)
+    robot_parser = get_robots_registry().get(base_url + "/robots.txt")
     return robot_parser
 
+def fetch_sitemap(sitemap):
+    """Downloads one sitemap and returns (is_index, locs).
+
+    parse_sitemaps_async runs this on several threads at once; they share the
+    process-wide Fetcher and its HttpCache, which are both thread-safe.
+    """
+    response = get_fetcher().get(sitemap, stream=True)
+    try:
+        response.raise_for_status()
+        reader = iter_sitemap(response)
+        locs = [loc for loc, lastmod in reader]
+    finally:
+        response.close()
+    if reader.kind == 'sitemapindex':
+        return True, locs
+    if reader.kind == 'urlset':
+        return False, locs
+    return False, []
+
+def fetch_sitemap_or_skip(sitemap):
+    """fetch_sitemap, except that a sitemap that cannot be read is reported and
+    treated as empty, so one bad child does not abort the whole traversal."""
+    try:
+        return fetch_sitemap(sitemap)
+    except SITEMAP_ERRORS as exc:
+        print(f"Skipping sitemap {sitemap}: {exc}")
+        return False, []
+
+def keep_url(item):
+    parsed = urlparse(item)
+    return parsed.netloc.endswith("holtonmountainrentals.com")
+
 def parse_sitemaps(sitemaps, crawl_delay):
     url_list = []
     for sitemap in sitemaps:
         print(f"Waiting for {crawl_delay} seconds")
         print(sitemap)
         time.sleep(crawl_delay)
-        response = requests.get(sitemap, headers=HEADERS)
-        soup = BeautifulSoup(response.text, 'xml')
-
-        if soup.find('sitemapindex'):
-            nested_sitemaps = [tag.text for tag in soup.find_all('loc')]
-            url_list += parse_sitemaps(nested_sitemaps, crawl_delay)
-        elif soup.find('urlset'):
-            urls = [tag.text for tag in soup.find_all('loc')]
-            for item in urls:
-                parsed = urlparse(item)
-                if parsed.netloc.endswith("holtonmountainrentals.com"):
-                    url_list.append(item)
+        is_index, locs = fetch_sitemap_or_skip(sitemap)
+
+        if is_index:
+            url_list += parse_sitemaps(locs, crawl_delay)
+        else:
+            url_list += [item for item in locs if keep_url(item)]
     return url_list
 
 
-def main(domain_name):
+class HostRateLimiter:
+    """Spaces out requests to the same host by at least `delay` seconds.
+
+    Requests to different hosts do not wait on each other, so the crawl-delay
+    from robots.txt is honoured per host instead of with one global sleep.
+    """
+
+    def __init__(self, delay):
+        self.delay = delay
+        self._next_slot = {}
+        self._locks = {}
+
+    async def wait(self, url):
+        host = urlparse(url).netloc
+        lock = self._locks.setdefault(host, asyncio.Lock())
+        async with lock:
+            loop = asyncio.get_running_loop()
+            now = loop.time()
+            slot = self._next_slot.get(host, now)
+            if slot > now:
+                await asyncio.sleep(slot - now)
+                now = slot
+            self._next_slot[host] = now + self.delay
+
+
+async def _walk_sitemap(sitemap, limiter, semaphore):
+    async with semaphore:
+        await limiter.wait(sitemap)
+        print(sitemap)
+        is_index, locs = await asyncio.to_thread(fetch_sitemap_or_skip, sitemap)
+
+    if is_index:
+        nested = await asyncio.gather(*(_walk_sitemap(loc, limiter, semaphore) for loc in locs))
+        return [url for urls in nested for url in urls]
+    return [item for item in locs if keep_url(item)]
+
+
+async def parse_sitemaps_async(sitemaps, crawl_delay, max_concurrency=8):
+    """Async version of parse_sitemaps.
+
+    Child sitemaps are fetched concurrently (at most `max_concurrency` at a
+    time) and the result list is in the same order parse_sitemaps returns.
+    """
+    limiter = HostRateLimiter(crawl_delay)
+    semaphore = asyncio.Semaphore(max_concurrency)
+    results = await asyncio.gather(*(_walk_sitemap(sitemap, limiter, semaphore) for sitemap in sitemaps))
+    return [url for urls in results for url in urls]
+
+
+def main(domain_name, concurrency=None):
     robot_parser = get_robot_parser(domain_name)
+    if robot_parser is None:
+        print("Could not download robots.txt")
+        return
     crawl_delay = robot_parser.crawl_delay('*') or 0
-    urls = parse_sitemaps(robot_parser.sitemaps, crawl_delay)
+    if concurrency:
+        urls = asyncio.run(parse_sitemaps_async(robot_parser.sitemaps, crawl_delay, concurrency))
+    else:
+        urls = parse_sitemaps(robot_parser.sitemaps, crawl_delay)
     print(urls)
     print(len(urls), 'urls')
+    print(get_fetcher().summary())
 
 if __name__ == '__main__':
-    main(argv[1])
+    arg_parser = argparse.ArgumentParser(description="List every page URL found in a site's sitemaps.")
+    arg_parser.add_argument('domain_name')
+    arg_parser.add_argument('--concurrency', type=int, default=None,
+                            help='fetch child sitemaps concurrently, up to this many at a time')
+    args = arg_parser.parse_args(argv[1:])
+    main(args.domain_name, args.concurrency)
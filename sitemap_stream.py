@@ -0,0 +1,98 @@
+# Streaming sitemap reader.
+# Sitemaps are parsed incrementally as the response body arrives, so memory use
+# stays flat no matter how many <url> entries the file has. Gzipped sitemaps
+# (sitemap.xml.gz) are detected by their magic bytes and decompressed on the fly.
+
+import zlib
+import xml.etree.ElementTree as ET
+
+CHUNK_SIZE = 64 * 1024
+GZIP_MAGIC = b'\x1f\x8b'
+
+# Entries are the direct children of the root element.
+ENTRY_TAGS = ('url', 'sitemap')
+
+
+def _local_name(tag):
+    return tag.rsplit('}', 1)[-1]
+
+
+class SitemapReader:
+    """
+    Iterates over a sitemap (or sitemap index) and yields (loc, lastmod) pairs.
+    `chunks` is any iterable of bytes, for example response.iter_content().
+    After the first pair is yielded, `kind` is the root tag name
+    ('urlset' or 'sitemapindex').
+    """
+
+    def __init__(self, chunks):
+        self.chunks = chunks
+        self.kind = None
+
+    @property
+    def is_index(self):
+        return self.kind == 'sitemapindex'
+
+    def __iter__(self):
+        parser = ET.XMLPullParser(events=('start', 'end'))
+        decompressor = None
+        head = b''
+        for chunk in self.chunks:
+            if not chunk:
+                continue
+            if head is not None:
+                # Wait for enough bytes to check for the gzip header
+                head += chunk
+                if len(head) < len(GZIP_MAGIC):
+                    continue
+                if head.startswith(GZIP_MAGIC):
+                    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+                chunk, head = head, None
+            if decompressor:
+                # Inflate in bounded pieces; sitemaps compress very well
+                while chunk:
+                    parser.feed(decompressor.decompress(chunk, CHUNK_SIZE))
+                    chunk = decompressor.unconsumed_tail
+                    yield from self._read_events(parser)
+                continue
+            parser.feed(chunk)
+            yield from self._read_events(parser)
+        if head:
+            parser.feed(head)
+        if decompressor:
+            parser.feed(decompressor.flush())
+        parser.close()
+        yield from self._read_events(parser)
+
+    def _read_events(self, parser):
+        for event, elem in parser.read_events():
+            name = _local_name(elem.tag)
+            if event == 'start':
+                if self.kind is None:
+                    self.kind = name
+                    self._root = elem
+                    self._depth = 0
+                    self._loc = self._lastmod = None
+                self._depth += 1
+                continue
+            depth = self._depth
+            self._depth -= 1
+            # Only <loc>/<lastmod> directly under an entry count; image:loc etc. are skipped
+            if depth == 3 and name == 'loc':
+                self._loc = (elem.text or '').strip()
+            elif depth == 3 and name == 'lastmod':
+                self._lastmod = (elem.text or '').strip() or None
+            elif depth == 2 and name in ENTRY_TAGS:
+                if self._loc:
+                    yield self._loc, self._lastmod
+                self._loc = self._lastmod = None
+                # Drop finished entries so the tree never grows
+                self._root.clear()
+
+
+def iter_sitemap(response):
+    """
+    Returns a SitemapReader over a requests response.
+    The request should be made with stream=True so the body is not loaded up front.
+    """
+    return SitemapReader(response.iter_content(chunk_size=CHUNK_SIZE))
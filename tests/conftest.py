@@ -0,0 +1,75 @@
+import os
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+
+class Site:
+    """A local HTTP server for tests: pages maps a path to (body bytes, headers dict).
+
+    failures maps a path to statuses served (empty) before the page itself.
+    Connections are kept alive (HTTP/1.1), as on a real site.
+    """
+
+    def __init__(self):
+        self.pages = {}
+        self.failures = {}
+        self.hits = []
+        site = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                site.hits.append(self.path)
+                if site.failures.get(self.path):
+                    self.send_response(site.failures[self.path].pop(0))
+                    self.send_header("Retry-After", "0")
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                page = site.pages.get(self.path)
+                if page is None:
+                    self.send_response(404)
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                body, headers = page
+                if headers.get("ETag") and self.headers.get("If-None-Match") == headers["ETag"]:
+                    self.send_response(304)
+                    self.end_headers()
+                    return
+                self.send_response(200)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def add(self, path, body, content_type="text/html; charset=utf-8", **headers):
+        if isinstance(body, str):
+            body = body.encode("utf-8")
+        self.pages[path] = (body, {"Content-Type": content_type, **headers})
+        return self.url + path
+
+
+@pytest.fixture
+def site():
+    server = Site()
+    server.thread.start()
+    yield server
+    server.server.shutdown()
+    server.server.server_close()
@@ -0,0 +1,77 @@
+import json
+
+import pytest
+
+import fetcher
+import HomeWork3
+from crawl_state import CrawlState, content_hash, load_jsonl_records, write_jsonl_records
+
+PAGE = """<html><body><h1>{title}</h1>
+<ul class="wprm-recipe-ingredients"><li>1 cup rice</li></ul>
+</body></html>"""
+
+
+@pytest.fixture
+def uncached_fetcher(monkeypatch):
+    shared = fetcher.Fetcher()
+    monkeypatch.setattr(fetcher, "_default_fetcher", shared)
+    yield shared
+    shared.close()
+
+
+def test_content_hash_ignores_key_order():
+    assert content_hash({"a": 1, "b": [1, 2]}) == content_hash({"b": [1, 2], "a": 1})
+    assert content_hash({"a": 1}) != content_hash({"a": 2})
+
+
+def test_state_round_trip(tmp_path):
+    path = str(tmp_path / "state.json")
+    state = CrawlState(path)
+    assert state.needs_fetch("u", "2024-01-01")
+    assert state.update("u", "2024-01-01", "h1")
+    assert not state.update("u", "2024-01-01", "h1")
+    state.save()
+
+    state = CrawlState(path)
+    assert not state.needs_fetch("u", "2024-01-01")
+    assert state.needs_fetch("u", "2024-02-01")
+    assert state.needs_fetch("u", None)
+
+
+def test_jsonl_records_last_line_wins(tmp_path):
+    path = str(tmp_path / "out.jsonl")
+    write_jsonl_records(path, [{"url": "a", "n": 1}, {"url": "b", "n": 1}, {"url": "a", "n": 2}])
+    assert load_jsonl_records(path) == {"a": {"url": "a", "n": 2}, "b": {"url": "b", "n": 1}}
+    assert load_jsonl_records(str(tmp_path / "missing.jsonl")) == {}
+
+
+def test_jsonl_records_skip_bad_lines(tmp_path):
+    path = tmp_path / "out.jsonl"
+    path.write_text('{"url": "a", "n": 1}\n[1, 2]\n"text"\nnot json\n{"url": "b", "n"', encoding="utf-8")
+    assert load_jsonl_records(str(path)) == {"a": {"url": "a", "n": 1}}
+
+
+def test_incremental_crawl_only_fetches_new_or_changed_pages(site, tmp_path, uncached_fetcher):
+    urls = [site.add(f"/r{i}", PAGE.format(title=f"Recipe {i}")) for i in range(3)]
+    out = str(tmp_path / "out.jsonl")
+    state_file = str(tmp_path / "state.json")
+    entries = [(urls[0], "2024-01-01"), (urls[1], "2024-01-01"), (urls[2], None)]
+
+    HomeWork3.incremental_crawl(entries, out, state_file)
+    assert sorted(site.hits) == ["/r0", "/r1", "/r2"]
+
+    # Unchanged lastmods are skipped; the page without one is fetched every time
+    site.hits.clear()
+    HomeWork3.incremental_crawl(entries, out, state_file)
+    assert site.hits == ["/r2"]
+
+    site.hits.clear()
+    site.add("/r1", PAGE.format(title="Recipe 1, updated"))
+    entries[1] = (urls[1], "2024-03-01")
+    HomeWork3.incremental_crawl(entries, out, state_file)
+    assert sorted(site.hits) == ["/r1", "/r2"]
+
+    with open(out, encoding="utf-8") as fp:
+        records = [json.loads(line) for line in fp]
+    assert [r["url"] for r in records] == urls
+    assert [r["title"] for r in records] == ["Recipe 0", "Recipe 1, updated", "Recipe 2"]
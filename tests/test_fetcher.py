@@ -0,0 +1,45 @@
+import time
+
+from fetcher import Fetcher, HostThrottle
+
+
+def test_connections_are_reused(site):
+    urls = [site.add(f"/p{i}", "x" * 100) for i in range(20)]
+    fetcher = Fetcher()
+    assert [fetcher.get(url).status_code for url in urls] == [200] * 20
+    assert fetcher.connections_opened() == 1
+    host = site.url.split("//", 1)[1]
+    assert fetcher.stats.requests[host] == 20
+    assert fetcher.stats.bytes[host] == 2000
+    assert fetcher.stats.statuses[200] == 20
+    fetcher.close()
+
+
+def test_retries_server_errors(site):
+    url = site.add("/busy", "finally")
+    site.failures["/busy"] = [503, 429]
+    fetcher = Fetcher(backoff_factor=0)
+    response = fetcher.get(url)
+    assert (response.status_code, response.text) == (200, "finally")
+    assert site.hits == ["/busy"] * 3
+    fetcher.close()
+
+
+def test_gives_up_after_the_retries(site):
+    url = site.add("/down", "never")
+    site.failures["/down"] = [500] * 5
+    fetcher = Fetcher(retries=2, backoff_factor=0)
+    assert fetcher.get(url).status_code == 500
+    assert len(site.hits) == 3
+    fetcher.close()
+
+
+def test_host_throttle_spaces_requests():
+    throttle = HostThrottle()
+    throttle.set_delay("https://ohsnapmacros.com/robots.txt", 0.05)
+    start = time.monotonic()
+    for _ in range(3):
+        throttle.wait("https://ohsnapmacros.com/recipe/")
+        throttle.wait("https://other.example/")
+    assert time.monotonic() - start >= 0.1
+    assert "other.example" not in throttle.delays
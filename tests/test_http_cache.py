@@ -0,0 +1,79 @@
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from fetcher import Fetcher
+from http_cache import HttpCache
+
+
+def test_concurrent_fetches_share_one_cache(site, tmp_path):
+    urls = [site.add(f"/page/{i}", f"<html>page {i}</html>", ETag=f'"v{i}"') for i in range(60)]
+    cache = HttpCache(str(tmp_path), save_every=7)
+    fetcher = Fetcher(cache=cache, pool_maxsize=16)
+    with ThreadPoolExecutor(max_workers=16) as pool:
+        bodies = list(pool.map(lambda url: fetcher.get(url).text, urls))
+    fetcher.close()
+
+    assert bodies == [f"<html>page {i}</html>" for i in range(60)]
+    with open(tmp_path / "index.json", encoding="utf-8") as fp:
+        assert sorted(json.load(fp)) == sorted(urls)
+    assert not [name for name in os.listdir(tmp_path) if name.endswith(".tmp")]
+
+
+def test_revalidated_page_is_served_from_disk(site, tmp_path):
+    url = site.add("/recipe", "<html>soup</html>", ETag='"abc"')
+    fetcher = Fetcher(cache=HttpCache(str(tmp_path)))
+    assert fetcher.get(url).text == "<html>soup</html>"
+    response = fetcher.get(url)
+    assert response.status_code == 200
+    assert response.text == "<html>soup</html>"
+    assert (fetcher.cache.hits, fetcher.cache.stores) == (1, 1)
+    fetcher.close()
+
+    reopened = HttpCache(str(tmp_path))
+    assert reopened.conditional_headers(url) == {"If-None-Match": '"abc"'}
+    reopened.close()
+
+
+def test_index_is_written_in_batches(site, tmp_path):
+    cache = HttpCache(str(tmp_path), save_every=3)
+    fetcher = Fetcher(cache=cache)
+    for i in range(2):
+        fetcher.get(site.add(f"/p{i}", "x", ETag=f'"{i}"'))
+    assert not (tmp_path / "index.json").exists()
+    fetcher.get(site.add("/p2", "x", ETag='"2"'))
+    assert (tmp_path / "index.json").exists()
+    fetcher.close()
+
+
+def test_lru_eviction_keeps_the_newest_entry(site, tmp_path):
+    cache = HttpCache(str(tmp_path), max_bytes=10)
+    fetcher = Fetcher(cache=cache)
+    first = site.add("/a", "0123456789", ETag='"a"')
+    second = site.add("/b", "abcdefghij", ETag='"b"')
+    fetcher.get(first)
+    fetcher.get(second)
+    assert list(cache.entries) == [second]
+    assert cache.evictions == 1
+    fetcher.close()
+
+
+def test_entry_evicted_before_the_304_is_fetched_again(site, tmp_path, monkeypatch):
+    url = site.add("/recipe", "<html>soup</html>", ETag='"abc"')
+    cache = HttpCache(str(tmp_path))
+    fetcher = Fetcher(cache=cache)
+    fetcher.get(url)
+    validators = cache.conditional_headers
+
+    def evict_after_validators(url):
+        # Another thread evicts the entry while the conditional GET is in flight
+        headers = validators(url)
+        cache._forget(url)
+        return headers
+
+    monkeypatch.setattr(cache, "conditional_headers", evict_after_validators)
+    response = fetcher.get(url)
+    assert (response.status_code, response.text) == (200, "<html>soup</html>")
+    assert cache.hits == 0
+    assert site.hits == ["/recipe"] * 3
+    fetcher.close()
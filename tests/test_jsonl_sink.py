@@ -0,0 +1,68 @@
+import json
+
+import pytest
+
+from jsonl_sink import JsonlSink
+
+
+def _read(path):
+    with open(path, encoding="utf-8") as fp:
+        return [json.loads(line) for line in fp]
+
+
+def test_records_are_buffered_until_flush_every(tmp_path):
+    path = str(tmp_path / "out.jsonl")
+    sink = JsonlSink(path, flush_every=3, fsync="never")
+    sink.write({"url": "a"})
+    sink.write({"url": "b"})
+    assert (tmp_path / "out.jsonl").read_text() == ""
+    sink.write({"url": "c"})
+    assert [r["url"] for r in _read(path)] == ["a", "b", "c"]
+    sink.write({"url": "d"})
+    sink.close()
+    sink.close()
+    assert sink.written == 4
+    assert len(_read(path)) == 4
+
+
+def test_rerun_skips_urls_already_written(tmp_path):
+    path = str(tmp_path / "out.jsonl")
+    with JsonlSink(path) as sink:
+        assert sink.write({"url": "a", "n": 1})
+        assert not sink.write({"url": "a", "n": 2})
+    with JsonlSink(path) as sink:
+        assert "a" in sink
+        assert not sink.write({"url": "a", "n": 3})
+        assert sink.write({"url": "b", "n": 1})
+        assert sink.skipped == 1
+    assert _read(path) == [{"url": "a", "n": 1}, {"url": "b", "n": 1}]
+
+
+def test_torn_tail_is_truncated(tmp_path):
+    path = tmp_path / "out.jsonl"
+    path.write_text('{"url": "a"}\n{"url": "b"}\n{"url": "c", "ti')
+    with JsonlSink(str(path)) as sink:
+        assert "b" in sink and "c" not in sink
+        sink.write({"url": "c"})
+    assert [r["url"] for r in _read(path)] == ["a", "b", "c"]
+
+
+def test_complete_last_record_without_newline_is_kept(tmp_path):
+    path = tmp_path / "out.jsonl"
+    path.write_text('{"url": "a"}\n{"url": "b"}')
+    with JsonlSink(str(path)) as sink:
+        assert "b" in sink
+        sink.write({"url": "c"})
+    assert path.read_text() == '{"url": "a"}\n{"url": "b"}\n{"url": "c"}\n'
+
+
+def test_bad_line_in_the_middle_is_kept(tmp_path):
+    path = tmp_path / "out.jsonl"
+    path.write_text('{"url": "a"}\nnot json\n{"url": "b"}\n')
+    JsonlSink(str(path)).close()
+    assert path.read_text() == '{"url": "a"}\nnot json\n{"url": "b"}\n'
+
+
+def test_unknown_fsync_policy_is_rejected(tmp_path):
+    with pytest.raises(ValueError):
+        JsonlSink(str(tmp_path / "out.jsonl"), fsync="sometimes")
@@ -0,0 +1,64 @@
+import json
+
+import pytest
+
+import fetcher
+import HomeWork3
+import robots_registry
+from http_cache import HttpCache
+from jsonl_sink import JsonlSink
+
+PAGE = """<html><body><h1>Recipe {i}</h1>
+<div class="wprm-recipe-servings">{i}</div>
+<ul class="wprm-recipe-ingredients"><li>1 cup rice</li><li>{i} eggs</li></ul>
+</body></html>"""
+
+
+@pytest.fixture
+def crawl_env(site, tmp_path, monkeypatch):
+    # The default Fetcher caches to disk, which is what --parallel uses
+    shared = fetcher.Fetcher(cache=HttpCache(str(tmp_path / "cache")), pool_maxsize=16)
+    monkeypatch.setattr(fetcher, "_default_fetcher", shared)
+    monkeypatch.setattr(robots_registry, "_default_registry",
+                        robots_registry.RobotsRegistry(shared, directory=str(tmp_path / "robots")))
+    yield tmp_path
+    shared.close()
+
+
+def _read(path):
+    with open(path, encoding="utf-8") as fp:
+        return [json.loads(line) for line in fp]
+
+
+def test_parallel_crawl_through_the_cache(site, crawl_env):
+    urls = [site.add(f"/r{i}", PAGE.format(i=i), ETag=f'"{i}"') for i in range(60)]
+    out = crawl_env / "out.jsonl"
+    with JsonlSink(str(out), flush_every=10) as sink:
+        HomeWork3.parallel_crawl(urls, sink, io_workers=16, cpu_workers=2)
+    records = _read(out)
+    assert sorted(r["url"] for r in records) == sorted(urls)
+    assert {r["title"] for r in records} == {f"Recipe {i}" for i in range(60)}
+
+
+def test_one_failing_url_is_skipped(site, crawl_env, monkeypatch):
+    urls = [site.add(f"/r{i}", PAGE.format(i=i)) for i in range(5)]
+    missing = site.url + "/gone"
+    broken = site.url + "/broken"
+    fetch_page = HomeWork3.fetch_page
+
+    def flaky_fetch(url):
+        if url == broken:
+            raise RuntimeError("not a network error")
+        return fetch_page(url)
+
+    monkeypatch.setattr(HomeWork3, "fetch_page", flaky_fetch)
+    out = crawl_env / "out.jsonl"
+    with JsonlSink(str(out)) as sink:
+        HomeWork3.parallel_crawl([missing, broken] + urls, sink, io_workers=4, cpu_workers=1)
+    assert sorted(r["url"] for r in _read(out)) == sorted(urls)
+
+
+def test_fetch_page_reports_errors_instead_of_raising(site, crawl_env):
+    kind, url, message = HomeWork3.fetch_page(site.url + "/gone")
+    assert (kind, url) == ("error", site.url + "/gone")
+    assert "404" in message
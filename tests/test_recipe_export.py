@@ -0,0 +1,78 @@
+import gzip
+import json
+
+import pytest
+
+pa = pytest.importorskip("pyarrow")
+
+import recipe_export
+from recipe_export import build_table, export, format_for, load_table, read_records
+
+RECORDS = [
+    {"url": "https://ohsnapmacros.com/a/", "title": "Oat Bars", "author": "Ohsnapmacros",
+     "categories": ["Snacks", "Dessert"], "servings": "12", "prep_time": "10 mins", "cook_time": "1 hr 5 mins",
+     "total_time": "PT1H15M", "ingredients": ["oats", "honey"], "instructions": ["Mix.", "Bake."],
+     "nutrition": "Calories: 150kcal | Protein: 8g | Saturated Fat: 1g | Fat: 4.5g", "ratings": "4.8"},
+    {"url": "https://ohsnapmacros.com/b/", "title": "Costco Haul", "author": "Ohsnapmacros",
+     "categories": "Lifestyle", "servings": None, "ingredients": [], "instructions": [], "ratings": "n/a"},
+]
+
+
+def _write_jsonl(path, lines):
+    opener = gzip.open if str(path).endswith(".gz") else open
+    with opener(path, "wt", encoding="utf-8") as fp:
+        fp.write("\n".join(lines) + "\n")
+    return str(path)
+
+
+def test_read_records_skips_bad_lines_and_reads_gzip(tmp_path):
+    lines = [json.dumps(RECORDS[0]), "not json", "[1, 2]", json.dumps(RECORDS[1])]
+    for name in ("r.jsonl", "r.jsonl.gz"):
+        path = _write_jsonl(tmp_path / name, lines)
+        assert [r["title"] for r in read_records(path)] == ["Oat Bars", "Costco Haul"]
+
+
+def test_format_for():
+    assert format_for("out.ARROW") == "arrow"
+    assert format_for("out.parquet") == "parquet"
+    with pytest.raises(ValueError):
+        format_for("out.csv")
+
+
+def test_build_table_types_the_columns():
+    table, _ = build_table(RECORDS)
+    schema = table.schema
+    assert pa.types.is_dictionary(schema.field("author").type)
+    assert pa.types.is_dictionary(schema.field("categories").type.value_type)
+    assert schema.field("servings").type == pa.int32()
+    assert schema.field("calories").type == pa.float32()
+    row = table.slice(0, 1).to_pylist()[0]
+    assert (row["servings"], row["prep_time_min"], row["cook_time_min"], row["total_time_min"]) == (12, 10, 65, 75)
+    assert (row["calories"], row["protein_g"], row["fat_g"], row["saturated_fat_g"]) == (150, 8, 4.5, 1)
+    assert row["categories"] == ["Snacks", "Dessert"]
+    row = table.slice(1, 1).to_pylist()[0]
+    assert (row["servings"], row["calories"], row["ratings"]) == (None, None, None)
+    assert row["categories"] == ["Lifestyle"]
+
+
+@pytest.mark.parametrize("name, compression", [("out.arrow", None), ("out.arrow", "zstd"),
+                                               ("out.parquet", None), ("out.parquet", "zstd")])
+def test_export_round_trip(tmp_path, name, compression):
+    src = _write_jsonl(tmp_path / "recipes.jsonl", [json.dumps(r) for r in RECORDS])
+    dst = str(tmp_path / name)
+    table, _ = export(src, dst, compression=compression)
+    loaded = load_table(dst)
+    assert loaded.num_rows == 2
+    assert loaded.column("title").to_pylist() == ["Oat Bars", "Costco Haul"]
+    assert loaded.column("categories").to_pylist() == [["Snacks", "Dessert"], ["Lifestyle"]]
+    assert load_table(dst, ["calories", "url"]).column_names == ["calories", "url"]
+    assert not (tmp_path / (name + ".tmp")).exists()
+
+
+def test_main_writes_and_shows(tmp_path, capsys):
+    src = _write_jsonl(tmp_path / "recipes.jsonl", [json.dumps(r) for r in RECORDS])
+    dst = str(tmp_path / "out.arrow")
+    assert recipe_export.main([src, dst]) == 0
+    assert "Wrote 2 recipes" in capsys.readouterr().out
+    assert recipe_export.main(["--show", dst, "calories"]) == 0
+    assert "2 rows, 1 columns" in capsys.readouterr().out
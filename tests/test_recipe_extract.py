@@ -0,0 +1,90 @@
+import glob
+import os
+
+import pytest
+
+from recipe_extract import FIELDS, check_parity, compare_extractors, get_extractor
+
+PAGES_DIR = os.path.join(os.path.dirname(__file__), "fixtures", "pages")
+PAGES = sorted(glob.glob(os.path.join(PAGES_DIR, "*.html")))
+# html.parser, the reference, nests the unclosed <li> items of this page
+MALFORMED = os.path.join(PAGES_DIR, "malformed.html")
+WELL_FORMED = [path for path in PAGES if path != MALFORMED]
+
+
+def _read(name):
+    with open(os.path.join(PAGES_DIR, name), "rb") as fp:
+        return fp.read()
+
+
+@pytest.mark.parametrize("path", WELL_FORMED, ids=os.path.basename)
+def test_extractors_agree(path):
+    with open(path, "rb") as fp:
+        html = fp.read()
+    assert compare_extractors(html) == []
+    assert compare_extractors(html.decode("utf-8")) == []
+    assert get_extractor("bs4").extract(html) == get_extractor("lxml").extract(html)
+
+
+def test_full_recipe_fields():
+    recipe = get_extractor("lxml").extract(_read("full_recipe.html"))
+    assert set(recipe) == set(FIELDS)
+    assert recipe["title"] == "Chicken Pesto Sliders Recipe"
+    assert recipe["servings"] == "12"
+    assert recipe["prep_time"] == "10mins"
+    assert recipe["cook_time"] == "15mins"
+    assert recipe["ingredients"] == ["▢12packSavory Buttery Rolls(King's Hawaiian)", "8slicesDeli Chicken",
+                                     "1cupfresh basil"]
+    assert recipe["instructions"][-1] == "Bake for15 minutes."
+    assert recipe["notes"] == ["Use any rolls you like.", "Leftovers keep for 3 days."]
+    assert recipe["nutrition"] == "Calories:213kcal|Carbohydrates:21g|Protein:14g|Fat:8g"
+
+
+def test_malformed_page_closes_list_items():
+    html = _read("malformed.html")
+    recipe = get_extractor("lxml").extract(html)
+    assert recipe["ingredients"] == ["1 cup cottage cheese", "1/2 cup berries", "2 tbsp honey & honey"]
+    assert recipe["instructions"] == ["Mix everything.", "Servecold."]
+    assert recipe["notes"] == ["Stray item outside a list"]
+    # The reference keeps html.parser's nesting, and the parity check says so
+    reference = get_extractor("bs4").extract(html)
+    assert reference["ingredients"][0] == "1 cup cottage cheese1/2 cup berries2 tbsp honey & honey"
+    assert compare_extractors(html) == ["ingredients", "instructions"]
+
+
+@pytest.mark.parametrize("charset", ["windows-1252", "iso-8859-15", "utf-8"])
+def test_declared_charset_is_honoured(charset):
+    html = (f'<html><head><meta charset="{charset}"></head><body><h1>Crème brûlée</h1>'
+            '<ul class="wprm-recipe-ingredients"><li>1 cup crème fraîche</li></ul></body></html>').encode(charset)
+    recipe = get_extractor("lxml").extract(html)
+    assert recipe["title"] == "Crème brûlée"
+    assert recipe["ingredients"] == ["1 cup crème fraîche"]
+    assert compare_extractors(html) == []
+
+
+def test_undeclared_utf8_is_decoded():
+    html = "<h1>Jalapeño poppers</h1>".encode("utf-8")
+    assert get_extractor("lxml").extract(html)["title"] == "Jalapeño poppers"
+    assert compare_extractors(html) == []
+
+
+def test_notes_text_without_list_items():
+    recipe = get_extractor("lxml").extract(_read("notes_without_list.html"))
+    assert recipe["notes"] == ["Rest the batter for5 minutesbefore cooking."]
+    assert recipe["title"] == "ProteinPancakes"
+
+
+def test_page_without_recipe_card():
+    recipe = get_extractor("lxml").extract(_read("no_recipe_card.html"))
+    assert recipe["title"] == "All Recipes"
+    assert recipe["ingredients"] == recipe["instructions"] == recipe["notes"] == []
+    assert recipe["servings"] is None and recipe["nutrition"] is None
+
+
+def test_check_parity_counts_mismatches(capsys):
+    assert check_parity(WELL_FORMED) == 0
+    assert f"{len(WELL_FORMED)}/{len(WELL_FORMED)} pages identical" in capsys.readouterr().out
+    assert check_parity(PAGES) == 1
+    out = capsys.readouterr().out
+    assert f"MISMATCH {MALFORMED}: ingredients, instructions" in out
+    assert f"{len(PAGES) - 1}/{len(PAGES)} pages identical" in out
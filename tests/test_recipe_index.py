@@ -0,0 +1,128 @@
+import json
+import pickle
+import random
+
+import pytest
+
+import recipe_index
+from recipe_index import NUMERIC_FIELDS, RecipeIndex, bitmap_ids, ids_bitmap, ingredient_tokens, numeric_values
+
+FOODS = ["chicken", "rice", "beef", "tomatoes", "berries", "oats", "eggs", "spinach", "cheese", "beans"]
+
+
+def _recipe(i, ingredients, protein=None, total=None, prep=None, cook=None):
+    nutrition = f"Calories: 300kcal | Protein: {protein}g" if protein is not None else None
+    return {"url": f"https://ohsnapmacros.com/r{i}/", "ingredients": ingredients, "nutrition": nutrition,
+            "total_time": total, "prep_time": prep, "cook_time": cook}
+
+
+def _random_recipes(count, seed=7):
+    rng = random.Random(seed)
+    return [_recipe(i, [f"1 cup {food}" for food in rng.sample(FOODS, 3)],
+                    protein=rng.choice([None, rng.randint(5, 60)]), total=f"{rng.randint(5, 90)} mins")
+            for i in range(count)]
+
+
+def _brute_force(records, include, exclude, ranges):
+    matches = []
+    for record in records:
+        tokens = ingredient_tokens(record["ingredients"])
+        if not ingredient_tokens(include) <= tokens or ingredient_tokens(exclude) & tokens:
+            continue
+        values = dict(zip(NUMERIC_FIELDS, numeric_values(record)))
+        if all(values[f] is not None and (lo is None or values[f] >= lo) and (hi is None or values[f] <= hi)
+               for f, (lo, hi) in ranges.items()):
+            matches.append(record["url"])
+    return matches
+
+
+def test_ingredient_tokens_split_scraped_lines():
+    assert ingredient_tokens("▢8slicesDeli Chicken") == {"deli", "chicken"}
+    assert ingredient_tokens(["2 cups diced Tomatoes", "1/2 cup BBQSauce"]) == {"tomato", "bbq", "sauce"}
+    assert ingredient_tokens(["1 cup fresh berries", "3 boxes"]) == {"berry"}
+    assert ingredient_tokens(None) == set()
+
+
+@pytest.mark.parametrize("ids", [[], [0], [3, 64, 65, 1000], list(range(0, 300, 2)), [5, 9000]])
+def test_bitmap_round_trip(ids):
+    assert bitmap_ids(ids_bitmap(ids)) == ids
+
+
+def test_query_matches_a_brute_force_scan():
+    records = _random_recipes(400)
+    index = RecipeIndex()
+    assert index.add_many(records) == 400
+    queries = [
+        (["chicken", "rice"], [], {}),
+        (["chicken"], ["beans"], {"protein_g": (30, None)}),
+        ([], ["tomato"], {"protein_g": (20, 40), "total_time_min": (None, 30)}),
+        (["berry"], [], {"total_time_min": (10, 20)}),
+        (["lobster"], [], {}),
+    ]
+    for include, exclude, ranges in queries:
+        assert index.query(include, exclude, ranges) == _brute_force(records, include, exclude, ranges)
+    assert len(index.query(["chicken"], limit=5)) == 5
+
+
+def test_total_time_falls_back_to_prep_plus_cook():
+    index = RecipeIndex()
+    index.add(_recipe(0, ["rice"], prep="10 mins", cook="1 hr"))
+    assert index.values("https://ohsnapmacros.com/r0/")["total_time_min"] == 70
+    assert index.values("https://ohsnapmacros.com/missing/") is None
+
+
+def test_replace_and_remove_keep_postings_and_ranges_in_sync():
+    index = RecipeIndex()
+    index.add_many([_recipe(0, ["chicken"], protein=40), _recipe(1, ["rice"], protein=10)])
+    assert not index.add(_recipe(0, ["chicken"], protein=40))
+    assert index.add(_recipe(0, ["beef"], protein=20))
+    assert index.query(["chicken"]) == []
+    assert index.query(["beef"], ranges={"protein_g": (15, 25)}) == ["https://ohsnapmacros.com/r0/"]
+    assert index.query(ranges={"protein_g": (30, None)}) == []
+
+    assert index.remove("https://ohsnapmacros.com/r1/")
+    assert not index.remove("https://ohsnapmacros.com/r1/")
+    assert "rice" not in index.postings
+    assert index.add(_recipe(2, ["oats"], protein=12))
+    # The removed recipe's id is reused
+    assert index.by_url["https://ohsnapmacros.com/r2/"] == 1
+    assert index.query(ranges={"protein_g": (None, None)}) == [
+        "https://ohsnapmacros.com/r0/", "https://ohsnapmacros.com/r2/"]
+    with pytest.raises(ValueError):
+        index.query(ranges={"fiber": (1, None)})
+
+
+def test_save_and_load(tmp_path):
+    path = str(tmp_path / "recipes.idx")
+    index = RecipeIndex()
+    index.add_many(_random_recipes(50))
+    index.remove("https://ohsnapmacros.com/r3/")
+    index.save(path)
+    loaded = RecipeIndex.load(path)
+    assert len(loaded) == 49
+    assert loaded.query(["chicken"], ranges={"protein_g": (20, None)}) == \
+        index.query(["chicken"], ranges={"protein_g": (20, None)})
+    assert RecipeIndex.open(str(tmp_path / "missing.idx")).summary()["recipes"] == 0
+
+    with open(path, "wb") as fp:
+        pickle.dump({"version": recipe_index.INDEX_VERSION + 1}, fp)
+    with pytest.raises(ValueError):
+        RecipeIndex.load(path)
+
+
+def test_cli_add_query_and_remove(tmp_path, capsys):
+    src = tmp_path / "recipes.jsonl"
+    records = [_recipe(0, ["chicken", "rice"], protein=35, total="25 mins"),
+               _recipe(1, ["chicken"], protein=10, total="25 mins")]
+    src.write_text("".join(json.dumps(r) + "\n" for r in records))
+    idx = str(tmp_path / "recipes.idx")
+    assert recipe_index.main(["--index", idx, "add", str(src)]) == 0
+    capsys.readouterr()
+    assert recipe_index.main(["--index", idx, "query", "--has", "chicken", "--min", "protein_g=30",
+                              "--max", "total_time_min=30"]) == 0
+    out = capsys.readouterr().out
+    assert "r0/" in out and "r1/" not in out and "1 matches" in out
+    assert recipe_index.main(["--index", idx, "remove", "https://ohsnapmacros.com/r0/"]) == 0
+    assert len(RecipeIndex.load(idx)) == 1
+    with pytest.raises(SystemExit):
+        recipe_index.main(["--index", idx, "query", "--min", "fiber=3"])
@@ -0,0 +1,60 @@
+import pytest
+
+import recipe_normalize
+from recipe_normalize import normalize_frame, normalize_record, parse_minutes, parse_nutrition, parse_servings
+
+TIMES = [
+    ("15", 15),
+    ("1 hr 5 mins", 65),
+    ("1hr5mins", 65),
+    ("1h30m", 90),
+    ("1h 30m", 90),
+    ("2 Hours", 120),
+    ("1 hour 30 minutes", 90),
+    ("45m", 45),
+    ("10mins", 10),
+    ("PT1H5M", 65),
+    ("P1DT2H", 1560),
+    ("5 mints", None),
+    ("overnight", None),
+    ("", None),
+    (None, None),
+]
+
+
+@pytest.mark.parametrize("text, minutes", TIMES)
+def test_parse_minutes(text, minutes):
+    assert parse_minutes(text) == minutes
+
+
+def test_parse_servings():
+    assert [parse_servings(t) for t in ("4", "4-6", "12 sliders", "a few", None)] == [4, 4, 12, None, None]
+
+
+def test_parse_nutrition_reads_flattened_labels():
+    values = parse_nutrition("Calories:213kcalCarbohydrates:21gNet Carbs:18gProtein:14gFat:8gSaturated Fat:2gSugar:5g")
+    assert values["calories"] == 213
+    assert values["carbs_g"] == 21
+    assert values["protein_g"] == 14
+    assert values["fat_g"] == 8
+    assert values["saturated_fat_g"] == 2
+    assert values["sugar_g"] == 5
+    assert values["fiber_g"] is None
+
+
+def test_frame_matches_the_scalar_parser():
+    pd = pytest.importorskip("pandas")
+    records = [
+        {"servings": str(i % 7) if i % 5 else "serves many", "prep_time": text, "cook_time": text,
+         "total_time": None, "nutrition": "Calories: %d | Protein: 1%dg" % (i, i % 10)}
+        for i, (text, _) in enumerate(TIMES)
+    ]
+    typed, failures = normalize_frame(records)
+    for i, record in enumerate(records):
+        expected = normalize_record(record)
+        row = typed.iloc[i]
+        for column in recipe_normalize.TYPED_COLUMNS:
+            assert (None if pd.isna(row[column]) else row[column]) == expected[column]
+    # "5 mints" and "overnight"; empty and missing times are not failures
+    assert failures["prep_time"] == 2
+    assert failures["total_time"] == 0
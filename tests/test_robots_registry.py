@@ -0,0 +1,93 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+import pytest
+
+from fetcher import Fetcher
+from robots_registry import RobotsRegistry
+
+ROBOTS = """User-agent: *
+Disallow: /wp-admin/
+Crawl-delay: 2
+Sitemap: https://ohsnapmacros.com/sitemap_index.xml
+"""
+
+
+@pytest.fixture
+def client():
+    fetcher = Fetcher(backoff_factor=0)
+    yield fetcher
+    fetcher.close()
+
+
+def test_robots_is_fetched_once_per_host(site, client, tmp_path):
+    site.add("/robots.txt", ROBOTS, "text/plain")
+    registry = RobotsRegistry(client, directory=str(tmp_path))
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        allowed = list(pool.map(registry.can_fetch, [site.url + f"/r{i}/" for i in range(40)]))
+    assert all(allowed)
+    assert not registry.can_fetch(site.url + "/wp-admin/options.php")
+    assert registry.crawl_delay(site.url) == 2
+    assert registry.sitemaps(site.url) == ["https://ohsnapmacros.com/sitemap_index.xml"]
+    assert site.hits == ["/robots.txt"]
+
+
+def test_disk_copy_is_used_until_the_ttl_expires(site, client, tmp_path):
+    site.add("/robots.txt", ROBOTS, "text/plain")
+    RobotsRegistry(client, directory=str(tmp_path)).get(site.url)
+    assert RobotsRegistry(client, directory=str(tmp_path)).robots_text(site.url) == ROBOTS
+    assert len(site.hits) == 1
+
+    expired = RobotsRegistry(client, directory=str(tmp_path), ttl=-1)
+    assert expired.crawl_delay(site.url) == 2
+    assert len(site.hits) == 2
+
+
+def test_missing_robots_allows_everything(site, client, tmp_path):
+    registry = RobotsRegistry(client, directory=str(tmp_path))
+    assert registry.can_fetch(site.url + "/anything")
+    assert registry.robots_text(site.url) == ""
+    assert registry.sitemaps(site.url) == []
+
+
+def test_server_error_is_not_cached(site, client, tmp_path):
+    site.add("/robots.txt", ROBOTS, "text/plain")
+    site.failures["/robots.txt"] = [500] * 4
+    registry = RobotsRegistry(client, directory=str(tmp_path))
+    # One lookup fails after the fetcher's 3 retries
+    assert registry.get(site.url) is None
+    assert len(site.hits) == 4
+    # The next lookup tries again and gets the file
+    assert not registry.can_fetch(site.url + "/wp-admin/")
+    assert registry.crawl_delay(site.url) == 2
+
+
+class SlowFetcher:
+    """Blocks robots.txt downloads for one host until `release` is set."""
+
+    def __init__(self, slow_host):
+        self.slow_host = slow_host
+        self.release = threading.Event()
+        self.started = threading.Event()
+        self.calls = []
+
+    def get(self, url):
+        self.calls.append(url)
+        if self.slow_host in url:
+            self.started.set()
+            self.release.wait(5)
+        return SimpleNamespace(status_code=200, text=ROBOTS)
+
+
+def test_slow_host_does_not_block_other_hosts(tmp_path):
+    fetcher = SlowFetcher("slow.example")
+    registry = RobotsRegistry(fetcher, directory=str(tmp_path))
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        slow = [pool.submit(registry.crawl_delay, "https://slow.example/r/") for _ in range(3)]
+        assert fetcher.started.wait(5)
+        # Answered while the slow host's download is still in flight
+        assert pool.submit(registry.crawl_delay, "https://fast.example/r/").result(timeout=2) == 2
+        fetcher.release.set()
+        assert [f.result() for f in slow] == [2, 2, 2]
+    assert sorted(fetcher.calls) == ["https://fast.example/robots.txt", "https://slow.example/robots.txt"]
@@ -0,0 +1,69 @@
+import asyncio
+
+import pytest
+
+import fetcher
+import sitemap_parser
+from http_cache import HttpCache
+
+SITE = "https://www.holtonmountainrentals.com"
+
+
+def _urlset(locs):
+    entries = "".join(f"<url><loc>{loc}</loc></url>" for loc in locs)
+    return f'<?xml version="1.0"?><urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">{entries}</urlset>'
+
+
+def _index(locs):
+    entries = "".join(f"<sitemap><loc>{loc}</loc></sitemap>" for loc in locs)
+    return f'<?xml version="1.0"?><sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">{entries}</sitemapindex>'
+
+
+@pytest.fixture
+def sitemaps(site, tmp_path, monkeypatch):
+    """A sitemap index pointing at 12 child sitemaps, fetched through a cache in tmp_path."""
+    children = []
+    for i in range(12):
+        locs = [f"{SITE}/rental/{i}-{j}/" for j in range(5)] + [f"https://other.example/{i}/"]
+        children.append(site.add(f"/sitemap-{i}.xml", _urlset(locs), "application/xml", ETag=f'"s{i}"'))
+    index = site.add("/sitemap_index.xml", _index(children), "application/xml", ETag='"index"')
+    shared = fetcher.Fetcher(cache=HttpCache(str(tmp_path)), pool_maxsize=16)
+    monkeypatch.setattr(fetcher, "_default_fetcher", shared)
+    yield [index]
+    shared.close()
+
+
+def test_async_traversal_matches_sequential(sitemaps):
+    expected = [f"{SITE}/rental/{i}-{j}/" for i in range(12) for j in range(5)]
+    assert sitemap_parser.parse_sitemaps(sitemaps, 0) == expected
+    # The second pass is answered with 304s from the shared cache, from several threads at once
+    assert asyncio.run(sitemap_parser.parse_sitemaps_async(sitemaps, 0, max_concurrency=8)) == expected
+    assert fetcher.get_fetcher().cache.hits == 13
+
+
+def test_host_rate_limiter_spaces_requests():
+    async def run():
+        limiter = sitemap_parser.HostRateLimiter(0.05)
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        await asyncio.gather(*(limiter.wait(f"{SITE}/{i}") for i in range(3)))
+        await limiter.wait("https://other.example/")
+        return loop.time() - start
+
+    elapsed = asyncio.run(run())
+    assert 0.1 <= elapsed < 0.5
+
+
+@pytest.mark.parametrize("broken", ["missing", "html", "empty"])
+def test_unreadable_child_sitemaps_are_skipped(sitemaps, site, broken):
+    children = [f"{site.url}/sitemap-{i}.xml" for i in range(12)]
+    if broken == "missing":
+        children[3] = f"{site.url}/sitemap-gone.xml"
+    elif broken == "html":
+        site.add("/sitemap-3.xml", "<html><body><p>Not found<br></body></html>", "text/html")
+    else:
+        site.add("/sitemap-3.xml", "", "application/xml")
+    index = site.add("/sitemap_index.xml", _index(children), "application/xml")
+    expected = [f"{SITE}/rental/{i}-{j}/" for i in range(12) if i != 3 for j in range(5)]
+    assert sitemap_parser.parse_sitemaps([index], 0) == expected
+    assert asyncio.run(sitemap_parser.parse_sitemaps_async([index], 0, max_concurrency=8)) == expected
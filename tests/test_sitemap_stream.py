@@ -0,0 +1,56 @@
+import gzip
+
+import pytest
+
+from sitemap_stream import SitemapReader
+
+URLSET = (
+    b'<?xml version="1.0" encoding="UTF-8"?>'
+    b'<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9"'
+    b' xmlns:image="http://www.google.com/schemas/sitemap-image/1.1">'
+    b'<url><loc>https://ohsnapmacros.com/a/</loc><lastmod>2024-01-02</lastmod>'
+    b'<image:image><image:loc>https://ohsnapmacros.com/a.jpg</image:loc></image:image></url>'
+    b'<url><loc> https://ohsnapmacros.com/b/ </loc></url>'
+    b'<url><lastmod>2024-01-03</lastmod></url>'
+    b'</urlset>'
+)
+INDEX = (
+    b'<sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">'
+    b'<sitemap><loc>https://ohsnapmacros.com/post-sitemap.xml</loc><lastmod>2024-02-01</lastmod></sitemap>'
+    b'</sitemapindex>'
+)
+EXPECTED = [("https://ohsnapmacros.com/a/", "2024-01-02"), ("https://ohsnapmacros.com/b/", None)]
+
+
+def _chunks(data, size):
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+@pytest.mark.parametrize("size", [1, 7, 64, 100000])
+def test_urlset_in_any_chunking(size):
+    reader = SitemapReader(_chunks(URLSET, size))
+    assert list(reader) == EXPECTED
+    assert reader.kind == "urlset"
+    assert not reader.is_index
+
+
+@pytest.mark.parametrize("size", [1, 5, 100000])
+def test_gzipped_sitemap_is_detected_and_inflated(size):
+    assert list(SitemapReader(_chunks(gzip.compress(URLSET), size))) == EXPECTED
+
+
+def test_sitemap_index():
+    reader = SitemapReader([INDEX])
+    assert list(reader) == [("https://ohsnapmacros.com/post-sitemap.xml", "2024-02-01")]
+    assert reader.is_index
+
+
+def test_entries_are_released_while_reading():
+    entries = b"".join(b"<url><loc>https://ohsnapmacros.com/r%d/</loc></url>" % i for i in range(5000))
+    reader = SitemapReader(_chunks(b"<urlset>" + entries + b"</urlset>", 4096))
+    largest = count = 0
+    for count, _ in enumerate(reader, 1):
+        largest = max(largest, len(reader._root))
+    assert count == 5000
+    # At most one chunk's worth of entries is held, however long the sitemap is
+    assert largest < 4096 // 40
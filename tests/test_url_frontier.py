@@ -0,0 +1,59 @@
+import pytest
+
+import Client
+import fetcher
+from url_frontier import BloomFilter, UrlFrontier, is_sitemap_url
+
+XML = "application/xml"
+
+
+@pytest.fixture
+def uncached_fetcher(monkeypatch):
+    shared = fetcher.Fetcher()
+    monkeypatch.setattr(fetcher, "_default_fetcher", shared)
+    yield shared
+    shared.close()
+
+
+def test_is_sitemap_url():
+    assert is_sitemap_url("https://ohsnapmacros.com/post-sitemap.xml")
+    assert is_sitemap_url("https://ohsnapmacros.com/sitemap.xml.gz")
+    assert is_sitemap_url("https://ohsnapmacros.com/sitemap")
+    assert not is_sitemap_url("https://ohsnapmacros.com/protein-pancakes/")
+
+
+def test_frontier_skips_seen_deep_and_over_limit_urls():
+    frontier = UrlFrontier(max_depth=1, max_urls=3)
+    assert frontier.add("a")
+    assert not frontier.add("a")
+    assert frontier.add("b", depth=1)
+    assert not frontier.add("c", depth=2)
+    assert frontier.add("d")
+    assert not frontier.add("e")
+    assert [frontier.pop() for _ in range(len(frontier))] == [("a", 0), ("b", 1), ("d", 0)]
+    assert frontier.summary().startswith("queued=3,")
+    assert (frontier.counters["skipped_seen"], frontier.counters["skipped_depth"],
+            frontier.counters["skipped_limit"]) == (1, 1, 1)
+
+
+def test_bloom_filter_has_no_false_negatives_and_few_false_positives():
+    bloom = BloomFilter(10000, error_rate=0.01)
+    for i in range(10000):
+        bloom.add(f"https://ohsnapmacros.com/r{i}/")
+    assert all(f"https://ohsnapmacros.com/r{i}/" in bloom for i in range(10000))
+    false_positives = sum(f"https://ohsnapmacros.com/other{i}/" in bloom for i in range(10000))
+    assert false_positives < 300
+
+
+@pytest.mark.parametrize("bloom_capacity", [None, 1000])
+def test_parse_sitemaps_follows_each_sitemap_once(site, uncached_fetcher, bloom_capacity):
+    index = site.url + "/sitemap_index.xml"
+    posts = site.url + "/post-sitemap.xml"
+    pages = [site.url + f"/r{i}/" for i in range(3)]
+    site.add("/sitemap_index.xml", "<sitemapindex>" + "".join(
+        f"<sitemap><loc>{loc}</loc></sitemap>" for loc in (posts, posts, index)) + "</sitemapindex>", XML)
+    site.add("/post-sitemap.xml", "<urlset>" + "".join(
+        f"<url><loc>{loc}</loc></url>" for loc in pages + pages[:1]) + "</urlset>", XML)
+
+    assert Client.parse_sitemaps([index], crawl_delay=0, bloom_capacity=bloom_capacity) == pages
+    assert sorted(site.hits) == ["/post-sitemap.xml", "/sitemap_index.xml"]
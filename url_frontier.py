@@ -0,0 +1,83 @@
+# URL frontier for sitemap discovery.
+# Keeps a FIFO queue of (url, depth) with a seen-set so nothing is queued twice,
+# stops at a maximum depth and a maximum number of URLs, and counts what it
+# accepted and skipped. For very large crawls the seen-set can be a Bloom filter,
+# which uses a fixed amount of memory at the cost of rare false "already seen".
+
+import hashlib
+import math
+from collections import Counter, deque
+from urllib.parse import urlparse
+
+
+# This function decides from the URL alone whether it points at a sitemap
+# (which we download and expand) or at a content page (which we only collect).
+def is_sitemap_url(url):
+    path = urlparse(url).path.lower()
+    return path.endswith((".xml", ".xml.gz")) or "sitemap" in path.rsplit("/", 1)[-1]
+
+
+class BloomFilter:
+    """
+    A fixed-size set of strings that may report false positives but never false negatives.
+    Sized for `capacity` items at the given false-positive rate.
+    """
+
+    def __init__(self, capacity, error_rate=0.001):
+        self.size = max(8, int(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.hash_count = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray(self.size // 8 + 1)
+
+    def _positions(self, item):
+        digest = hashlib.blake2b(item.encode("utf-8"), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        for i in range(self.hash_count):
+            yield (h1 + i * h2) % self.size
+
+    def add(self, item):
+        for pos in self._positions(item):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+
+    def __contains__(self, item):
+        return all(self.bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(item))
+
+
+class UrlFrontier:
+    """
+    Breadth-first queue of URLs to visit.
+    Pass bloom_capacity to use a BloomFilter instead of an exact set for the seen-set.
+    """
+
+    def __init__(self, max_depth=5, max_urls=100000, bloom_capacity=None):
+        self.max_depth = max_depth
+        self.max_urls = max_urls
+        self.seen = BloomFilter(bloom_capacity) if bloom_capacity else set()
+        self.queue = deque()
+        self.counters = Counter()
+
+    def add(self, url, depth=0):
+        """Queues url unless it was seen before or breaks a limit. Returns True if queued."""
+        if url in self.seen:
+            self.counters["skipped_seen"] += 1
+            return False
+        if depth > self.max_depth:
+            self.counters["skipped_depth"] += 1
+            return False
+        if self.counters["queued"] >= self.max_urls:
+            self.counters["skipped_limit"] += 1
+            return False
+        self.seen.add(url)
+        self.queue.append((url, depth))
+        self.counters["queued"] += 1
+        return True
+
+    def pop(self):
+        return self.queue.popleft()
+
+    def __len__(self):
+        return len(self.queue)
+
+    def summary(self):
+        names = ("queued", "fetched", "pages", "errors", "skipped_seen", "skipped_depth", "skipped_limit")
+        return ", ".join(f"{name}={self.counters[name]}" for name in names)